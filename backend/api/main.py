@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import mysql.connector
@@ -12,6 +12,43 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional
 from fastapi import HTTPException
 from datetime import datetime, timedelta
+import asyncio
+import base64
+import bisect
+import contextvars
+import csv
+import functools
+import hashlib
+import io
+import json
+import math
+import re
+import secrets
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow, photos are served without resized variants
+    Image = ImageOps = None
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+from fastapi import Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 
 # Load environment variables
 load_dotenv()
@@ -21,18 +58,9 @@ app = FastAPI()
 # Password context for hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Get allowed origins from environment variable
+# Get allowed origins from environment variable (CORSMiddleware is added after the Idempotency section)
 origins = os.getenv('ALLOWED_ORIGINS', '*').split(',')
 
-# CORS middleware to handle cross-origin requests
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # MySQL database configuration using environment variables
 DB_CONFIG = {
     'user': os.getenv('MYSQL_USER'),
@@ -40,8 +68,22 @@ DB_CONFIG = {
     'host': os.getenv('MYSQL_HOST'),
     'database': os.getenv('MYSQL_DATABASE'),
     'port': int(os.getenv('MYSQL_PORT', 3306)),  # Default MySQL port if not set
+    'connection_timeout': int(os.getenv('MYSQL_CONNECT_TIMEOUT', 5)),  # Seconds to establish a connection
 }
 
+# Socket read/write timeouts (seconds), only passed to connector versions that support them
+DB_CONFIG.update({
+    option: int(os.getenv(variable, default))
+    for option, variable, default in (
+        ('read_timeout', 'MYSQL_READ_TIMEOUT', 30),
+        ('write_timeout', 'MYSQL_WRITE_TIMEOUT', 30),
+    )
+    if option in mysql.connector.constants.DEFAULT_CONFIGURATION
+})
+
+# Server-side limit for SELECTs issued by read endpoints (see time_limited)
+READ_QUERY_TIMEOUT_MS = int(os.getenv('MYSQL_READ_QUERY_TIMEOUT_MS', 5000))
+
 # SSL configuration
 ssl_config = None
 ssl_ca_path = os.getenv('MYSQL_SSL_CA_PATH')
@@ -59,18 +101,180 @@ if missing_vars:
     raise Exception(f"Missing environment variables: {', '.join(missing_vars)}")
 
 
+class CircuitBreaker:
+    """
+    Fails fast while the database is unhealthy. Closed: everything goes through, and
+    `failure_threshold` transient failures within `window` seconds open the breaker. Open: calls are
+    rejected for `reset_timeout` seconds. Half-open: up to `trial_calls` requests probe the database;
+    a successful probe closes the breaker again, a failed one reopens it.
+    """
+
+    def __init__(self, failure_threshold, window, reset_timeout, trial_calls):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.trial_calls = trial_calls
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = deque()
+        self.opened_at = 0.0
+        self.trials = 0
+        self.rejected = 0
+        self.opened = 0
+        self.timeouts = 0
+
+    def allow(self):
+        # Returns "closed" or "trial" when the call may proceed, None when it must fail fast
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self.trials = 0
+            if self.state == "closed":
+                return "closed"
+            if self.state == "half-open" and self.trials < self.trial_calls:
+                self.trials += 1
+                return "trial"
+            self.rejected += 1
+            return None
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "closed"
+                self.failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half-open":
+                self._open(now)
+                return
+            self.failures.append(now)
+            while self.failures and now - self.failures[0] > self.window:
+                self.failures.popleft()
+            if self.state == "closed" and len(self.failures) >= self.failure_threshold:
+                self._open(now)
+
+    def record_timeout(self):
+        # A statement hitting MAX_EXECUTION_TIME is usually one slow query, not an unhealthy server
+        with self._lock:
+            self.timeouts += 1
+
+    def _open(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.opened += 1
+        self.failures.clear()
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_failures": len(self.failures),
+                "times_opened": self.opened,
+                "rejected": self.rejected,
+                "query_timeouts": self.timeouts,
+            }
+
+
+db_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('DB_BREAKER_FAILURES', 5)),
+    window=float(os.getenv('DB_BREAKER_WINDOW_SECONDS', 10)),
+    reset_timeout=float(os.getenv('DB_BREAKER_RESET_SECONDS', 15)),
+    trial_calls=int(os.getenv('DB_BREAKER_TRIAL_CALLS', 1)),
+)
+# Same settings for the read replica (see Replica Routing); while it is open, replica reads go to the primary
+replica_breaker = CircuitBreaker(
+    failure_threshold=db_breaker.failure_threshold,
+    window=db_breaker.window,
+    reset_timeout=db_breaker.reset_timeout,
+    trial_calls=db_breaker.trial_calls,
+)
+
+# Errors that mean the database itself is unreachable or overloaded (as opposed to a bad query):
+# too many connections, shutdown in progress, can't connect, unknown host, server gone away,
+# lost connection
+TRANSIENT_DB_ERRNOS = {1040, 1053, 2003, 2005, 2006, 2013, 2055}
+# Statement aborted by MAX_EXECUTION_TIME; counted apart from the failures that trip the breaker
+QUERY_TIMEOUT_ERRNO = 3024
+
+
+def database_error(err):
+    # HTTPException for a failed query; transient errors count against the circuit breaker and become 503s
+    if err.errno == QUERY_TIMEOUT_ERRNO:
+        db_breaker.record_timeout()
+        return HTTPException(status_code=503, detail="Database query timed out", headers={"Retry-After": "1"})
+    if err.errno in TRANSIENT_DB_ERRNOS:
+        db_breaker.record_failure()
+        return HTTPException(status_code=503, detail=f"Database unavailable: {err}",
+                             headers={"Retry-After": str(db_breaker.retry_after)})
+    return HTTPException(status_code=500, detail=f"Database error: {err}")
+
+
+def time_limited(query: str, timeout_ms: int = READ_QUERY_TIMEOUT_MS) -> str:
+    # Add a MAX_EXECUTION_TIME optimizer hint to a SELECT so MySQL aborts it past the limit (error 3024)
+    return re.sub(r"^\s*SELECT\b", f"SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */", query, count=1, flags=re.I)
+
+
+def open_connection(config):
+    return mysql.connector.connect(
+        **config,
+        ssl_ca=ssl_config.get('ssl_ca', None) if ssl_config else None,
+        ssl_verify_cert=ssl_config.get('ssl_verify_cert', False) if ssl_config else False,
+        ssl_disabled=ssl_config.get('ssl_disabled', False) if ssl_config else False
+    )
+
+
+def connect_through_breaker(config, breaker, permit):
+    # Opens a connection on a breaker's permit; a half-open probe closes the breaker only if the server answers
+    connection = None
+    try:
+        connection = open_connection(config)
+        if permit == "trial":
+            cursor = connection.cursor()
+            cursor.execute(time_limited("SELECT 1", 1000))
+            cursor.fetchall()
+            cursor.close()
+            breaker.record_success()
+        return connection
+    except mysql.connector.Error:
+        if connection is not None:
+            connection.close()
+        breaker.record_failure()
+        raise
+
+
 # Create a function to get the database connection
 def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            **DB_CONFIG,
-            ssl_ca=ssl_config.get('ssl_ca', None) if ssl_config else None,
-            ssl_verify_cert=ssl_config.get('ssl_verify_cert', False) if ssl_config else False,
-            ssl_disabled=ssl_config.get('ssl_disabled', False) if ssl_config else False
+    # Reads routed to the replica (see Replica Routing) fall back to the primary below if it can't be reached
+    if db_route.get() == "replica" and replica_monitor.usable():
+        permit = replica_breaker.allow()
+        if permit is not None:
+            try:
+                return connect_through_breaker(REPLICA_CONFIG, replica_breaker, permit)
+            except mysql.connector.Error as err:
+                replica_monitor.mark_down(err)
+
+    permit = db_breaker.allow()
+    if permit is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Database temporarily unavailable",
+            headers={"Retry-After": str(db_breaker.retry_after)},
         )
-        return connection
+
+    try:
+        return connect_through_breaker(DB_CONFIG, db_breaker, permit)
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {err}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Database connection failed: {err}",
+            headers={"Retry-After": str(db_breaker.retry_after)},
+        )
 
 
 # Models for User Registration and Login
@@ -127,21 +331,1103 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# Sparse fieldsets: turn ?fields=a,b,c into a SELECT list using a per-endpoint whitelist
+# that maps each public field name to the column expression that produces it.
+def select_fields(fields: Optional[str], whitelist: dict, required: tuple = ()) -> str:
+    return ", ".join(whitelist[name] for name in requested_fields(fields, whitelist, required))
+
+
+def requested_fields(fields: Optional[str], whitelist: dict, required: tuple = ()) -> list:
+    # The validated field names behind select_fields, for endpoints that build rows themselves
+    if fields is None:
+        names = list(whitelist)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        if not names:
+            raise HTTPException(status_code=400, detail="fields must list at least one field")
+
+        unknown = [name for name in names if name not in whitelist]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(whitelist)}"
+            )
+
+    # Keep the requested order, drop duplicates and add the fields the endpoint itself relies on
+    return list(dict.fromkeys(names + list(required)))
+
+
+def uses_alias(select_list: str, alias: str) -> bool:
+    # Whether a SELECT list reads from the given table alias (used to skip unneeded joins)
+    return re.search(rf"\b{alias}\.", select_list) is not None
+
+
+""" ************************************** Query Cache ************************************************ """
+
+
+class QueryCache:
+    """
+    In-process LRU cache with a TTL per entry and tag-based invalidation.
+    Entries are tagged with the rows they depend on (e.g. user:{id}, ad:{id}) so write endpoints
+    can drop exactly the affected results after they commit.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._keys_by_tag = defaultdict(set)
+        self._tag_versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def tag_versions(self, tags):
+        # Snapshot taken before running a query; set() refuses the result if a tag was invalidated meanwhile
+        with self._lock:
+            return tuple(self._tag_versions[tag] for tag in tags)
+
+    def set(self, key, value, tags, versions=None, ttl_seconds=None):
+        with self._lock:
+            if versions is not None and versions != tuple(self._tag_versions[tag] for tag in tags):
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            expires_at = time.monotonic() + (ttl_seconds or self.ttl_seconds)
+            self._entries[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] += 1
+                for key in list(self._keys_by_tag.pop(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+query_cache = QueryCache(
+    max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 10000)),
+    ttl_seconds=float(os.getenv('QUERY_CACHE_TTL_SECONDS', 30)),
+)
+
+
+# A cached error response. Hits raise a fresh HTTPException from it, so no exception object (and its
+# growing traceback) is shared between requests.
+CachedError = namedtuple("CachedError", ("status_code", "detail"))
+
+
+def cached(name: str, tags):
+    """
+    Read-through caching for an endpoint. The key is the logical query name plus the call's
+    parameters; `tags` maps those parameters to the cache tags the result depends on.
+    404 responses are cached as well, since "not found" checks are among the hottest reads.
+    Plain def endpoints still run in the threadpool on a miss.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            key = (name, tuple(sorted(kwargs.items())))
+            found, value = query_cache.get(key)
+            if found:
+                if isinstance(value, CachedError):
+                    raise HTTPException(status_code=value.status_code, detail=value.detail)
+                return value
+
+            entry_tags = tags(**kwargs)
+            versions = query_cache.tag_versions(entry_tags)
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    value = await func(**kwargs)
+                else:
+                    value = await run_in_threadpool(func, **kwargs)
+            except HTTPException as exc:
+                if exc.status_code == 404:
+                    query_cache.set(key, CachedError(exc.status_code, exc.detail), entry_tags, versions)
+                raise
+
+            query_cache.set(key, value, entry_tags, versions)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return query_cache.stats()
+
+
+@app.get("/breaker/stats")
+def get_breaker_stats():
+    return db_breaker.stats()
+
+
+""" ************************************** Admission Control ************************************************ """
+
+
+class AdmissionClass:
+    """
+    Concurrency limit for one class of routes with a bounded FIFO wait queue. A request over the
+    limit waits up to max_wait seconds for a slot; when the queue is full or the wait runs out it
+    is shed with a 503 instead of piling more work onto MySQL.
+    """
+
+    def __init__(self, name, concurrency, queue_size, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def retry_after(self):
+        return max(1, math.ceil(self.max_wait))
+
+    async def acquire(self):
+        # Runs on the event loop only, so the counters need no lock
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        finally:
+            self.wait_seconds += time.monotonic() - started
+
+        if future.done():
+            self.admitted += 1
+            return True
+        self._abandon(future)
+        self.shed_timeout += 1
+        return False
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter, if any
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _abandon(self, future):
+        if future.done() and not future.cancelled():
+            # The slot was handed over just as the waiter gave up: pass it on
+            self.release()
+        else:
+            future.cancel()
+            self.waiters.remove(future)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 3) if self.queued else 0.0,
+        }
+
+
+def admission_class(name, concurrency, queue_size, max_wait):
+    # Defaults can be overridden per class, e.g. ADMISSION_EXPENSIVE_CONCURRENCY=8
+    prefix = f"ADMISSION_{name.upper()}_"
+    return AdmissionClass(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        queue_size=int(os.getenv(prefix + "QUEUE_SIZE", queue_size)),
+        max_wait=float(os.getenv(prefix + "MAX_WAIT_SECONDS", max_wait)),
+    )
+
+
+# expensive: full-catalog reads, multi-join history and admin scans; write: everything that changes
+# data; cheap: single-row reads such as balance and offer checks, which must keep flowing;
+# export: /admin/export streams, which hold their slot for the whole download; upload: photo uploads,
+# which hold theirs for as long as the client takes to send the files
+admission_classes = {
+    "export": admission_class("export", concurrency=2, queue_size=4, max_wait=1.0),
+    "upload": admission_class("upload", concurrency=4, queue_size=8, max_wait=1.0),
+    "expensive": admission_class("expensive", concurrency=4, queue_size=20, max_wait=2.0),
+    "write": admission_class("write", concurrency=8, queue_size=50, max_wait=3.0),
+    "cheap": admission_class("cheap", concurrency=32, queue_size=200, max_wait=1.0),
+}
+
+UPLOAD_ROUTES = re.compile(r"^/vehicle/\d+/photos$")
+EXPENSIVE_ROUTES = re.compile(
+    r"^/(user/\d+/(other-ads|wishlist)$|user_transactions/|admin/|listings|premium-vehicles$|vehicle/\d+/similar$)"
+)
+# Monitoring and health probes are never queued or shed
+ADMISSION_EXEMPT_PATHS = {
+    "/admission/stats", "/cache/stats", "/breaker/stats", "/health/live", "/health/ready", "/dbCheck",
+    "/replica/stats", "/idempotency/stats", "/counters/stats",
+    # Sub-requests are admitted one by one, so the batch itself must not hold a slot while they queue
+    "/batch",
+}
+
+
+def route_class(method, path):
+    if path.startswith("/admin/export/"):
+        return "export"
+    if method == "POST" and UPLOAD_ROUTES.match(path):
+        return "upload"
+    if EXPENSIVE_ROUTES.match(path):
+        return "expensive"
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write"
+    return "cheap"
+
+
+class AdmissionControlMiddleware:
+    # Plain ASGI middleware so the slot is held until the response body has been sent
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ADMISSION_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        admission = admission_classes[route_class(scope["method"], scope["path"])]
+        if not await admission.acquire():
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": f"Server busy ({admission.name} requests), please retry"},
+                headers={"Retry-After": str(admission.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
+
+
+@app.get("/admission/stats")
+def get_admission_stats():
+    return {name: admission.stats() for name, admission in admission_classes.items()}
+
+
+""" ************************************** Health Backend ************************************************ """
+
+HEALTH_CACHE_SECONDS = float(os.getenv('HEALTH_CACHE_SECONDS', 2))
+STATS_REFRESH_SECONDS = float(os.getenv('STATS_REFRESH_SECONDS', 60))
+
+
+class ReadinessProbe:
+    """
+    Readiness = the circuit breaker is not open and MySQL answers a trivial round trip. The result,
+    good or bad, is reused for HEALTH_CACHE_SECONDS and only one caller probes at a time, so an
+    orchestrator polling every replica costs at most one SELECT 1 per interval.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.result = None
+        self.checked_at = 0.0
+
+    def check(self):
+        with self._lock:
+            if self.result is None or time.monotonic() - self.checked_at >= self.ttl:
+                self.result = self._probe()
+                self.checked_at = time.monotonic()
+            return self.result
+
+    def _probe(self):
+        if db_breaker.stats()["state"] == "open":
+            return {"ready": False, "database": "circuit breaker open"}
+
+        started = time.perf_counter()
+        try:
+            # Always the primary: a GET is routed to the replica, whose health says nothing about writes
+            connection = open_connection(DB_CONFIG)
+            try:
+                cursor = connection.cursor()
+                cursor.execute(time_limited("SELECT 1", 1000))
+                cursor.fetchall()
+                cursor.close()
+            finally:
+                connection.close()
+        except mysql.connector.Error as err:
+            if err.errno in TRANSIENT_DB_ERRNOS:
+                db_breaker.record_failure()
+            return {"ready": False, "database": f"round trip failed: {err}"}
+
+        return {"ready": True, "database": "ok", "round_trip_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+
+readiness_probe = ReadinessProbe(HEALTH_CACHE_SECONDS)
+
+
+class StatsCache:
+    # Aggregate numbers that are too expensive to compute per request, refreshed by a background thread
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.values = None
+        self.refreshed_at = None
+        self._thread = None
+
+    def get(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stats-cache", daemon=True)
+                self._thread.start()
+        if self.values is None:
+            self.refresh()
+        return self.values, self.refreshed_at
+
+    def refresh(self):
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM user")
+            user_count = cursor.fetchone()[0]
+            cursor.close()
+        finally:
+            connection.close()
+        self.values = {"user_count": user_count}
+        self.refreshed_at = datetime.now()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as err:
+                print(f"Stats refresh failed: {err}")
+
+
+stats_cache = StatsCache(STATS_REFRESH_SECONDS)
+
+
+@app.get("/health/live")
+def liveness():
+    # The process is up and serving requests; deliberately does not touch the database
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness():
+    result = readiness_probe.check()
+    if not result["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not ready", **result})
+    return {"status": "ready", **result}
+
+
 # Check backend and database connectivity
 @app.get("/dbCheck")
 def db_check():
+    # The user count comes from the stats cache, so this no longer scans the user table per call
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT COUNT(*) FROM user;")
-        user_count = cursor.fetchone()[0]
-        cursor.close()
-        connection.close()
-        return {"message": "Backend Works Successfully", "Users in Database": user_count}
+        stats, refreshed_at = stats_cache.get()
+        return {
+            "message": "Backend Works Successfully",
+            "Users in Database": stats["user_count"],
+            "stats_refreshed_at": refreshed_at,
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
 
+""" ************************************** Replica Routing ************************************************ """
+
+# Optional read replica. Without MYSQL_REPLICA_HOST every query goes to the primary as before.
+REPLICA_CONFIG = {
+    **DB_CONFIG,
+    'host': os.getenv('MYSQL_REPLICA_HOST'),
+    'port': int(os.getenv('MYSQL_REPLICA_PORT', DB_CONFIG['port'])),
+    'user': os.getenv('MYSQL_REPLICA_USER', DB_CONFIG['user']),
+    'password': os.getenv('MYSQL_REPLICA_PASSWORD', DB_CONFIG['password']),
+}
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 2))
+REPLICA_CHECK_SECONDS = float(os.getenv('REPLICA_CHECK_SECONDS', 1))
+# How long a user's reads stay on the primary after one of their writes
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+# "primary" or "replica" for the current request; background jobs keep the default
+db_route = contextvars.ContextVar("db_route", default="primary")
+
+
+class ReplicaMonitor:
+    """
+    Decides whether the replica may serve reads: its replication lag is polled in the background,
+    and reads go to the primary while the lag is unknown, above REPLICA_MAX_LAG_SECONDS, not
+    measured recently, or for a while after a failed replica connection.
+    """
+
+    def __init__(self, config, max_lag, interval):
+        self.config = config
+        self.max_lag = max_lag
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.lag = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.last_error = None
+
+    @property
+    def configured(self):
+        return bool(self.config['host'])
+
+    def usable(self):
+        if not self.configured:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+                self._thread.start()
+        now = time.monotonic()
+        return (
+            self.lag is not None and self.lag <= self.max_lag
+            and now - self.checked_at <= 3 * self.interval
+            and now >= self.down_until
+        )
+
+    def mark_down(self, err):
+        self.down_until = time.monotonic() + 5 * self.interval
+        self.last_error = str(err)
+
+    def check(self):
+        connection = open_connection(self.config)
+        try:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        # No status row means the target is not replicating; a NULL lag means replication is stopped
+        status = rows[0] if rows else {}
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        self.lag = float(lag) if lag is not None else None
+        self.checked_at = time.monotonic()
+        self.last_error = None if rows else "not replicating"
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as err:
+                self.lag = None
+                self.last_error = str(err)
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "configured": self.configured,
+            "usable": self.usable(),
+            "lag_seconds": self.lag,
+            "last_error": self.last_error,
+        }
+
+
+replica_monitor = ReplicaMonitor(REPLICA_CONFIG, REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_SECONDS)
+
+
+class StickyUsers:
+    # Users whose reads go to the primary until their recent writes have surely reached the replica
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self.until = {}
+
+    def mark(self, user_ids):
+        expires = time.monotonic() + self.window
+        with self._lock:
+            for user_id in user_ids:
+                self.until[user_id] = expires
+            if len(self.until) > 10000:
+                now = time.monotonic()
+                self.until = {user_id: until for user_id, until in self.until.items() if until > now}
+
+    def any_sticky(self, user_ids):
+        now = time.monotonic()
+        with self._lock:
+            return any(self.until.get(user_id, 0) > now for user_id in user_ids)
+
+
+sticky_users = StickyUsers(READ_YOUR_WRITES_SECONDS)
+
+# The path parameter that identifies the acting user: {user_id}, or {offer_owner} (the buyer) in /create_offer
+USER_PATH = re.compile(
+    r"^/(?:user/profile|user|create_offer|check_offer|user_transactions|user_reviews|admin/users)/(\d+)(?:/|$)"
+)
+# Set on every successful write so the browser's next reads stick to the primary, also for routes
+# without a user in the path
+READ_YOUR_WRITES_COOKIE = "primary_reads"
+# Reads that guard a write (duplicate checks, balances) always see the primary
+PRIMARY_ONLY_ROUTES = re.compile(r"^/(check_existing_transaction|check_offer)/|^/user/\d+/balance$")
+# POSTs that only read: a /batch carries GETs, and each one is routed on its own as a sub-request
+READ_ONLY_POST_PATHS = {"/batch"}
+route_counts = defaultdict(int)
+route_counts_lock = threading.Lock()
+
+
+def count_route(name):
+    with route_counts_lock:
+        route_counts[name] += 1
+
+
+def request_user_ids(scope):
+    # User ID from the path plus an optional X-User-ID header
+    user_ids = set()
+    match = USER_PATH.match(scope["path"])
+    if match:
+        user_ids.add(match.group(1))
+    for name, value in scope.get("headers", []):
+        if name == b"x-user-id":
+            user_ids.add(value.decode("latin-1").strip())
+    return user_ids
+
+
+def has_read_your_writes_cookie(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"cookie" and f"{READ_YOUR_WRITES_COOKIE}=".encode() in value:
+            return True
+    return False
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET requests read from the replica, everything else except READ_ONLY_POST_PATHS uses the primary
+    (a batch is passed through untouched; its sub-requests are routed one by one). After a successful write
+    its users are sticky to the primary for READ_YOUR_WRITES_SECONDS so they see their own changes,
+    and so is the browser that sent it, through the READ_YOUR_WRITES_COOKIE set on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_monitor.configured:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "POST" and scope["path"] in READ_ONLY_POST_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        user_ids = request_user_ids(scope)
+        if scope["method"] == "GET":
+            use_replica = (
+                not PRIMARY_ONLY_ROUTES.match(scope["path"])
+                and not has_read_your_writes_cookie(scope)
+                and not sticky_users.any_sticky(user_ids)
+            )
+            route = "replica" if use_replica else "primary"
+            count_route(f"reads_{route}")
+            token = db_route.set(route)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                db_route.reset(token)
+            return
+
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if 200 <= message["status"] < 300:
+                    cookie = (
+                        f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; Path=/; "
+                        "HttpOnly; SameSite=Lax"
+                    )
+                    message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        count_route("writes")
+        await self.app(scope, receive, send_wrapper)
+        if user_ids and 200 <= status.get("code", 500) < 300:
+            sticky_users.mark(user_ids)
+
+
+@app.get("/replica/stats")
+def get_replica_stats():
+    with route_counts_lock:
+        routed = dict(route_counts)
+    return {
+        **replica_monitor.stats(),
+        "breaker": replica_breaker.stats(),
+        "routed": routed,
+        "sticky_users": len(sticky_users.until),
+    }
+
+
+""" ************************************** Batch Requests ************************************************ """
+
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 100))
+# Sub-requests of one batch in flight at once, which also bounds the DB connections it holds. /batch
+# itself is exempt from admission control, so this stays at or below the concurrency of the classes
+# its sub-requests are admitted under: one batch can then never fill a class and its queue on its own.
+BATCH_CONCURRENCY = min(
+    int(os.getenv('BATCH_CONCURRENCY', 4)),
+    admission_classes["expensive"].concurrency,
+    admission_classes["cheap"].concurrency,
+)
+# Request headers passed on to every sub-request; the cookie carries read-your-writes (see Replica Routing)
+BATCH_FORWARDED_HEADERS = {b"authorization", b"x-user-id", b"cookie"}
+# GET routes a batch may call: per-user and per-item JSON reads. Exports, photos, the change feed,
+# admin and stats endpoints stream, return binaries or are too heavy to be fanned out here.
+BATCH_ROUTES = re.compile(r"""
+    ^/(
+        user/profile/\d+
+        | user/\d+/(balance|ads|vehicles|other-ads|counters|offers|wishlist(/\d+)?)
+        | premium-vehicles
+        | ad/\d+/(owner|offers)
+        | check_offer/\d+/\d+
+        | check_existing_transaction/\d+
+        | user_transactions/\d+
+        | user_reviews/\d+
+        | vehicle/\d+/(price-estimate|similar)
+        | listings(/facets)?
+    )$
+""", re.X)
+
+
+class BatchSubRequest(BaseModel):
+    path: str  # e.g. "/check_offer/12/34" or "/listings?make=Ford&limit=10"
+    id: Optional[str] = None  # echoed back so the client can match results
+
+
+class BatchRequest(BaseModel):
+    requests: list[BatchSubRequest]
+
+
+async def dispatch_subrequest(outer_scope, path):
+    # Runs one GET through the full app (admission, replica routing, caching) and captures its response
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": outer_scope.get("asgi", {"version": "3.0"}),
+        "http_version": outer_scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": outer_scope.get("scheme", "http"),
+        "server": outer_scope.get("server"),
+        "client": outer_scope.get("client"),
+        "root_path": outer_scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(name, value) for name, value in outer_scope["headers"] if name in BATCH_FORWARDED_HEADERS],
+        "state": dict(outer_scope.get("state", {})),
+    }
+    status = 500
+    content_type = b""
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception as err:
+        # The error middleware has already sent a 500 and re-raises for the server to log
+        return 500, {"detail": f"Sub-request failed: {type(err).__name__}"}
+
+    raw = b"".join(body)
+    if not raw:
+        return status, None
+    if not content_type.startswith(b"application/json"):
+        return 502, {"detail": "Sub-request did not return JSON"}
+    try:
+        return status, json.loads(raw)
+    except ValueError:
+        return 502, {"detail": "Sub-request returned invalid JSON"}
+
+
+@app.post("/batch")
+async def run_batch(batch: BatchRequest, request: Request):
+    # Collapses a page's per-item reads (check_offer, wishlist checks, ...) into one round trip
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_REQUESTS} requests")
+    for sub in batch.requests:
+        if not BATCH_ROUTES.match(sub.path.partition("?")[0]):
+            raise HTTPException(status_code=400, detail=f"Path not allowed in a batch: {sub.path}")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(sub):
+        async with semaphore:
+            status, content = await dispatch_subrequest(request.scope, sub.path)
+        return {"id": sub.id, "path": sub.path, "status": status, "body": content}
+
+    responses = await asyncio.gather(*(run_one(sub) for sub in batch.requests))
+    return {"responses": responses}
+
+
+""" ************************************** Idempotency ************************************************ """
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_RETENTION_HOURS = int(os.getenv('IDEMPOTENCY_RETENTION_HOURS', 24))
+# An in-progress claim older than this belongs to a request that died and may be taken over
+IDEMPOTENCY_CLAIM_SECONDS = int(os.getenv('IDEMPOTENCY_CLAIM_SECONDS', 60))
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """
+    Recent Idempotency-Key responses. The idempotency_key table is the source of truth, shared by
+    every process; a bounded LRU in front of it answers the usual immediate retry without a query.
+    A key is claimed (row with no status yet) before the write runs, so a retry that overlaps
+    the original gets a 409 instead of executing the write a second time.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.claims = 0
+        self.replayed = 0
+
+    def _remember(self, key, record):
+        with self._lock:
+            self.entries[key] = record
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def lookup(self, key):
+        # (request_hash, status_code, body, content_type) of a finished request, or None
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                SELECT request_hash, status_code, response_body, content_type
+                FROM idempotency_key
+                WHERE idempotency_key = %s AND status_code IS NOT NULL
+            """, (key,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            connection.close()
+
+        if row is None:
+            return None
+        record = (row[0], row[1], row[2].encode() if row[2] is not None else b"", row[3])
+        self._remember(key, record)
+        return record
+
+    def claim(self, key, request_hash):
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute(
+                    "INSERT INTO idempotency_key (idempotency_key, request_hash) VALUES (%s, %s)",
+                    (key, request_hash),
+                )
+                claimed = True
+            except mysql.connector.IntegrityError:
+                cursor.execute(f"""
+                    UPDATE idempotency_key
+                    SET request_hash = %s, created_at = CURRENT_TIMESTAMP
+                    WHERE idempotency_key = %s AND status_code IS NULL
+                      AND created_at < NOW() - INTERVAL {IDEMPOTENCY_CLAIM_SECONDS} SECOND
+                """, (request_hash, key))
+                claimed = cursor.rowcount == 1
+
+            with self._lock:
+                self.claims += 1
+                trim = self.claims % 500 == 0
+            if trim:
+                # Expired keys are trimmed a batch at a time as new ones come in
+                cursor.execute(f"""
+                    DELETE FROM idempotency_key
+                    WHERE created_at < NOW() - INTERVAL {IDEMPOTENCY_RETENTION_HOURS} HOUR
+                    LIMIT 1000
+                """)
+            connection.commit()
+            return claimed
+        finally:
+            cursor.close()
+            connection.close()
+
+    def complete(self, key, record):
+        request_hash, status_code, body, content_type = record
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                UPDATE idempotency_key
+                SET status_code = %s, response_body = %s, content_type = %s
+                WHERE idempotency_key = %s
+            """, (status_code, body.decode("utf-8", "replace"), content_type, key))
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+        self._remember(key, record)
+
+    def release(self, key):
+        # Server errors are not stored: the claim is dropped so the client's retry runs again
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM idempotency_key WHERE idempotency_key = %s AND status_code IS NULL", (key,)
+            )
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def record_replay(self):
+        with self._lock:
+            self.replayed += 1
+
+    def stats(self):
+        return {"cached_keys": len(self.entries), "claims": self.claims, "replayed": self.replayed}
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE)
+
+
+def scoped_idempotency_key(scope, key):
+    # Client keys are only unique per caller, so the stored key also covers method, path and who is
+    # calling: the Authorization header, else the user in the path or X-User-ID, else the client address
+    caller = next((value for name, value in scope["headers"] if name == b"authorization"), None)
+    if caller is None:
+        user_ids = sorted(request_user_ids(scope))
+        caller = ",".join(user_ids).encode() if user_ids else str((scope.get("client") or ("",))[0]).encode()
+    return hashlib.sha256(
+        b"\n".join([scope["method"].encode(), scope["path"].encode(), caller, key.encode()])
+    ).hexdigest()
+
+
+def idempotency_error(status_code, detail):
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+
+class IdempotencyMiddleware:
+    """
+    A POST/PUT/PATCH/DELETE carrying an Idempotency-Key header runs at most once: repeats from the
+    same caller with the same key, method, path and body get the stored response back (marked with
+    an Idempotent-Replayed header), while reusing a key for a different query or body is rejected.
+    Keys are scoped by caller, method and path (scoped_idempotency_key).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH", "DELETE"):
+            await self.app(scope, receive, send)
+            return
+        key = next((value.decode("latin-1").strip() for name, value in scope["headers"]
+                    if name == b"idempotency-key"), None)
+        # File uploads stream to disk; fingerprinting them would mean holding the whole body in memory
+        content_type = next((value for name, value in scope["headers"] if name == b"content-type"), b"")
+        if not key or content_type.startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        if len(key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+            await idempotency_error(400, "Idempotency-Key is too long")(scope, receive, send)
+            return
+        client_key = key
+        key = scoped_idempotency_key(scope, client_key)
+
+        # The body is read up front to fingerprint the request, then replayed to the endpoint
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["method"].encode(), scope["path"].encode(), scope["query_string"], body])
+        ).hexdigest()
+
+        try:
+            record = await run_in_threadpool(idempotency_store.lookup, key)
+            if record is None and not await run_in_threadpool(idempotency_store.claim, key, fingerprint):
+                # Either the first request is still running or it finished in the meantime
+                record = await run_in_threadpool(idempotency_store.lookup, key)
+                if record is None:
+                    await idempotency_error(409, "A request with this Idempotency-Key is still in progress")(
+                        scope, receive, send
+                    )
+                    return
+        except HTTPException as exc:
+            await JSONResponse(status_code=exc.status_code, content={"detail": exc.detail},
+                               headers=exc.headers)(scope, receive, send)
+            return
+        except mysql.connector.Error as err:
+            exc = database_error(err)
+            await JSONResponse(status_code=exc.status_code, content={"detail": exc.detail},
+                               headers=exc.headers)(scope, receive, send)
+            return
+
+        if record is not None:
+            request_hash, status_code, stored_body, content_type = record
+            if request_hash != fingerprint:
+                await idempotency_error(422, "Idempotency-Key was already used for a different request")(
+                    scope, receive, send
+                )
+                return
+            idempotency_store.record_replay()
+            await Response(content=stored_body, status_code=status_code, media_type=content_type,
+                           headers={"Idempotent-Replayed": "true"})(scope, receive, send)
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        response = {"status": 500, "content_type": None, "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            try:
+                if response["status"] >= 500:
+                    await run_in_threadpool(idempotency_store.release, key)
+                else:
+                    record = (fingerprint, response["status"], b"".join(response["body"]), response["content_type"])
+                    await run_in_threadpool(idempotency_store.complete, key, record)
+            except (HTTPException, mysql.connector.Error) as err:
+                # The write itself went through; a stale claim expires after IDEMPOTENCY_CLAIM_SECONDS
+                print(f"Could not record Idempotency-Key {client_key}: {err}")
+
+
+# Middleware, innermost first: each add_middleware call wraps everything added before it.
+# Requests pass CORS -> admission control -> replica routing -> idempotency -> route. CORS is
+# outermost so shed 503s and replayed responses still carry the headers the frontend needs.
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(ReplicaRoutingMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+# CORS middleware to handle cross-origin requests
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/idempotency/stats")
+def get_idempotency_stats():
+    return idempotency_store.stats()
+
+
 """ ************************************** User Backend ************************************************ """
 
 
@@ -155,7 +1441,7 @@ class UserCreateRequest(BaseModel):
 
 # Register user endpoint
 @app.post("/register")
-async def register_user(user: UserCreateRequest):
+def register_user(user: UserCreateRequest):
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -182,6 +1468,7 @@ async def register_user(user: UserCreateRequest):
             hashed_password,
         )
     )
+    user_id = cursor.lastrowid
     connection.commit()
 
     # Handle role-specific logic
@@ -208,6 +1495,7 @@ async def register_user(user: UserCreateRequest):
 
     # Commit the changes and close the connection
     connection.commit()
+    query_cache.invalidate(f"user:{user_id}")
     cursor.close()
     connection.close()
 
@@ -216,7 +1504,7 @@ async def register_user(user: UserCreateRequest):
 
 # Login user endpoint
 @app.post("/login")
-async def login(user: UserLoginRequest):
+def login(user: UserLoginRequest):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
@@ -273,11 +1561,12 @@ class UserProfileUpdateRequest(BaseModel):
 
 
 @app.get("/user/profile/{user_id}", response_model=UserProfileUpdateRequest)
-async def view_user_profile(user_id: int):
+@cached("user_profile", tags=lambda user_id: (f"user:{user_id}",))
+def view_user_profile(user_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
-    cursor.execute("SELECT * FROM user WHERE user_ID = %s", (user_id,))
+    cursor.execute(time_limited("SELECT * FROM user WHERE user_ID = %s"), (user_id,))
     user = cursor.fetchone()
     cursor.close()
     connection.close()
@@ -312,7 +1601,7 @@ class UserProfileUpdateRequest(BaseModel):
 
 
 @app.put("/user/profile/{user_id}")
-async def update_user_profile(user_id: int, user: UserProfileUpdateRequest):
+def update_user_profile(user_id: int, user: UserProfileUpdateRequest):
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -364,7 +1653,10 @@ async def update_user_profile(user_id: int, user: UserProfileUpdateRequest):
 
     # Execute the query
     cursor.execute(query, tuple(values))
+    refresh_listing_owner(cursor, user_id)
     connection.commit()
+    query_cache.invalidate(f"user:{user_id}")
+    publish_owner_listing_changes(connection, user_id)
     cursor.close()
     connection.close()
 
@@ -379,7 +1671,7 @@ class BalanceUpdateRequest(BaseModel):
 
 
 @app.put("/user/{user_id}/balance")
-async def update_user_balance(user_id: int, balance_update: BalanceUpdateRequest):
+def update_user_balance(user_id: int, balance_update: BalanceUpdateRequest):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
@@ -404,6 +1696,7 @@ async def update_user_balance(user_id: int, balance_update: BalanceUpdateRequest
     # Update the user's balance
     cursor.execute("UPDATE user SET balance = %s WHERE user_ID = %s", (new_balance, user_id))
     connection.commit()
+    query_cache.invalidate(f"user:{user_id}")
 
     cursor.close()
     connection.close()
@@ -424,7 +1717,7 @@ async def update_user_balance(user_id: int, balance_update: BalanceUpdateRequest
 
 
 @app.put("/user/{user_id}/deduct_balance_for_premium")
-async def deduct_balance_for_premium(user_id: int):
+def deduct_balance_for_premium(user_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
@@ -449,6 +1742,7 @@ async def deduct_balance_for_premium(user_id: int):
     # Update the user's balance
     cursor.execute("UPDATE user SET balance = %s WHERE user_ID = %s", (new_balance, user_id))
     connection.commit()
+    query_cache.invalidate(f"user:{user_id}")
 
     cursor.close()
     connection.close()
@@ -457,12 +1751,13 @@ async def deduct_balance_for_premium(user_id: int):
 
 
 @app.get("/user/{user_id}/balance")
-async def get_user_balance(user_id: int):
+@cached("user_balance", tags=lambda user_id: (f"user:{user_id}",))
+def get_user_balance(user_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     # Fetch the current balance of the user
-    cursor.execute("SELECT balance FROM user WHERE user_ID = %s", (user_id,))
+    cursor.execute(time_limited("SELECT balance FROM user WHERE user_ID = %s"), (user_id,))
     user = cursor.fetchone()
 
     cursor.close()
@@ -506,45 +1801,220 @@ class TruckCreate(BaseModel):
 """ ************************************** Ads Backend ************************************************ """
 
 
-@app.post("/add_vehicle/")
-async def add_vehicle(
-        vehicle: VehicleCreate,
-        car: Optional[CarCreate] = None,
-        motorcycle: Optional[MotorcycleCreate] = None,
-        truck: Optional[TruckCreate] = None,
-):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    try:
-        print(f"Attempting to insert vehicle: {vehicle}")  # Debug print to check vehicle data
+# The listing table is a denormalized read model (vehicle + subtype + ad + owner summary).
+# Every write that touches one of its source tables refreshes the affected rows before committing.
+LISTING_SOURCE_QUERY = """
+    SELECT v.vehicle_ID, v.manufacturer, v.model, v.year, v.price, v.mileage, v.`condition`,
+           v.city, v.state, v.description, v.listing_date, v.latitude, v.longitude,
+           c.number_of_doors, c.seating_capacity, c.transmission,
+           m.engine_capacity, m.bike_type,
+           t.cargo_capacity, t.has_towing_package,
+           CASE
+               WHEN c.vehicle_ID IS NOT NULL THEN 'car'
+               WHEN m.vehicle_ID IS NOT NULL THEN 'motorcycle'
+               WHEN t.vehicle_ID IS NOT NULL THEN 'truck'
+               ELSE 'unknown'
+           END AS vehicle_type,
+           a.ad_ID, a.post_date, a.expiry_date, a.is_premium,
+           a.views, a.status, a.owner AS ad_owner, a.associated_vehicle,
+           u.first_name, u.last_name, u.email, u.phone_number, u.address, u.rating, u.join_date
+    FROM vehicles v
+    LEFT JOIN car c ON v.vehicle_ID = c.vehicle_ID
+    LEFT JOIN motorcycle m ON v.vehicle_ID = m.vehicle_ID
+    LEFT JOIN truck t ON v.vehicle_ID = t.vehicle_ID
+    LEFT JOIN ads a ON v.vehicle_ID = a.associated_vehicle
+    LEFT JOIN user u ON a.owner = u.user_ID
+"""
+
+# Fields served by the listing endpoints (same keys the old joins returned), usable with ?fields=
+LISTING_VEHICLE_COLUMNS = {
+    name: f"l.`{name}`" for name in (
+        "vehicle_ID", "manufacturer", "model", "year", "price", "mileage", "condition",
+        "city", "state", "description", "listing_date", "latitude", "longitude",
+        "number_of_doors", "seating_capacity", "transmission",
+        "engine_capacity", "bike_type",
+        "cargo_capacity", "has_towing_package",
+        "vehicle_type",
+        "ad_ID", "post_date", "expiry_date", "is_premium",
+        "views", "status", "ad_owner", "associated_vehicle",
+    )
+}
 
-        # Insert the vehicle record
-        cursor.execute(
-            """
-            INSERT INTO vehicles (manufacturer, model, year, price, mileage, `condition`, city, state, description, listing_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                vehicle.manufacturer,
-                vehicle.model,
-                vehicle.year,
-                vehicle.price,
-                vehicle.mileage,
-                vehicle.condition,
-                vehicle.city,
-                vehicle.state,
-                vehicle.description,
-                date.today()
-            )
+LISTING_OWNER_COLUMNS = {
+    "user_ID": "l.ad_owner AS user_ID",
+    **{
+        name: f"l.`{name}`" for name in (
+            "first_name", "last_name", "email", "phone_number", "address", "rating", "join_date",
         )
+    },
+}
 
-        connection.commit()
-        print("Vehicle record inserted successfully.")
+LISTING_COLUMNS = {**LISTING_VEHICLE_COLUMNS, **LISTING_OWNER_COLUMNS}
 
-        # Fetch the vehicle ID of the newly inserted vehicle
-        cursor.execute("SELECT LAST_INSERT_ID()")
-        vehicle_id = cursor.fetchone()[0]
+
+# Response shapes for endpoints that return listings together with their owner
+LISTING_SHAPES = ("flat", "normalized")
+LISTING_OWNER_KEYS = ("user_ID", "first_name", "last_name", "email", "phone_number", "address", "rating", "join_date")
+
+
+def validate_listing_shape(shape):
+    if shape not in LISTING_SHAPES:
+        raise HTTPException(status_code=400, detail=f"shape must be one of: {', '.join(LISTING_SHAPES)}")
+
+
+def sideload_owners(rows):
+    # Move the owner columns out of each row into one owners map keyed by user ID
+    owners = {}
+    for row in rows:
+        owner = {key: row.pop(key) for key in LISTING_OWNER_KEYS if key in row}
+        owner_id = owner.get("user_ID", row["ad_owner"])
+        row["owner_id"] = owner_id
+        owners.setdefault(owner_id, owner)
+    return rows, owners
+
+
+def measured_json_response(payload):
+    # Encode the body ourselves so the payload size and encode time can be reported to the client
+    started = time.perf_counter()
+    body = json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"X-Payload-Bytes": str(len(body)), "Server-Timing": f"encode;dur={encode_ms:.3f}"},
+    )
+
+
+def record_listing_change(cursor, vehicle_id, change_type="upsert"):
+    # Append to the change log that /listings/changes serves; 'delete' rows are tombstones
+    cursor.execute(
+        "INSERT INTO listing_change (vehicle_ID, change_type) VALUES (%s, %s)",
+        (vehicle_id, change_type)
+    )
+
+
+def refresh_listing(cursor, vehicle_id):
+    # Rebuild one vehicle's listing row from the source tables (no-op if the vehicle is gone)
+    cursor.execute(f"REPLACE INTO listing {LISTING_SOURCE_QUERY} WHERE v.vehicle_ID = %s", (vehicle_id,))
+    record_listing_change(cursor, vehicle_id)
+
+
+# In-memory indexes over the listings register here. After a write commits, the endpoint
+# publishes the affected vehicle IDs and every loaded listener gets the fresh listing row
+# (None once the vehicle is gone), so indexes are updated in place instead of being rebuilt.
+listing_listeners = []
+
+
+def publish_listing_changes(connection, vehicle_ids):
+    if not any(listener.loaded_at for listener in listing_listeners):
+        return
+
+    cursor = connection.cursor(dictionary=True)
+    try:
+        placeholders = ", ".join(["%s"] * len(vehicle_ids))
+        cursor.execute(f"SELECT * FROM listing WHERE vehicle_ID IN ({placeholders})", tuple(vehicle_ids))
+        rows = {row["vehicle_ID"]: row for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    for listener in listing_listeners:
+        if listener.loaded_at:
+            for vehicle_id in vehicle_ids:
+                listener.apply_listing_change(vehicle_id, rows.get(vehicle_id))
+
+
+def refresh_listing_owner(cursor, user_id):
+    # Copy the owner summary onto every listing of that user
+    refresh_listing_owners(cursor, [user_id])
+
+
+def refresh_listing_owners(cursor, user_ids):
+    # refresh_listing_owner for many owners in one statement
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    cursor.execute(f"""
+        UPDATE listing l
+        JOIN user u ON l.ad_owner = u.user_ID
+        SET l.first_name = u.first_name, l.last_name = u.last_name, l.email = u.email,
+            l.phone_number = u.phone_number, l.address = u.address,
+            l.rating = u.rating, l.join_date = u.join_date
+        WHERE l.ad_owner IN ({placeholders})
+    """, tuple(user_ids))
+
+    if cursor.rowcount:
+        cursor.execute(f"""
+            INSERT INTO listing_change (vehicle_ID, change_type)
+            SELECT vehicle_ID, 'upsert' FROM listing WHERE ad_owner IN ({placeholders})
+        """, tuple(user_ids))
+
+
+def publish_owner_listing_changes(connection, user_id):
+    # publish_listing_changes for every listing of one owner, after refresh_listing_owner has committed
+    publish_owners_listing_changes(connection, [user_id])
+
+
+def publish_owners_listing_changes(connection, user_ids):
+    if not any(listener.loaded_at for listener in listing_listeners):
+        return
+
+    cursor = connection.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(f"SELECT vehicle_ID FROM listing WHERE ad_owner IN ({placeholders})", tuple(user_ids))
+        vehicle_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    if vehicle_ids:
+        publish_listing_changes(connection, vehicle_ids)
+
+
+@app.post("/add_vehicle/")
+def add_vehicle(
+        vehicle: VehicleCreate,
+        car: Optional[CarCreate] = None,
+        motorcycle: Optional[MotorcycleCreate] = None,
+        truck: Optional[TruckCreate] = None,
+):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        print(f"Attempting to insert vehicle: {vehicle}")  # Debug print to check vehicle data
+
+        # Canonical city/state spelling and coordinates from the bundled gazetteer
+        city, state, latitude, longitude = normalize_location(vehicle.city, vehicle.state)
+
+        # Insert the vehicle record
+        cursor.execute(
+            """
+            INSERT INTO vehicles (manufacturer, model, year, price, mileage, `condition`, city, state, description,
+                                  listing_date, latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (
+                vehicle.manufacturer,
+                vehicle.model,
+                vehicle.year,
+                vehicle.price,
+                vehicle.mileage,
+                vehicle.condition,
+                city,
+                state,
+                vehicle.description,
+                date.today(),
+                latitude,
+                longitude
+            )
+        )
+
+        print("Vehicle record inserted successfully.")
+
+        # Fetch the vehicle ID of the newly inserted vehicle
+        cursor.execute("SELECT LAST_INSERT_ID()")
+        vehicle_id = cursor.fetchone()[0]
         print(f"Fetched vehicle ID: {vehicle_id}")
 
         # Insert the specific vehicle type (Car, Motorcycle, Truck) if applicable
@@ -562,7 +2032,6 @@ async def add_vehicle(
                     car.transmission
                 )
             )
-            connection.commit()
             print("Car data inserted successfully.")
 
         if motorcycle:
@@ -578,7 +2047,6 @@ async def add_vehicle(
                     motorcycle.bike_type
                 )
             )
-            connection.commit()
             print("Motorcycle data inserted successfully.")
 
         if truck:
@@ -594,17 +2062,22 @@ async def add_vehicle(
                     truck.has_towing_package
                 )
             )
-            connection.commit()
             print("Truck data inserted successfully.")
 
+        # Vehicle, subtype and listing row are committed together
+        refresh_listing(cursor, vehicle_id)
+        connection.commit()
+        publish_listing_changes(connection, [vehicle_id])
+
         return {"message": "Vehicle added successfully", "vehicle_id": vehicle_id}
 
     except mysql.connector.Error as err:
         print(f"Database error: {err}")  # Debug print for database error
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     except Exception as e:
         print(f"Unexpected error: {e}")  # Debug print for other errors
+        connection.rollback()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
     finally:
         cursor.close()
@@ -619,7 +2092,7 @@ class AdCreate(BaseModel):
 
 
 @app.post("/add_ad/")
-async def add_ad(ad: AdCreate):
+def add_ad(ad: AdCreate):
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -647,30 +2120,35 @@ async def add_ad(ad: AdCreate):
                 ad.owner
             )
         )
-        connection.commit()
 
         # Fetch the ad ID of the newly inserted ad
         cursor.execute("SELECT LAST_INSERT_ID()")
         ad_id = cursor.fetchone()[0]
 
+        refresh_listing(cursor, ad.associated_vehicle)
+        connection.commit()
+        query_cache.invalidate(f"ad:{ad_id}")
+        publish_listing_changes(connection, [ad.associated_vehicle])
+        counter_buffer.add("owner_seller", ad.owner, number_of_ads=1)
+
         return {"message": "Ad created successfully", "ad_id": ad_id}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/user/{user_id}/ads")
-async def get_user_ads(user_id: int):
+def get_user_ads(user_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
         # Fetch all ads for the given user
-        cursor.execute("SELECT * FROM ads WHERE owner = %s", (user_id,))
+        cursor.execute(time_limited("SELECT * FROM ads WHERE owner = %s"), (user_id,))
         ads = cursor.fetchall()
 
         if not ads:
@@ -679,39 +2157,25 @@ async def get_user_ads(user_id: int):
         return {"message": "Ads fetched successfully", "ads": ads}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/user/{user_id}/vehicles")
-async def get_user_vehicles(user_id: int):
+def get_user_vehicles(user_id: int, fields: Optional[str] = None):
+    select_list = select_fields(fields, LISTING_VEHICLE_COLUMNS)
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
-        # Query to fetch vehicle and ad details along with car, motorcycle, or truck specific information
-        cursor.execute("""
-            SELECT v.*, 
-                   c.number_of_doors, c.seating_capacity, c.transmission,
-                   m.engine_capacity, m.bike_type,
-                   t.cargo_capacity, t.has_towing_package,
-                   CASE
-                       WHEN c.vehicle_ID IS NOT NULL THEN 'car'
-                       WHEN m.vehicle_ID IS NOT NULL THEN 'motorcycle'
-                       WHEN t.vehicle_ID IS NOT NULL THEN 'truck'
-                       ELSE 'unknown'
-                   END AS vehicle_type,
-                   a.ad_ID, a.post_date, a.expiry_date, a.is_premium, 
-                   a.views, a.status, a.owner AS ad_owner, a.associated_vehicle
-            FROM vehicles v
-            LEFT JOIN car c ON v.vehicle_ID = c.vehicle_ID
-            LEFT JOIN motorcycle m ON v.vehicle_ID = m.vehicle_ID
-            LEFT JOIN truck t ON v.vehicle_ID = t.vehicle_ID
-            JOIN ads a ON v.vehicle_ID = a.associated_vehicle
-            WHERE a.owner = %s
-        """, (user_id,))
+        # Served from the listing read model with a single lookup on idx_listing_owner
+        cursor.execute(time_limited(f"""
+            SELECT {select_list}
+            FROM listing l
+            WHERE l.ad_owner = %s
+        """), (user_id,))
 
         vehicles = cursor.fetchall()
 
@@ -721,132 +2185,196 @@ async def get_user_vehicles(user_id: int):
         return {"message": "Vehicles fetched successfully", "vehicles": vehicles}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
-@app.get("/premium-vehicles")
-async def get_premium_vehicles():
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
-    try:
-        # Query to fetch general vehicle and ad details for only premium ads
-        cursor.execute("""
-            SELECT v.*, 
-                   a.ad_ID, a.post_date, a.expiry_date, a.is_premium, 
-                   a.views, a.status, a.owner AS ad_owner, a.associated_vehicle
-            FROM vehicles v
-            JOIN ads a ON v.vehicle_ID = a.associated_vehicle
-            WHERE a.is_premium = TRUE
-        """)
+# Vehicle and ad columns returned by /premium-vehicles
+PREMIUM_VEHICLE_FIELDS = (
+    "vehicle_ID", "manufacturer", "model", "year", "price", "mileage", "condition",
+    "city", "state", "description", "listing_date", "latitude", "longitude",
+    "ad_ID", "post_date", "expiry_date", "is_premium", "views", "status", "ad_owner", "associated_vehicle",
+)
 
-        vehicles = cursor.fetchall()
 
-        if not vehicles:
-            raise HTTPException(status_code=404, detail="No premium vehicles found.")
+@app.get("/premium-vehicles")
+def get_premium_vehicles():
+    # General vehicle and ad details for premium ads only, from the in-memory catalog
+    _, vehicles = ensure_listing_catalog().query({"is_premium": True}, fields=PREMIUM_VEHICLE_FIELDS)
 
-        return {"message": "Premium vehicles fetched successfully", "vehicles": vehicles}
+    if not vehicles:
+        raise HTTPException(status_code=404, detail="No premium vehicles found.")
 
-    except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        connection.close()
+    return {"message": "Premium vehicles fetched successfully", "vehicles": vehicles}
 
 
 @app.delete("/delete_ad/{ad_id}")
-async def delete_ad(ad_id: int):
+def delete_ad(ad_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
         # Check if the ad exists
-        cursor.execute("SELECT associated_vehicle FROM ads WHERE ad_ID = %s", (ad_id,))
+        cursor.execute("SELECT associated_vehicle, owner FROM ads WHERE ad_ID = %s", (ad_id,))
         result = cursor.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="Ad not found")
 
-        associated_vehicle = result[0]
+        associated_vehicle, owner = result
 
-        # Delete the ad
+        # Photo rows go with the vehicle by cascade; their files are removed once that has committed
+        cursor.execute("SELECT photo_url FROM vehicle_photos WHERE vehicle_ID = %s", (associated_vehicle,))
+        photo_urls = [row[0] for row in cursor.fetchall()]
+
+        # Delete the ad (its transactions are unlinked by the unlink_transactions_* triggers)
         print(f"Deleting ad with ID={ad_id}")
         cursor.execute("DELETE FROM ads WHERE ad_ID = %s", (ad_id,))
 
-        # Delete the vehicle associated with the ad
+        # Delete the vehicle associated with the ad (its listing row goes with it via ON DELETE CASCADE)
         print(f"Deleting vehicle with ID={associated_vehicle}")
         cursor.execute("DELETE FROM vehicles WHERE vehicle_ID = %s", (associated_vehicle,))
+        record_listing_change(cursor, associated_vehicle, "delete")
 
         connection.commit()
+        remove_photo_files(photo_urls)
+        query_cache.invalidate(f"ad:{ad_id}")
+        publish_listing_changes(connection, [associated_vehicle])
+        # A sold ad's deal was still done, so only the ad count goes down
+        counter_buffer.add("owner_seller", owner, number_of_ads=-1)
 
         return {"message": "Ad, associated vehicle, and related data deleted successfully"}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/user/{user_id}/other-ads")
-async def get_other_user_ads(user_id: int):
+# Plain def so FastAPI runs it in the threadpool instead of blocking the event loop
+def get_other_user_ads(user_id: int, shape: str = "flat", fields: Optional[str] = None):
+    validate_listing_shape(shape)
+    # The normalized shape groups rows by ad_owner, so it is always selected
+    names = requested_fields(fields, LISTING_COLUMNS, required=("ad_owner",) if shape == "normalized" else ())
+
+    # Vehicle, ad, and owner details excluding the user's own ads, from the in-memory catalog
+    _, other_ads = ensure_listing_catalog().query({"exclude_owner": user_id}, fields=names)
+
+    if not other_ads:
+        raise HTTPException(status_code=404, detail="No ads found for other users")
+
+    if shape == "normalized":
+        other_ads, owners = sideload_owners(other_ads)
+        return measured_json_response(
+            {"message": "Ads from other users fetched successfully", "ads": other_ads, "owners": owners}
+        )
+
+    return measured_json_response({"message": "Ads from other users fetched successfully", "ads": other_ads})
+
+
+
+
+LISTING_CHANGES_PAGE_SIZE = 500
+LISTING_CHANGES_MAX_PAGE_SIZE = 5000
+# change_ID comes from AUTO_INCREMENT and is taken at insert, not at commit, so a transaction that
+# commits late can land below a cursor a reader already moved past. Only changes older than this
+# are handed out; writers are expected to commit well within it.
+LISTING_CHANGE_SETTLE_SECONDS = int(os.getenv("LISTING_CHANGE_SETTLE_SECONDS", "30"))
+
+
+def settled_listing_change(cursor):
+    # Highest change_ID logged before the settle window; walks the primary key from the end
+    cursor.execute(f"""
+        SELECT change_ID FROM listing_change
+        WHERE changed_at < NOW() - INTERVAL {LISTING_CHANGE_SETTLE_SECONDS} SECOND
+        ORDER BY change_ID DESC
+        LIMIT 1
+    """)
+    row = cursor.fetchone()
+    return row["change_ID"] if row else 0
+
+
+@app.get("/listings/changes")
+def get_listing_changes(since: int = 0, limit: int = LISTING_CHANGES_PAGE_SIZE, fields: Optional[str] = None):
+    """
+    Incremental sync of the listing catalog. Returns listings inserted or updated and the vehicle IDs
+    deleted after the `since` cursor; pass the returned cursor back to get the next delta.
+    since=0 pages through the whole catalog.
+
+    Only changes logged more than LISTING_CHANGE_SETTLE_SECONDS ago are returned, so every change
+    at or below a returned cursor has been committed and none is skipped by a later page, provided
+    the writing transaction committed within that window. Recent changes show up on a later call.
+    """
+    if limit < 1 or limit > LISTING_CHANGES_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LISTING_CHANGES_MAX_PAGE_SIZE}")
+
+    select_list = select_fields(fields, LISTING_COLUMNS, required=("vehicle_ID",))
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
-        # Query to fetch vehicle, ad, and owner details excluding the user's own ads
-        cursor.execute("""
-            SELECT v.*, 
-                   c.number_of_doors, c.seating_capacity, c.transmission,
-                   m.engine_capacity, m.bike_type,
-                   t.cargo_capacity, t.has_towing_package,
-                   CASE
-                       WHEN c.vehicle_ID IS NOT NULL THEN 'car'
-                       WHEN m.vehicle_ID IS NOT NULL THEN 'motorcycle'
-                       WHEN t.vehicle_ID IS NOT NULL THEN 'truck'
-                       ELSE 'unknown'
-                   END AS vehicle_type,
-                   a.ad_ID, a.post_date, a.expiry_date, a.is_premium, 
-                   a.views, a.status, a.owner AS ad_owner, a.associated_vehicle,
-                   u.user_ID, u.first_name, u.last_name, u.email, 
-                   u.phone_number, u.address, u.rating, u.join_date
-            FROM vehicles v
-            LEFT JOIN car c ON v.vehicle_ID = c.vehicle_ID
-            LEFT JOIN motorcycle m ON v.vehicle_ID = m.vehicle_ID
-            LEFT JOIN truck t ON v.vehicle_ID = t.vehicle_ID
-            JOIN ads a ON v.vehicle_ID = a.associated_vehicle
-            JOIN user u ON a.owner = u.user_ID
-            WHERE a.owner != %s
-        """, (user_id,))
-
-        other_ads = cursor.fetchall()
+        settled = settled_listing_change(cursor)
+        cursor.execute(time_limited("""
+            SELECT change_ID, vehicle_ID, change_type
+            FROM listing_change
+            WHERE change_ID > %s AND change_ID <= %s
+            ORDER BY change_ID
+            LIMIT %s
+        """), (since, settled, limit))
+        changes = cursor.fetchall()
+
+        # Several changes to the same vehicle collapse into the latest one
+        latest = {change["vehicle_ID"]: change for change in changes}
+        upserted_ids = [vehicle_id for vehicle_id, change in latest.items() if change["change_type"] == "upsert"]
+        deleted_ids = [vehicle_id for vehicle_id, change in latest.items() if change["change_type"] == "delete"]
+
+        upserted = []
+        if upserted_ids:
+            placeholders = ", ".join(["%s"] * len(upserted_ids))
+            cursor.execute(time_limited(f"""
+                SELECT {select_list}
+                FROM listing l
+                WHERE l.vehicle_ID IN ({placeholders}) AND l.ad_ID IS NOT NULL
+            """), tuple(upserted_ids))
+            upserted = cursor.fetchall()
+
+            # Missing rows were deleted after being logged or have no ad yet; the client should drop both
+            found_ids = {row["vehicle_ID"] for row in upserted}
+            deleted_ids += [
+                vehicle_id for vehicle_id in upserted_ids
+                if vehicle_id not in found_ids and vehicle_id not in deleted_ids
+            ]
+            for row in upserted:
+                row["version"] = latest[row["vehicle_ID"]]["change_ID"]
 
-        if not other_ads:
-            raise HTTPException(status_code=404, detail="No ads found for other users")
-
-        return {"message": "Ads from other users fetched successfully", "ads": other_ads}
+        return {
+            "cursor": changes[-1]["change_ID"] if changes else since,
+            "has_more": len(changes) == limit,
+            "upserted": upserted,
+            "deleted": deleted_ids,
+        }
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
-
-
 @app.get("/ad/{ad_id}/owner")
-async def get_ad_owner(ad_id: int):
+@cached("ad_owner", tags=lambda ad_id: (f"ad:{ad_id}",))
+def get_ad_owner(ad_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
         # Query to get the owner ID of the ad
-        cursor.execute("SELECT owner FROM ads WHERE ad_ID = %s", (ad_id,))
+        cursor.execute(time_limited("SELECT owner FROM ads WHERE ad_ID = %s"), (ad_id,))
         result = cursor.fetchone()
 
         if not result:
@@ -857,7 +2385,7 @@ async def get_ad_owner(ad_id: int):
         return {"message": "Owner ID fetched successfully", "owner_id": owner_id}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -865,13 +2393,13 @@ async def get_ad_owner(ad_id: int):
 
 
 @app.put("/ad/{ad_id}/mark-sold")
-async def mark_ad_as_sold(ad_id: int):
+def mark_ad_as_sold(ad_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
         # Query to check if the ad exists and fetch its current status
-        cursor.execute("SELECT status FROM ads WHERE ad_ID = %s", (ad_id,))
+        cursor.execute("SELECT status, associated_vehicle, owner FROM ads WHERE ad_ID = %s", (ad_id,))
         result = cursor.fetchone()
 
         if not result:
@@ -885,12 +2413,27 @@ async def mark_ad_as_sold(ad_id: int):
 
         # Update the status of the ad to 'Sold'
         cursor.execute("UPDATE ads SET status = 'Sold' WHERE ad_ID = %s", (ad_id,))
+        refresh_listing(cursor, result["associated_vehicle"])
+
+        # Sale details for the valuation snapshot, read before commit in the same transaction
+        cursor.execute(VALUATION_SNAPSHOT_QUERY + " WHERE l.vehicle_ID = %s", (result["associated_vehicle"],))
+        sale = cursor.fetchone()
+
         connection.commit()
+        query_cache.invalidate(f"ad:{ad_id}")
+        publish_listing_changes(connection, [result["associated_vehicle"]])
+        counter_buffer.add("owner_seller", result["owner"], number_of_done_deals=1)
+        if sale:
+            price_estimator.record_sale(
+                sale["manufacturer"], sale["model"], sale["year"], sale["mileage"], sale["condition"],
+                sale["sold_price"],
+            )
 
         return {"message": "Ad status updated to 'Sold' successfully"}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        connection.rollback()
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -898,214 +2441,910 @@ async def mark_ad_as_sold(ad_id: int):
 
 
 
-""" ************************************** Wishlist Backend ************************************************ """
+""" ************************************** Photo Backend ************************************************ """
 
+PHOTO_STORAGE_DIR = os.getenv('PHOTO_STORAGE_DIR', os.path.join(os.path.dirname(__file__), "..", "photos"))
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 15 * 1024 * 1024))
+PHOTO_MAX_FILES = 20
+PHOTO_WORKERS = int(os.getenv('PHOTO_WORKERS', 2))
+# Longest side in pixels of each generated variant; "original" is the uploaded file itself
+PHOTO_VARIANTS = {"thumb": 320, "medium": 1024, "large": 2048}
+# The stored photo_url points at this variant; clients swap the last path segment for the others
+PHOTO_DEFAULT_VARIANT = "large"
+PHOTO_IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+PHOTO_KEY = re.compile(r"^[0-9a-f]{32}$")
 
-@app.post("/user/{user_id}/wishlist/{bookmarked_ad}")
-async def add_to_wishlist(user_id: int, bookmarked_ad: int):
-    connection = get_db_connection()
-    cursor = connection.cursor()
+# Detected from the first bytes of the upload; the client's Content-Type is not trusted
+PHOTO_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+)
+PHOTO_MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
 
-    try:
-        # Check if the ad exists
-        cursor.execute("SELECT * FROM ads WHERE ad_ID = %s", (bookmarked_ad,))
-        ad = cursor.fetchone()
+if Image is None:
+    print("Pillow is not installed; photos are served without resized variants")
 
-        if not ad:
-            raise HTTPException(status_code=404, detail="Ad not found")
 
-        # Insert into wishlist table
-        cursor.execute("""
-            INSERT INTO wishlist (user_ID, bookmarked_ad)
-            VALUES (%s, %s)
-        """, (user_id, bookmarked_ad))
+def photo_extension(head):
+    for signature, extension in PHOTO_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
 
-        connection.commit()
 
-        return {"message": "Ad successfully added to wishlist"}
+def photo_original_path(key):
+    directory = os.path.join(PHOTO_STORAGE_DIR, key)
+    for extension in PHOTO_MEDIA_TYPES:
+        path = os.path.join(directory, f"original.{extension}")
+        if os.path.exists(path):
+            return path
+    return None
 
-    except mysql.connector.Error as err:
-        connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        connection.close()
 
+def make_photo_variants(original_path):
+    """
+    Runs in the photo process pool: writes a JPEG per PHOTO_VARIANTS entry next to the original.
+    Each file is written under a temporary name and renamed, so a variant is either complete or
+    absent, which is what lets the served files be cached as immutable.
+    """
+    directory = os.path.dirname(original_path)
+    with Image.open(original_path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for variant, size in PHOTO_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((size, size))
+            temporary = os.path.join(directory, f".{variant}.jpg.tmp")
+            resized.save(temporary, "JPEG", quality=85, optimize=True, progressive=True)
+            os.replace(temporary, os.path.join(directory, f"{variant}.jpg"))
+    return directory
 
-@app.delete("/user/{user_id}/wishlist/{bookmarked_ad}")
-async def remove_from_wishlist(user_id: int, bookmarked_ad: int):
-    connection = get_db_connection()
-    cursor = connection.cursor()
 
-    try:
-        # Check if the ad exists in the wishlist for the given user
-        cursor.execute("SELECT * FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s", (user_id, bookmarked_ad))
-        wishlist_item = cursor.fetchone()
+photo_pool = None
+photo_pool_lock = threading.Lock()
 
-        if not wishlist_item:
-            raise HTTPException(status_code=404, detail="Ad not found in wishlist")
 
-        # Delete from wishlist table
-        cursor.execute("DELETE FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s", (user_id, bookmarked_ad))
+def report_photo_variants(path, future):
+    if future.exception() is not None:
+        print(f"Photo variants failed for {path}: {future.exception()}")
 
-        connection.commit()
 
-        return {"message": "Ad successfully removed from wishlist"}
+def submit_photo_variants(original_paths):
+    global photo_pool
+    if Image is None:
+        return
+    with photo_pool_lock:
+        if photo_pool is None:
+            # Resizing is CPU bound, so it runs in worker processes rather than the request threads
+            photo_pool = ProcessPoolExecutor(max_workers=PHOTO_WORKERS)
+    for path in original_paths:
+        future = photo_pool.submit(make_photo_variants, path)
+        future.add_done_callback(functools.partial(report_photo_variants, path))
+
+
+class PhotoUploadParser:
+    """
+    Streams a multipart/form-data body to disk. python-multipart calls back synchronously while a
+    body chunk is parsed; the events are queued and then handled here, writing each file part to
+    an incoming file as it arrives, so memory use is one chunk whatever the file sizes.
+    """
 
+    def __init__(self, boundary):
+        self.events = []
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": lambda: self.events.append(("begin", b"")),
+            "on_header_field": lambda data, start, end: self.events.append(("field", data[start:end])),
+            "on_header_value": lambda data, start, end: self.events.append(("value", data[start:end])),
+            "on_header_end": lambda: self.events.append(("header", b"")),
+            "on_headers_finished": lambda: self.events.append(("headers", b"")),
+            "on_part_data": lambda data, start, end: self.events.append(("data", data[start:end])),
+            "on_part_end": lambda: self.events.append(("end", b"")),
+        })
+        self.incoming = os.path.join(PHOTO_STORAGE_DIR, ".incoming")
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.part = None  # [key, handle, size, head] of the file part being written
+        self.saved = []  # (key, original path)
+
+    async def feed(self, chunk):
+        self.parser.write(chunk)
+        events, self.events = self.events, []
+        for kind, data in events:
+            if kind == "begin":
+                self.headers = {}
+            elif kind == "field":
+                self.header_field += data
+            elif kind == "value":
+                self.header_value += data
+            elif kind == "header":
+                self.headers[self.header_field.lower()] = self.header_value
+                self.header_field, self.header_value = b"", b""
+            elif kind == "headers":
+                await self._start_part()
+            elif kind == "data" and self.part is not None:
+                await self._write(data)
+            elif kind == "end" and self.part is not None:
+                await run_in_threadpool(self._finish_part)
+
+    async def _start_part(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            self.part = None  # plain form fields are ignored
+            return
+        if len(self.saved) >= PHOTO_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {PHOTO_MAX_FILES} photos per upload")
+        key = uuid.uuid4().hex
+        handle = await run_in_threadpool(self._open_incoming, key)
+        self.part = [key, handle, 0, b""]
+
+    def _open_incoming(self, key):
+        # Runs in the threadpool, like the writes: the storage may be a slow or network disk
+        os.makedirs(self.incoming, exist_ok=True)
+        return open(os.path.join(self.incoming, key), "wb")
+
+    async def _write(self, data):
+        key, handle, size, head = self.part
+        size += len(data)
+        if size > PHOTO_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Photos are limited to {PHOTO_MAX_BYTES // (1024 * 1024)} MB")
+        self.part[2] = size
+        if len(head) < 12:
+            self.part[3] = (head + data)[:12]
+        await run_in_threadpool(handle.write, data)
+
+    def _finish_part(self):
+        key, handle, size, head = self.part
+        handle.close()
+        self.part = None
+        incoming_path = os.path.join(self.incoming, key)
+        extension = photo_extension(head)
+        if extension is None:
+            os.remove(incoming_path)
+            raise HTTPException(status_code=415, detail="Photos must be JPEG, PNG or WebP images")
+
+        directory = os.path.join(PHOTO_STORAGE_DIR, key)
+        os.makedirs(directory)
+        original_path = os.path.join(directory, f"original.{extension}")
+        os.replace(incoming_path, original_path)
+        self.saved.append((key, original_path))
+
+    def discard(self):
+        # Removes everything this upload wrote, e.g. after a rejected part or a failed insert
+        if self.part is not None:
+            self.part[1].close()
+            os.remove(os.path.join(self.incoming, self.part[0]))
+            self.part = None
+        for key, _ in self.saved:
+            shutil.rmtree(os.path.join(PHOTO_STORAGE_DIR, key), ignore_errors=True)
+        self.saved = []
+
+
+def remove_photo_files(photo_urls):
+    # Deletes the stored files behind vehicle_photos rows; called after the rows' delete committed
+    for url in photo_urls:
+        parts = url.split("/")
+        if len(parts) == 4 and parts[1] == "photos" and PHOTO_KEY.match(parts[2]):
+            shutil.rmtree(os.path.join(PHOTO_STORAGE_DIR, parts[2]), ignore_errors=True)
+
+
+def vehicle_exists(vehicle_id):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM vehicles WHERE vehicle_ID = %s", (vehicle_id,))
+        return cursor.fetchone() is not None
     except mysql.connector.Error as err:
-        connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
-@app.get("/user/{user_id}/wishlist/{bookmarked_ad}")
-async def check_if_bookmarked(user_id: int, bookmarked_ad: int):
+def insert_vehicle_photos(vehicle_id, photo_urls):
+    # One multi-row INSERT for the whole upload (executemany batches simple INSERTs)
     connection = get_db_connection()
-    cursor = connection.cursor()
-
+    cursor = connection.cursor(dictionary=True)
     try:
-        # Check if the ad exists in the wishlist for the given user
-        cursor.execute("SELECT * FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s", (user_id, bookmarked_ad))
-        wishlist_item = cursor.fetchone()
-
-        if wishlist_item:
-            return {"message": "Ad is in the wishlist", "isBookmarked": True}
-        else:
-            return {"message": "Ad is not in the wishlist", "isBookmarked": False}
-
+        cursor.executemany(
+            "INSERT INTO vehicle_photos (vehicle_ID, photo_url) VALUES (%s, %s)",
+            [(vehicle_id, url) for url in photo_urls],
+        )
+        connection.commit()
+        placeholders = ", ".join(["%s"] * len(photo_urls))
+        cursor.execute(
+            f"SELECT photo_ID, photo_url FROM vehicle_photos WHERE vehicle_ID = %s AND photo_url IN ({placeholders})",
+            (vehicle_id, *photo_urls),
+        )
+        return cursor.fetchall()
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        connection.rollback()
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
-@app.get("/user/{user_id}/wishlist")
-async def get_user_wishlist(user_id: int):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+@app.post("/vehicle/{vehicle_id}/photos")
+async def upload_vehicle_photos(vehicle_id: int, request: Request):
+    """
+    Multipart upload of one or more photo files (any field name). The body is parsed as it streams
+    in and each file goes straight to disk; resized variants are generated in the background and
+    the stored photo_url serves the original until its variant is ready.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    if not await run_in_threadpool(vehicle_exists, vehicle_id):
+        raise HTTPException(status_code=404, detail="Vehicle not found")
 
+    upload = PhotoUploadParser(options[b"boundary"])
     try:
-        # Query to fetch detailed information for all wishlist items of the user
-        cursor.execute("""
-            SELECT v.*, 
-                   c.number_of_doors, c.seating_capacity, c.transmission,
-                   m.engine_capacity, m.bike_type,
-                   t.cargo_capacity, t.has_towing_package,
-                   CASE
-                       WHEN c.vehicle_ID IS NOT NULL THEN 'car'
-                       WHEN m.vehicle_ID IS NOT NULL THEN 'motorcycle'
-                       WHEN t.vehicle_ID IS NOT NULL THEN 'truck'
-                       ELSE 'unknown'
-                   END AS vehicle_type,
-                   a.ad_ID, a.post_date, a.expiry_date, a.is_premium, 
-                   a.views, a.status, a.owner AS ad_owner, a.associated_vehicle,
-                   u.user_ID, u.first_name, u.last_name, u.email, 
-                   u.phone_number, u.address, u.rating, u.join_date
-            FROM wishlist w
-            JOIN ads a ON w.bookmarked_ad = a.ad_ID
-            JOIN vehicles v ON a.associated_vehicle = v.vehicle_ID
-            LEFT JOIN car c ON v.vehicle_ID = c.vehicle_ID
-            LEFT JOIN motorcycle m ON v.vehicle_ID = m.vehicle_ID
-            LEFT JOIN truck t ON v.vehicle_ID = t.vehicle_ID
-            JOIN user u ON a.owner = u.user_ID
-            WHERE w.user_ID = %s
-        """, (user_id,))
+        async for chunk in request.stream():
+            await upload.feed(chunk)
+        if upload.part is not None:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        if not upload.saved:
+            raise HTTPException(status_code=400, detail="No photo files in the upload")
+
+        urls = [f"/photos/{key}/{PHOTO_DEFAULT_VARIANT}" for key, _ in upload.saved]
+        photos = await run_in_threadpool(insert_vehicle_photos, vehicle_id, urls)
+    except BaseException:
+        upload.discard()
+        raise
+
+    submit_photo_variants([path for _, path in upload.saved])
+    return {
+        "message": "Photos uploaded successfully",
+        "photos": [
+            {
+                **photo,
+                "variants": {
+                    variant: photo["photo_url"].rsplit("/", 1)[0] + f"/{variant}"
+                    for variant in ("original", *PHOTO_VARIANTS)
+                },
+            }
+            for photo in photos
+        ],
+    }
 
-        wishlist_items = cursor.fetchall()
 
-        if not wishlist_items:
-            return {"message": "No items in wishlist"}
+@app.get("/photos/{key}/{variant}")
+def get_photo(key: str, variant: str):
+    if not PHOTO_KEY.match(key) or (variant != "original" and variant not in PHOTO_VARIANTS):
+        raise HTTPException(status_code=404, detail="Photo not found")
 
-        return {"message": "Wishlist items fetched successfully", "wishlist": wishlist_items}
+    original_path = photo_original_path(key)
+    if original_path is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
 
-    except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        connection.close()
+    if variant != "original":
+        path = os.path.join(PHOTO_STORAGE_DIR, key, f"{variant}.jpg")
+        if os.path.exists(path):
+            return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": PHOTO_IMMUTABLE_CACHE})
+        # Not generated yet: serve the original briefly so the URL can later become immutable
+        return FileResponse(original_path, media_type=PHOTO_MEDIA_TYPES[original_path.rsplit(".", 1)[1]],
+                            headers={"Cache-Control": "public, max-age=60"})
 
+    return FileResponse(original_path, media_type=PHOTO_MEDIA_TYPES[original_path.rsplit(".", 1)[1]],
+                        headers={"Cache-Control": PHOTO_IMMUTABLE_CACHE})
 
-""" ************************************** Offer Backend ************************************************ """
 
 
-@app.post("/create_offer/{offer_owner}/{sent_to}/{offer_price}")
-async def create_offer(offer_owner: int, sent_to: int, offer_price: float):
-    connection = get_db_connection()
-    cursor = connection.cursor()
 
-    try:
-        # Insert the new offer into the offer table
-        cursor.execute("""
-            INSERT INTO offer (offer_price, offer_owner, sent_to)
-            VALUES (%s, %s, %s)
-        """, (offer_price, offer_owner, sent_to))
+""" ************************************** Counter Backend ************************************************ """
 
-        connection.commit()
+COUNTER_FLUSH_SECONDS = float(os.getenv('COUNTER_FLUSH_SECONDS', 5))
+COUNTER_RECONCILE_SECONDS = float(os.getenv('COUNTER_RECONCILE_SECONDS', 3600))
+# counter_delta rows (logged by the inspections triggers) folded in per flush
+COUNTER_DELTA_BATCH_SIZE = 5000
 
-        return {"message": "Offer created successfully"}
+# Counter columns per table, all keyed by user_id
+COUNTER_COLUMNS = {
+    "owner_seller": ("number_of_ads", "number_of_done_deals"),
+    "inspector": ("number_of_inspections", "number_of_certificates"),
+}
 
-    except mysql.connector.Error as err:
-        connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
-    finally:
-        cursor.close()
-        connection.close()
+# Recomputes every counter from its source table; owners/inspectors with no rows drop back to 0.
+# Archived ads still count towards their owner. A completed sale stays counted after its ad is
+# deleted, so done deals are only ever raised here.
+COUNTER_RECONCILE_QUERIES = (
+    """
+    UPDATE owner_seller o
+    LEFT JOIN (
+        SELECT owner, COUNT(*) AS ads, SUM(status = 'Sold') AS done_deals
+        FROM (
+            SELECT owner, status FROM ads WHERE owner IS NOT NULL
+            UNION ALL
+            SELECT owner, status FROM ads_history WHERE owner IS NOT NULL
+        ) all_ads
+        GROUP BY owner
+    ) a ON a.owner = o.user_id
+    SET o.number_of_ads = COALESCE(a.ads, 0),
+        o.number_of_done_deals = GREATEST(o.number_of_done_deals, COALESCE(a.done_deals, 0))
+    """,
+    """
+    UPDATE inspector i
+    LEFT JOIN (
+        SELECT done_by, COUNT(*) AS inspections, COUNT(related_certification) AS certificates
+        FROM inspections
+        GROUP BY done_by
+    ) x ON x.done_by = i.user_id
+    SET i.number_of_inspections = COALESCE(x.inspections, 0),
+        i.number_of_certificates = COALESCE(x.certificates, 0)
+    """,
+)
 
 
-@app.get("/check_offer/{user_id}/{ad_id}")
-async def check_user_offer(user_id: int, ad_id: int):
+class CounterBuffer:
+    """
+    Deltas to the owner_seller / inspector counters. Write endpoints record them after their commit;
+    inspector deltas are logged to counter_delta by the inspections triggers. A background thread
+    coalesces both per user and applies each table's pending deltas in one batched UPDATE every
+    COUNTER_FLUSH_SECONDS, and periodically recomputes every counter from the source tables to
+    repair anything lost in a crash or raced by a concurrent write.
+    """
+
+    def __init__(self, flush_interval, reconcile_interval):
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._thread = None
+        self.pending = defaultdict(int)  # (table, column, user_id) -> delta
+        self.flushed = 0
+        self.flushed_at = None
+        self.reconciled_at = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="counter-buffer", daemon=True)
+                self._thread.start()
+
+    def add(self, table, user_id, **deltas):
+        if user_id is None:
+            return
+        self.start()
+        with self._lock:
+            for column, delta in deltas.items():
+                self.pending[(table, column, user_id)] += delta
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, defaultdict(int)
+
+            # table -> column -> {user_id: delta}
+            batches = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+            for (table, column, user_id), delta in pending.items():
+                batches[table][column][user_id] += delta
+
+            try:
+                connection = get_db_connection()
+                cursor = connection.cursor()
+                try:
+                    # Locked, so exactly the rows counted here are deleted, in the same transaction. READ
+                    # COMMITTED takes no gap locks, so the inspections triggers can keep appending meanwhile.
+                    connection.start_transaction(isolation_level="READ COMMITTED")
+                    cursor.execute("""
+                        SELECT delta_ID, user_id, inspections, certificates FROM counter_delta
+                        ORDER BY delta_ID
+                        LIMIT %s
+                        FOR UPDATE
+                    """, (COUNTER_DELTA_BATCH_SIZE,))
+                    logged = cursor.fetchall()
+                    for _, user_id, inspections, certificates in logged:
+                        batches["inspector"]["number_of_inspections"][user_id] += inspections
+                        batches["inspector"]["number_of_certificates"][user_id] += certificates
+
+                    applied = 0
+                    for table, columns in batches.items():
+                        assignments, params = [], []
+                        for column in COUNTER_COLUMNS[table]:
+                            # Skip deltas that cancelled out
+                            deltas = {user_id: delta for user_id, delta in columns[column].items() if delta}
+                            if not deltas:
+                                continue
+                            applied += len(deltas)
+                            cases = " ".join("WHEN %s THEN %s" for _ in deltas)
+                            assignments.append(f"{column} = GREATEST({column} + CASE user_id {cases} ELSE 0 END, 0)")
+                            for user_id, delta in deltas.items():
+                                params += [user_id, delta]
+                        if not assignments:
+                            continue
+                        user_ids = sorted({user_id for deltas in columns.values() for user_id in deltas})
+                        cursor.execute(
+                            f"UPDATE {table} SET {', '.join(assignments)} "
+                            f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})",
+                            params + user_ids,
+                        )
+                    if logged:
+                        delta_ids = [row[0] for row in logged]
+                        cursor.execute(
+                            f"DELETE FROM counter_delta WHERE delta_ID IN ({', '.join(['%s'] * len(delta_ids))})",
+                            tuple(delta_ids),
+                        )
+                    connection.commit()
+                finally:
+                    cursor.close()
+                    connection.close()
+            except Exception:
+                # Put the deltas back so the next flush retries them
+                with self._lock:
+                    for key, delta in pending.items():
+                        self.pending[key] += delta
+                raise
+
+            self.flushed += applied
+            self.flushed_at = datetime.now()
+            return applied
+
+    def reconcile(self):
+        # Pending deltas are applied first and no flush runs meanwhile, so none is counted twice
+        with self._flush_lock:
+            self.flush()
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            try:
+                updated = 0
+                for query in COUNTER_RECONCILE_QUERIES:
+                    cursor.execute(query)
+                    updated += cursor.rowcount
+                connection.commit()
+            finally:
+                cursor.close()
+                connection.close()
+        self.reconciled_at = datetime.now()
+        return updated
+
+    def _run(self):
+        last_reconcile = time.monotonic()
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    self.reconcile()
+                    last_reconcile = time.monotonic()
+                else:
+                    self.flush()
+            except Exception as err:
+                print(f"Counter flush failed: {err}")
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "flushed": self.flushed,
+            "flushed_at": self.flushed_at,
+            "reconciled_at": self.reconciled_at,
+        }
+
+
+counter_buffer = CounterBuffer(COUNTER_FLUSH_SECONDS, COUNTER_RECONCILE_SECONDS)
+
+
+@app.get("/user/{user_id}/counters")
+def get_user_counters(user_id: int):
+    # Maintained counters instead of COUNT queries over ads/inspections on every profile view
+    counter_buffer.start()  # also drains the inspector deltas when no write has started it yet
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
-        # Query to check if the user has made an offer on the specific ad
-        cursor.execute("""
-            SELECT offer_ID, offer_price, offer_status
-            FROM offer
-            WHERE offer_owner = %s AND sent_to = %s
-        """, (user_id, ad_id))
-
-        offer = cursor.fetchone()
-
-        if not offer:
-            raise HTTPException(status_code=404, detail="No offer found for this user on the specified ad")
+        cursor.execute(time_limited("""
+            SELECT o.number_of_ads, o.number_of_done_deals, i.number_of_inspections, i.number_of_certificates
+            FROM user u
+            LEFT JOIN owner_seller o ON o.user_id = u.user_ID
+            LEFT JOIN inspector i ON i.user_id = u.user_ID
+            WHERE u.user_ID = %s
+        """), (user_id,))
+        counters = cursor.fetchone()
+
+        if not counters:
+            raise HTTPException(status_code=404, detail="User not found")
 
-        return {"message": "Offer found", "offer": offer}
+        return {"user_id": user_id, **{name: value for name, value in counters.items() if value is not None}}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
-@app.get("/user/{user_id}/offers")
-async def get_user_offers(user_id: int):
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-
+@app.post("/admin/counters/reconcile")
+def reconcile_counters():
     try:
-        # Query to fetch all offers made by the user along with vehicle details
-        cursor.execute("""
-            SELECT 
-                o.offer_ID, o.offer_date, o.offer_price, o.offer_status, o.counter_offer_price, 
-                o.sent_to, a.ad_ID, a.status AS ad_status, a.post_date, a.expiry_date, 
-                v.vehicle_ID, v.manufacturer, v.model, v.year, v.price, v.mileage, v.condition,
-                v.city, v.state, v.description
+        updated = counter_buffer.reconcile()
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    return {"message": "Counters reconciled", "rows_updated": updated, **counter_buffer.stats()}
+
+
+@app.get("/counters/stats")
+def get_counter_stats():
+    return counter_buffer.stats()
+
+
+
+
+""" ************************************** Archive Backend ************************************************ """
+
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', 180))
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_MAX_BATCHES = 20
+
+# Source tables copied into <table>_history: the column that picks a batch's rows by ad or vehicle ID,
+# and the columns copied, named so a column added to either side cannot shift the others
+ARCHIVE_TABLES = (
+    ("offer", "sent_to", "ad",
+     ("offer_ID", "offer_date", "offer_price", "offer_status", "counter_offer_price", "offer_owner", "sent_to")),
+    ("wishlist", "bookmarked_ad", "ad", ("wishlist_ID", "user_ID", "bookmarked_ad", "date_added")),
+    ("ads", "ad_ID", "ad",
+     ("ad_ID", "post_date", "expiry_date", "is_premium", "views", "status", "owner", "associated_vehicle")),
+    ("vehicle_photos", "vehicle_ID", "vehicle", ("photo_ID", "vehicle_ID", "photo_url")),
+    ("car", "vehicle_ID", "vehicle", ("vehicle_ID", "number_of_doors", "seating_capacity", "transmission")),
+    ("motorcycle", "vehicle_ID", "vehicle", ("vehicle_ID", "engine_capacity", "bike_type")),
+    ("truck", "vehicle_ID", "vehicle", ("vehicle_ID", "cargo_capacity", "has_towing_package")),
+    ("vehicles", "vehicle_ID", "vehicle",
+     ("vehicle_ID", "manufacturer", "model", "year", "price", "mileage", "`condition`",
+      "city", "state", "description", "listing_date", "latitude", "longitude")),
+)
+
+# Ads with auctions or inspected vehicles stay put: their rows would be lost to ON DELETE CASCADE
+ARCHIVE_ELIGIBLE = """
+    a.status IN ('Sold', 'Expired')
+    AND a.post_date < NOW() - INTERVAL %s DAY
+    AND NOT EXISTS (SELECT 1 FROM auctions au WHERE au.belonged_ad = a.ad_ID)
+    AND NOT EXISTS (SELECT 1 FROM inspections i WHERE i.vehicle_ID = a.associated_vehicle)
+"""
+
+# Plain read over idx_ads_status_post_date: no locks, so Active ads stay writable meanwhile
+ARCHIVE_CANDIDATES_QUERY = f"""
+    SELECT a.ad_ID
+    FROM ads a
+    WHERE {ARCHIVE_ELIGIBLE}
+    LIMIT %s
+"""
+
+# Locks just the candidate rows by primary key and re-checks them, since they may have changed
+# between the two reads
+ARCHIVE_LOCK_QUERY = f"""
+    SELECT a.ad_ID, a.associated_vehicle
+    FROM ads a
+    WHERE a.ad_ID IN ({{placeholders}}) AND {ARCHIVE_ELIGIBLE}
+    FOR UPDATE
+"""
+
+
+def archive_batch(connection, retention_days, batch_size):
+    # Moves one batch of ads and everything hanging off them in a single transaction.
+    # Returns the archived ad IDs and how many candidates the batch started from.
+    cursor = connection.cursor()
+    try:
+        cursor.execute(ARCHIVE_CANDIDATES_QUERY, (retention_days, batch_size))
+        candidates = [row[0] for row in cursor.fetchall()]
+        rows = []
+        if candidates:
+            cursor.execute(
+                ARCHIVE_LOCK_QUERY.format(placeholders=", ".join(["%s"] * len(candidates))),
+                (*candidates, retention_days),
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            connection.commit()
+            return [], len(candidates)
+
+        ids = {"ad": [row[0] for row in rows], "vehicle": [row[1] for row in rows]}
+        placeholders = ", ".join(["%s"] * len(rows))
+        for table, key, kind, columns in ARCHIVE_TABLES:
+            column_list = ", ".join(columns)
+            cursor.execute(
+                f"INSERT INTO {table}_history ({column_list}, archived_at) "
+                f"SELECT {column_list}, CURRENT_TIMESTAMP FROM {table} WHERE {key} IN ({placeholders})",
+                ids[kind],
+            )
+
+        # Photo rows are kept in vehicle_photos_history, but their files are not: removed after commit
+        cursor.execute(
+            f"SELECT photo_url FROM vehicle_photos WHERE vehicle_ID IN ({placeholders})", ids["vehicle"]
+        )
+        photo_urls = [row[0] for row in cursor.fetchall()]
+
+        for vehicle_id in ids["vehicle"]:
+            record_listing_change(cursor, vehicle_id, "delete")
+        # Offers, wishlist entries, subtype rows, photos and the listing row follow by cascade
+        cursor.execute(f"DELETE FROM ads WHERE ad_ID IN ({placeholders})", ids["ad"])
+        cursor.execute(f"DELETE FROM vehicles WHERE vehicle_ID IN ({placeholders})", ids["vehicle"])
+        connection.commit()
+    except mysql.connector.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    remove_photo_files(photo_urls)
+    query_cache.invalidate(*(f"ad:{ad_id}" for ad_id in ids["ad"]))
+    publish_listing_changes(connection, ids["vehicle"])
+    return ids["ad"], len(candidates)
+
+
+@app.post("/admin/archive")
+def archive_ads(
+        retention_days: int = ARCHIVE_RETENTION_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        max_batches: int = ARCHIVE_MAX_BATCHES,
+):
+    """
+    Moves Sold and Expired ads posted more than `retention_days` ago, with their vehicles, subtype
+    rows, photo rows, offers and wishlist entries, into the *_history tables; stored photo files
+    are deleted. Works in batches of
+    `batch_size` ads, each its own short transaction, and stops after `max_batches`; call it again
+    (e.g. from cron) until `done` is true.
+    """
+    if retention_days < 0:
+        raise HTTPException(status_code=400, detail="retention_days must not be negative")
+    if batch_size < 1 or batch_size > 5000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 5000")
+
+    connection = get_db_connection()
+    archived = []
+    done = False
+    try:
+        for _ in range(max_batches):
+            batch, candidates = archive_batch(connection, retention_days, batch_size)
+            archived += batch
+            if candidates < batch_size:
+                done = True
+                break
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        connection.close()
+
+    return {"message": "Archive run finished", "archived_ads": len(archived), "done": done}
+
+
+
+
+""" ************************************** Wishlist Backend ************************************************ """
+
+
+@app.post("/user/{user_id}/wishlist/{bookmarked_ad}")
+def add_to_wishlist(user_id: int, bookmarked_ad: int):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        # Check if the ad exists
+        cursor.execute("SELECT * FROM ads WHERE ad_ID = %s", (bookmarked_ad,))
+        ad = cursor.fetchone()
+
+        if not ad:
+            raise HTTPException(status_code=404, detail="Ad not found")
+
+        # Insert into wishlist table
+        cursor.execute("""
+            INSERT INTO wishlist (user_ID, bookmarked_ad)
+            VALUES (%s, %s)
+        """, (user_id, bookmarked_ad))
+
+        connection.commit()
+
+        return {"message": "Ad successfully added to wishlist"}
+
+    except mysql.connector.Error as err:
+        connection.rollback()
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.delete("/user/{user_id}/wishlist/{bookmarked_ad}")
+def remove_from_wishlist(user_id: int, bookmarked_ad: int):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        # Check if the ad exists in the wishlist for the given user
+        cursor.execute("SELECT * FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s", (user_id, bookmarked_ad))
+        wishlist_item = cursor.fetchone()
+
+        if not wishlist_item:
+            raise HTTPException(status_code=404, detail="Ad not found in wishlist")
+
+        # Delete from wishlist table
+        cursor.execute("DELETE FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s", (user_id, bookmarked_ad))
+
+        connection.commit()
+
+        return {"message": "Ad successfully removed from wishlist"}
+
+    except mysql.connector.Error as err:
+        connection.rollback()
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.get("/user/{user_id}/wishlist/{bookmarked_ad}")
+def check_if_bookmarked(user_id: int, bookmarked_ad: int):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        # Check if the ad exists in the wishlist for the given user
+        cursor.execute(
+            time_limited("SELECT * FROM wishlist WHERE user_ID = %s AND bookmarked_ad = %s"), (user_id, bookmarked_ad)
+        )
+        wishlist_item = cursor.fetchone()
+
+        if wishlist_item:
+            return {"message": "Ad is in the wishlist", "isBookmarked": True}
+        else:
+            return {"message": "Ad is not in the wishlist", "isBookmarked": False}
+
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.get("/user/{user_id}/wishlist")
+def get_user_wishlist(user_id: int, shape: str = "flat", fields: Optional[str] = None):
+    validate_listing_shape(shape)
+    names = requested_fields(fields, LISTING_COLUMNS, required=("ad_owner",) if shape == "normalized" else ())
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        # Only the bookmarked ad IDs come from MySQL; the listing details are joined in memory
+        cursor.execute(
+            time_limited("SELECT bookmarked_ad FROM wishlist WHERE user_ID = %s ORDER BY wishlist_ID"), (user_id,)
+        )
+        ad_ids = [row[0] for row in cursor.fetchall()]
+
+        wishlist_items = ensure_listing_catalog().rows_for_ads(ad_ids, names) if ad_ids else []
+
+        if not wishlist_items:
+            return {"message": "No items in wishlist"}
+
+        if shape == "normalized":
+            wishlist_items, owners = sideload_owners(wishlist_items)
+            return measured_json_response(
+                {"message": "Wishlist items fetched successfully", "wishlist": wishlist_items, "owners": owners}
+            )
+
+        return measured_json_response({"message": "Wishlist items fetched successfully", "wishlist": wishlist_items})
+
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+""" ************************************** Offer Backend ************************************************ """
+
+
+# Fields served by the offer listing endpoints, usable with ?fields=
+OFFER_VEHICLE_COLUMNS = {
+    "ad_ID": "a.ad_ID",
+    "ad_status": "a.status AS ad_status",
+    "post_date": "a.post_date",
+    "expiry_date": "a.expiry_date",
+    **{
+        name: f"v.`{name}`" for name in (
+            "vehicle_ID", "manufacturer", "model", "year", "price", "mileage", "condition",
+            "city", "state", "description",
+        )
+    },
+}
+
+USER_OFFER_COLUMNS = {
+    **{
+        name: f"o.{name}" for name in (
+            "offer_ID", "offer_date", "offer_price", "offer_status", "counter_offer_price", "sent_to",
+        )
+    },
+    **OFFER_VEHICLE_COLUMNS,
+}
+
+AD_OFFER_COLUMNS = {
+    **{
+        name: f"o.{name}" for name in (
+            "offer_ID", "offer_date", "offer_price", "offer_status", "counter_offer_price", "offer_owner",
+        )
+    },
+    "first_name": "u.first_name",
+    "last_name": "u.last_name",
+    "offer_owner_email": "u.email AS offer_owner_email",
+    **OFFER_VEHICLE_COLUMNS,
+}
+
+
+@app.post("/create_offer/{offer_owner}/{sent_to}/{offer_price}")
+def create_offer(offer_owner: int, sent_to: int, offer_price: float):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        # Insert the new offer into the offer table
+        cursor.execute("""
+            INSERT INTO offer (offer_price, offer_owner, sent_to)
+            VALUES (%s, %s, %s)
+        """, (offer_price, offer_owner, sent_to))
+
+        connection.commit()
+        query_cache.invalidate(f"ad:{sent_to}")
+
+        return {"message": "Offer created successfully"}
+
+    except mysql.connector.Error as err:
+        connection.rollback()
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.get("/check_offer/{user_id}/{ad_id}")
+@cached("user_offer", tags=lambda user_id, ad_id: (f"user:{user_id}", f"ad:{ad_id}"))
+def check_user_offer(user_id: int, ad_id: int):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+
+    try:
+        # Query to check if the user has made an offer on the specific ad
+        cursor.execute(time_limited("""
+            SELECT offer_ID, offer_price, offer_status
+            FROM offer
+            WHERE offer_owner = %s AND sent_to = %s
+        """), (user_id, ad_id))
+
+        offer = cursor.fetchone()
+
+        if not offer:
+            raise HTTPException(status_code=404, detail="No offer found for this user on the specified ad")
+
+        return {"message": "Offer found", "offer": offer}
+
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.get("/user/{user_id}/offers")
+def get_user_offers(user_id: int, fields: Optional[str] = None):
+    select_list = select_fields(fields, USER_OFFER_COLUMNS)
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+
+    try:
+        # Only join the ad and vehicle when one of their fields was requested
+        joins = ""
+        if uses_alias(select_list, "a") or uses_alias(select_list, "v"):
+            joins += " JOIN ads a ON o.sent_to = a.ad_ID"
+        if uses_alias(select_list, "v"):
+            joins += " JOIN vehicles v ON a.associated_vehicle = v.vehicle_ID"
+
+        # Query to fetch all offers made by the user along with vehicle details
+        cursor.execute(time_limited(f"""
+            SELECT {select_list}
             FROM 
                 offer o
-            JOIN 
-                ads a ON o.sent_to = a.ad_ID
-            JOIN 
-                vehicles v ON a.associated_vehicle = v.vehicle_ID
+                {joins}
             WHERE 
                 o.offer_owner = %s
             ORDER BY 
                 o.offer_date DESC
-        """, (user_id,))
+        """), (user_id,))
 
         offers = cursor.fetchall()
 
@@ -1115,39 +3354,39 @@ async def get_user_offers(user_id: int):
         return {"message": "Offers fetched successfully", "offers": offers}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/ad/{ad_id}/offers")
-async def get_offers_for_ad(ad_id: int):
+def get_offers_for_ad(ad_id: int, fields: Optional[str] = None):
+    select_list = select_fields(fields, AD_OFFER_COLUMNS)
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
 
     try:
+        # Only join the tables whose fields were requested
+        joins = ""
+        if uses_alias(select_list, "a") or uses_alias(select_list, "v"):
+            joins += " JOIN ads a ON o.sent_to = a.ad_ID"
+        if uses_alias(select_list, "v"):
+            joins += " JOIN vehicles v ON a.associated_vehicle = v.vehicle_ID"
+        if uses_alias(select_list, "u"):
+            joins += " JOIN user u ON o.offer_owner = u.user_ID"
+
         # Query to fetch all offers made to the specific ad
-        cursor.execute("""
-            SELECT 
-                o.offer_ID, o.offer_date, o.offer_price, o.offer_status, o.counter_offer_price, 
-                o.offer_owner, u.first_name, u.last_name, u.email AS offer_owner_email,
-                a.ad_ID, a.status AS ad_status, a.post_date, a.expiry_date, 
-                v.vehicle_ID, v.manufacturer, v.model, v.year, v.price, v.mileage, v.condition,
-                v.city, v.state, v.description
+        cursor.execute(time_limited(f"""
+            SELECT {select_list}
             FROM 
                 offer o
-            JOIN 
-                ads a ON o.sent_to = a.ad_ID
-            JOIN 
-                vehicles v ON a.associated_vehicle = v.vehicle_ID
-            JOIN 
-                user u ON o.offer_owner = u.user_ID
+                {joins}
             WHERE 
                 o.sent_to = %s
             ORDER BY 
                 o.offer_date DESC
-        """, (ad_id,))
+        """), (ad_id,))
 
         offers = cursor.fetchall()
 
@@ -1157,48 +3396,93 @@ async def get_offers_for_ad(ad_id: int):
         return {"message": "Offers fetched successfully", "offers": offers}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
+def offer_cache_tags(cursor, offer_id):
+    # Cache tags of the ad an offer belongs to, looked up before the offer is changed
+    cursor.execute("SELECT sent_to FROM offer WHERE offer_ID = %s", (offer_id,))
+    row = cursor.fetchone()
+    return (f"ad:{row[0]}",) if row else ()
+
+
 @app.put("/accept_offer/{offer_id}")
-async def accept_offer(offer_id: int):
+def accept_offer(offer_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
-        # Update the offer status to 'accepted'
-        cursor.execute("""
-            UPDATE offer
-            SET offer_status = 'accepted'
-            WHERE offer_ID = %s
-        """, (offer_id,))
+        cursor.execute("SELECT sent_to FROM offer WHERE offer_ID = %s", (offer_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Offer not found")
+        ad_id = row[0]
 
-        # Check if any rows were affected
-        if cursor.rowcount == 0:
+        # Lock the ad first so concurrent accepts on the same ad run one after the other
+        cursor.execute("SELECT ad_ID FROM ads WHERE ad_ID = %s FOR UPDATE", (ad_id,))
+        cursor.fetchall()
+
+        cursor.execute("SELECT offer_status FROM offer WHERE offer_ID = %s FOR UPDATE", (offer_id,))
+        row = cursor.fetchone()
+        if not row:
             raise HTTPException(status_code=404, detail="Offer not found")
+        if row[0] == 'rejected':
+            raise HTTPException(status_code=409, detail="Offer has already been rejected")
+
+        cursor.execute("""
+            SELECT offer_ID FROM offer
+            WHERE sent_to = %s AND offer_status = 'accepted' AND offer_ID <> %s
+            LIMIT 1
+        """, (ad_id, offer_id))
+        if cursor.fetchone():
+            raise HTTPException(status_code=409, detail="Another offer on this ad has already been accepted")
+
+        # Competing offers come off the (sent_to, offer_status) index; the locking read also
+        # blocks new pending offers on this ad until we commit
+        cursor.execute("""
+            SELECT offer_ID FROM offer
+            WHERE sent_to = %s AND offer_status = 'pending' AND offer_ID <> %s
+            FOR UPDATE
+        """, (ad_id, offer_id))
+        rejected_ids = [offer[0] for offer in cursor.fetchall()]
+
+        cursor.execute("UPDATE offer SET offer_status = 'accepted' WHERE offer_ID = %s", (offer_id,))
+        if rejected_ids:
+            cursor.execute("""
+                UPDATE offer
+                SET offer_status = 'rejected'
+                WHERE sent_to = %s AND offer_status = 'pending' AND offer_ID <> %s
+            """, (ad_id, offer_id))
 
         # Commit the transaction
         connection.commit()
+        query_cache.invalidate(f"ad:{ad_id}")
 
-        return {"message": "Offer accepted successfully"}
+        return {
+            "message": "Offer accepted successfully",
+            "accepted_offer_id": offer_id,
+            "rejected_offer_ids": rejected_ids,
+        }
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.put("/reject_offer/{offer_id}")
-async def reject_offer(offer_id: int):
+def reject_offer(offer_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
+        cache_tags = offer_cache_tags(cursor, offer_id)
+
         # Update the offer status to 'rejected'
         cursor.execute("""
             UPDATE offer
@@ -1212,23 +3496,26 @@ async def reject_offer(offer_id: int):
 
         # Commit the transaction
         connection.commit()
+        query_cache.invalidate(*cache_tags)
 
         return {"message": "Offer rejected successfully"}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.put("/counter_offer/{offer_id}/{counter_offer_price}")
-async def counter_offer(offer_id: int, counter_offer_price: float):
+def counter_offer(offer_id: int, counter_offer_price: float):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
+        cache_tags = offer_cache_tags(cursor, offer_id)
+
         # Update the counter offer price for the given offer
         cursor.execute("""
             UPDATE offer
@@ -1242,23 +3529,26 @@ async def counter_offer(offer_id: int, counter_offer_price: float):
 
         # Commit the transaction
         connection.commit()
+        query_cache.invalidate(*cache_tags)
 
         return {"message": f"Counter offer updated to ${counter_offer_price:.2f} successfully"}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.delete("/delete_offer/{offer_id}")
-async def delete_offer(offer_id: int):
+def delete_offer(offer_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
+        cache_tags = offer_cache_tags(cursor, offer_id)
+
         # Delete the offer
         cursor.execute("""
             DELETE FROM offer
@@ -1271,12 +3561,13 @@ async def delete_offer(offer_id: int):
 
         # Commit the transaction
         connection.commit()
+        query_cache.invalidate(*cache_tags)
 
         return {"message": "Offer deleted successfully"}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1284,9 +3575,46 @@ async def delete_offer(offer_id: int):
 
 """ ************************************** Transaction Backend ************************************************ """
 
+# An ad is live in ads or archived in ads_history, under the same ad_ID and never in both. Queries
+# that follow transactions.belonged_ad resolve it against both through the helpers below; a UNION
+# view would be materialized whole by MySQL instead of seeked per ad.
+AD_TABLES = ("ads", "ads_history")
+
+
+def resolved_ad_joins(ad_id):
+    # LEFT JOINs of the live (a) or archived (ah) ad with ID ad_id, and its vehicle (v or vh)
+    return f"""
+    LEFT JOIN ads a ON a.ad_ID = {ad_id}
+    LEFT JOIN ads_history ah ON a.ad_ID IS NULL AND ah.ad_ID = {ad_id}
+    LEFT JOIN vehicles v ON v.vehicle_ID = a.associated_vehicle
+    LEFT JOIN vehicles_history vh ON v.vehicle_ID IS NULL AND vh.vehicle_ID = ah.associated_vehicle
+    """
+
+
+def resolved(column, live="a", archived="ah"):
+    # A column of whichever of the joined live / archived rows exists
+    return f"COALESCE({live}.{column}, {archived}.{column})"
+
+
+def ad_sold_price(ad_id, asking_price):
+    # Sold price of an ad: its purchase transaction if there is one, otherwise the asking price
+    return f"""COALESCE(
+        (SELECT MAX(t.price) FROM transactions t
+         WHERE t.belonged_ad = {ad_id} AND t.transaction_type = 'purchase'),
+        {asking_price}
+    )"""
+
+
+def ad_exists(cursor, ad_id):
+    cursor.execute(
+        " UNION ALL ".join(f"(SELECT 1 FROM {table} WHERE ad_ID = %s)" for table in AD_TABLES) + " LIMIT 1",
+        (ad_id,) * len(AD_TABLES),
+    )
+    return bool(cursor.fetchall())
+
 
 @app.post("/create_transaction/")
-async def create_transaction(
+def create_transaction(
         price: float,
         payment_method: str,
         transaction_type: str,
@@ -1313,6 +3641,10 @@ async def create_transaction(
         if transaction_type not in valid_transaction_types:
             raise HTTPException(status_code=400, detail="Invalid transaction type")
 
+        # belonged_ad has no foreign key (archived ads keep their transactions), so check it here
+        if belonged_ad is not None and not ad_exists(cursor, belonged_ad):
+            raise HTTPException(status_code=404, detail="Ad not found")
+
         # Insert a new transaction into the transactions table
         cursor.execute("""
             INSERT INTO transactions (
@@ -1322,30 +3654,33 @@ async def create_transaction(
 
         # Commit the transaction
         connection.commit()
+        if belonged_ad is not None:
+            query_cache.invalidate(f"ad:{belonged_ad}")
 
         return {"message": "Transaction created successfully"}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/check_existing_transaction/{ad_id}")
-async def check_existing_transaction(ad_id: int):
+@cached("ad_transaction_exists", tags=lambda ad_id: (f"ad:{ad_id}",))
+def check_existing_transaction(ad_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
         # Check if there is any transaction for the given ad_id
-        cursor.execute("""
+        cursor.execute(time_limited("""
             SELECT 1
             FROM transactions
             WHERE belonged_ad = %s
             LIMIT 1
-        """, (ad_id,))
+        """), (ad_id,))
 
         # If a row is found, it means a transaction exists
         transaction_exists = cursor.fetchone() is not None
@@ -1353,89 +3688,131 @@ async def check_existing_transaction(ad_id: int):
         return {"transaction_exists": transaction_exists}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
+# Column groups nested under each party in the transaction response
+TRANSACTION_PARTY_FIELDS = ("user_ID", "first_name", "last_name", "phone_number", "email")
+TRANSACTION_PAGE_SIZE = 50
+TRANSACTION_MAX_PAGE_SIZE = 500
+
+
+# The transactions on the user's ads, live and archived; one seek per table
+USER_TRANSACTIONS_OWNER_SEEKS = "".join(f"""
+        UNION
+        (SELECT ot.transaction_ID
+         FROM {table} oa
+         JOIN transactions ot ON ot.belonged_ad = oa.ad_ID
+         WHERE oa.owner = %s AND ot.transaction_ID < %s
+         ORDER BY ot.transaction_ID DESC
+         LIMIT %s)""" for table in AD_TABLES)
+
+# Each side of the UNION is a single index seek (transactions.paid_by, and ads.owner or
+# ads_history.owner -> transactions.belonged_ad), so MySQL never has to scan transactions
+# to evaluate an OR across the LEFT JOIN. The joins only run for the page.
+USER_TRANSACTIONS_QUERY = f"""
+    SELECT
+        t.transaction_ID, t.transaction_date, t.price, t.payment_method,
+        t.payment_status, t.transaction_type, t.review, t.belonged_ad,
+        t.paid_by AS payer_user_ID, pb.first_name AS payer_first_name, pb.last_name AS payer_last_name,
+        pb.phone_number AS payer_phone_number, pb.email AS payer_email,
+        t.approved_by AS approver_user_ID, ab.first_name AS approver_first_name,
+        ab.last_name AS approver_last_name, ab.phone_number AS approver_phone_number,
+        ab.email AS approver_email,
+        {resolved("owner")} AS owner_user_ID, os.first_name AS owner_first_name,
+        os.last_name AS owner_last_name, os.phone_number AS owner_phone_number, os.email AS owner_email,
+        {resolved("associated_vehicle")} AS associated_vehicle,
+        {resolved("status")} AS ad_status, ah.ad_ID IS NOT NULL AS ad_archived,
+        {resolved("manufacturer", "v", "vh")} AS manufacturer,
+        {resolved("model", "v", "vh")} AS model, {resolved("year", "v", "vh")} AS year
+    FROM (
+        (SELECT transaction_ID
+         FROM transactions
+         WHERE paid_by = %s AND transaction_ID < %s
+         ORDER BY transaction_ID DESC
+         LIMIT %s)
+        {USER_TRANSACTIONS_OWNER_SEEKS}
+    ) page
+    JOIN transactions t ON t.transaction_ID = page.transaction_ID
+    {resolved_ad_joins("t.belonged_ad")}
+    LEFT JOIN user pb ON t.paid_by = pb.user_ID
+    LEFT JOIN user ab ON t.approved_by = ab.user_ID
+    LEFT JOIN user os ON {resolved("owner")} = os.user_ID
+    ORDER BY t.transaction_ID DESC
+    LIMIT %s
+"""
+
+
+def user_transactions_params(user_id, cursor_id, limit):
+    # Payer seek, one owner seek per AD_TABLES entry, then the page limit
+    return (user_id, cursor_id, limit) * (1 + len(AD_TABLES)) + (limit,)
+
+
+def pick_prefixed(row, prefix, fields):
+    return {field: row[f"{prefix}{field}"] for field in fields}
+
+
 @app.get("/user_transactions/{user_id}")
-async def get_user_transactions(user_id: int):
+# Plain def so FastAPI runs it in the threadpool instead of blocking the event loop
+def get_user_transactions(user_id: int, limit: int = TRANSACTION_PAGE_SIZE, before: Optional[int] = None):
+    """
+    Returns the user's transactions (as payer or as ad owner), newest first.
+    Pages are keyset based: pass the returned next_cursor as `before` to get the next page.
+    """
+    if limit < 1 or limit > TRANSACTION_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {TRANSACTION_MAX_PAGE_SIZE}")
+
+    # Without a cursor, start above any existing transaction ID
+    cursor_id = before if before is not None else 2147483647
+
     connection = get_db_connection()
-    cursor = connection.cursor()
+    cursor = connection.cursor(dictionary=True)
 
     try:
-        # Fetch transactions involving the user
-        cursor.execute("""
-            SELECT 
-                t.transaction_ID, t.transaction_date, t.price, t.payment_method, 
-                t.payment_status, t.transaction_type, t.review, t.belonged_ad, 
-                t.paid_by, pb.first_name AS payer_first_name, pb.last_name AS payer_last_name, 
-                pb.phone_number AS payer_phone, pb.email AS payer_email, 
-                t.approved_by, ab.first_name AS approver_first_name, ab.last_name AS approver_last_name,
-                ab.phone_number AS approver_phone, ab.email AS approver_email,
-                a.owner, os.first_name AS owner_first_name, os.last_name AS owner_last_name, 
-                os.phone_number AS owner_phone, os.email AS owner_email, 
-                a.associated_vehicle, a.status AS ad_status, 
-                v.manufacturer, v.model, v.year
-            FROM transactions t
-            LEFT JOIN ads a ON t.belonged_ad = a.ad_ID
-            LEFT JOIN user pb ON t.paid_by = pb.user_ID
-            LEFT JOIN user ab ON t.approved_by = ab.user_ID
-            LEFT JOIN user os ON a.owner = os.user_ID
-            LEFT JOIN vehicles v ON a.associated_vehicle = v.vehicle_ID
-            WHERE t.paid_by = %s OR a.owner = %s
-        """, (user_id, user_id))
+        cursor.execute(
+            time_limited(USER_TRANSACTIONS_QUERY), user_transactions_params(user_id, cursor_id, limit)
+        )
         transactions = cursor.fetchall()
 
         # Structure the results to return
-        transactions_data = []
-        for transaction in transactions:
-            transactions_data.append({
-                "transaction_ID": transaction[0],
-                "transaction_date": transaction[1],
-                "price": transaction[2],
-                "payment_method": transaction[3],
-                "payment_status": transaction[4],
-                "transaction_type": transaction[5],
-                "review": transaction[6],
-                "belonged_ad": transaction[7],
-                "payer_details": {
-                    "user_ID": transaction[8],
-                    "first_name": transaction[9],
-                    "last_name": transaction[10],
-                    "phone_number": transaction[11],
-                    "email": transaction[12]
-                },
-                "approver_details": {
-                    "user_ID": transaction[13],
-                    "first_name": transaction[14],
-                    "last_name": transaction[15],
-                    "phone_number": transaction[16],
-                    "email": transaction[17]
-                } if transaction[13] else None,
-                "owner_details": {
-                    "user_ID": transaction[18],
-                    "first_name": transaction[19],
-                    "last_name": transaction[20],
-                    "phone_number": transaction[21],
-                    "email": transaction[22]
-                },
+        transactions_data = [
+            {
+                "transaction_ID": row["transaction_ID"],
+                "transaction_date": row["transaction_date"],
+                "price": row["price"],
+                "payment_method": row["payment_method"],
+                "payment_status": row["payment_status"],
+                "transaction_type": row["transaction_type"],
+                "review": row["review"],
+                "belonged_ad": row["belonged_ad"],
+                "payer_details": pick_prefixed(row, "payer_", TRANSACTION_PARTY_FIELDS),
+                "approver_details": pick_prefixed(row, "approver_", TRANSACTION_PARTY_FIELDS)
+                if row["approver_user_ID"] else None,
+                "owner_details": pick_prefixed(row, "owner_", TRANSACTION_PARTY_FIELDS),
                 "ad_details": {
-                    "associated_vehicle": transaction[23],
-                    "ad_status": transaction[24],
+                    "associated_vehicle": row["associated_vehicle"],
+                    "ad_status": row["ad_status"],
+                    "archived": bool(row["ad_archived"]),
                     "vehicle_details": {
-                        "manufacturer": transaction[25],
-                        "model": transaction[26],
-                        "year": transaction[27]
+                        "manufacturer": row["manufacturer"],
+                        "model": row["model"],
+                        "year": row["year"]
                     }
                 }
-            })
+            }
+            for row in transactions
+        ]
+
+        # A full page means there may be more rows below the last ID
+        next_cursor = transactions_data[-1]["transaction_ID"] if len(transactions_data) == limit else None
 
-        return {"transactions": transactions_data}
+        return {"transactions": transactions_data, "next_cursor": next_cursor}
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1451,7 +3828,7 @@ class ReviewCreateRequest(BaseModel):
     transaction_id: int  # Added the transaction_id field
 
 @app.post("/create_review/")
-async def create_review(review: ReviewCreateRequest):
+def create_review(review: ReviewCreateRequest):
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -1479,36 +3856,39 @@ async def create_review(review: ReviewCreateRequest):
         # Commit the transaction
         connection.commit()
 
+        # The rating trigger changed the evaluated user's profile
+        query_cache.invalidate(f"user:{review.evaluated_user}")
+
         return {"message": "Review created successfully", "review_id": review_id}
 
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
 
 @app.get("/user_reviews/{user_id}")
-async def get_user_reviews(user_id: int):
+def get_user_reviews(user_id: int):
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)  # Use dictionary for easier column name access
 
     try:
         # Fetch sent reviews (reviews where user is the reviewer)
-        cursor.execute("""
+        cursor.execute(time_limited("""
             SELECT review_ID AS review_id, rating, comment, review_date, reviewer, evaluated_user
             FROM reviews
             WHERE reviewer = %s
-        """, (user_id,))
+        """), (user_id,))
         sent_reviews = cursor.fetchall()
 
         # Fetch received reviews (reviews where user is the evaluated_user)
-        cursor.execute("""
+        cursor.execute(time_limited("""
             SELECT review_ID AS review_id, rating, comment, review_date, reviewer, evaluated_user
             FROM reviews
             WHERE evaluated_user = %s
-        """, (user_id,))
+        """), (user_id,))
         received_reviews = cursor.fetchall()
 
         # Combine the results
@@ -1524,7 +3904,7 @@ async def get_user_reviews(user_id: int):
         return all_reviews
 
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1541,52 +3921,197 @@ class AdminUserUpdateRequest(BaseModel):
     rating: Optional[float] = None
     active: Optional[bool] = None
 
+# Fields served by the admin user endpoints, usable with ?fields=
+ADMIN_USER_COLUMNS = {
+    name: name for name in (
+        "user_ID", "first_name", "last_name", "email",
+        "phone_number", "address", "rating", "active", "join_date",
+    )
+}
+
 # 1. GET ALL USERS
 @app.get("/admin/users")
-def get_all_users():
+def get_all_users(fields: Optional[str] = None):
     """
     Retrieves all users with basic info.
     NOTE: We are NOT restricting this endpoint to admin only, for your testing purposes.
     """
+    select_list = select_fields(fields, ADMIN_USER_COLUMNS)
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT
-                user_ID, first_name, last_name, email,
-                phone_number, address, rating, active, join_date
+        cursor.execute(time_limited(f"""
+            SELECT {select_list}
             FROM user
-        """)
+        """))
         users = cursor.fetchall()
         return {"users": users}
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
 
+# Prefix-searchable columns (each backed by an index) and keyset sort columns (all NOT NULL)
+ADMIN_SEARCH_FIELDS = ("email", "first_name", "last_name", "phone_number")
+ADMIN_SORT_COLUMNS = ("user_ID", "email", "first_name", "last_name")
+ADMIN_SEARCH_PAGE_SIZE = 50
+ADMIN_SEARCH_MAX_PAGE_SIZE = 500
+
+# Same precedence as /login; users in none of the role tables are buyer-sellers
+ADMIN_ROLE_SQL = """CASE
+        WHEN EXISTS (SELECT 1 FROM inspector r WHERE r.user_id = u.user_ID) THEN 'inspector'
+        WHEN EXISTS (SELECT 1 FROM owner_seller r WHERE r.user_id = u.user_ID) THEN 'owner_seller'
+        WHEN EXISTS (SELECT 1 FROM admin r WHERE r.user_id = u.user_ID) THEN 'admin'
+        ELSE 'buyer-seller'
+    END"""
+ADMIN_SEARCH_COLUMNS = {
+    **{name: f"u.{name}" for name in ADMIN_USER_COLUMNS},
+    "role": f"{ADMIN_ROLE_SQL} AS role",
+}
+
+
+def like_prefix(text):
+    # LIKE pattern matching values that start with text, with its own wildcards escaped
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_page_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def user_filter_conditions(q, field, active, role):
+    # WHERE conditions (over user u) and parameters for the admin search filters
+    if field != "any" and field not in ADMIN_SEARCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be 'any' or one of: {', '.join(ADMIN_SEARCH_FIELDS)}")
+    if role is not None and role not in ("inspector", "owner_seller", "admin", "buyer-seller"):
+        raise HTTPException(status_code=400, detail="role must be inspector, owner_seller, admin or buyer-seller")
+
+    conditions, params = [], []
+    if q:
+        searched = ADMIN_SEARCH_FIELDS if field == "any" else (field,)
+        # One LIKE 'prefix%' per indexed column; MySQL merges the index ranges for an OR
+        conditions.append("(" + " OR ".join(f"u.{name} LIKE %s" for name in searched) + ")")
+        params += [like_prefix(q)] * len(searched)
+    if active is not None:
+        conditions.append("u.active = %s")
+        params.append(active)
+    if role == "buyer-seller":
+        conditions.append(" AND ".join(
+            f"NOT EXISTS (SELECT 1 FROM {table} r WHERE r.user_id = u.user_ID)"
+            for table in ("inspector", "owner_seller", "admin")
+        ))
+    elif role is not None:
+        conditions.append(f"EXISTS (SELECT 1 FROM {role} r WHERE r.user_id = u.user_ID)")
+    return conditions, params
+
+
+# 1b. SEARCH USERS (registered before /admin/users/{user_id}, which would otherwise match "search")
+@app.get("/admin/users/search")
+def search_users(
+        q: Optional[str] = None,
+        field: str = "any",
+        active: Optional[bool] = None,
+        role: Optional[str] = None,
+        sort: str = "user_ID",
+        order: str = "asc",
+        limit: int = ADMIN_SEARCH_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+):
+    """
+    Prefix search over email, first_name, last_name and phone_number (or one of them with `field`),
+    filtered by active flag and role, sorted by `sort` with user_ID as tie-breaker. Pages are keyset
+    based: pass the returned next_cursor as `cursor` to get the next page.
+    """
+    if sort not in ADMIN_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(ADMIN_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if limit < 1 or limit > ADMIN_SEARCH_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ADMIN_SEARCH_MAX_PAGE_SIZE}")
+
+    # The sort column and user_ID are always selected: the next cursor is built from them
+    names = requested_fields(fields, ADMIN_SEARCH_COLUMNS, required=("user_ID", sort))
+    select_list = ", ".join(ADMIN_SEARCH_COLUMNS[name] for name in names)
+
+    conditions, params = user_filter_conditions(q, field, active, role)
+
+    comparison = ">" if order == "asc" else "<"
+    if cursor is not None:
+        after = decode_page_cursor(cursor)
+        # [user_ID] or [sort value, user_ID]; the sortable columns other than user_ID are all strings
+        if (not isinstance(after, list) or len(after) != (1 if sort == "user_ID" else 2)
+                or type(after[-1]) is not int or (sort != "user_ID" and not isinstance(after[0], str))):
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+        if sort == "user_ID":
+            conditions.append(f"u.user_ID {comparison} %s")
+            params.append(after[-1])
+        else:
+            # Spelled out rather than (u.sort, u.user_ID) > (%s, %s), which MySQL may not turn into
+            # an index range
+            conditions.append(
+                f"(u.{sort} {comparison} %s OR (u.{sort} = %s AND u.user_ID {comparison} %s))"
+            )
+            params += [after[0], after[0], after[1]]
+
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    order_by = f"u.user_ID {order}" if sort == "user_ID" else f"u.{sort} {order}, u.user_ID {order}"
+
+    connection = get_db_connection()
+    db_cursor = connection.cursor(dictionary=True)
+    try:
+        # One row past the page tells whether there is a next one
+        db_cursor.execute(time_limited(f"""
+            SELECT {select_list}
+            FROM user u
+            {where}
+            ORDER BY {order_by}
+            LIMIT %s
+        """), (*params, limit + 1))
+        users = db_cursor.fetchall()
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        db_cursor.close()
+        connection.close()
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_cursor = encode_page_cursor([last["user_ID"]] if sort == "user_ID" else [last[sort], last["user_ID"]])
+
+    return {"users": users, "next_cursor": next_cursor}
+
 # 2. (Optional) GET USER DETAILS
 @app.get("/admin/users/{user_id}")
-def get_user_details(user_id: int):
+def get_user_details(user_id: int, fields: Optional[str] = None):
     """
     Retrieves detailed info for a specific user by ID.
     """
+    select_list = select_fields(fields, ADMIN_USER_COLUMNS)
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT
-                user_ID, first_name, last_name, email,
-                phone_number, address, rating, active, join_date
+        cursor.execute(time_limited(f"""
+            SELECT {select_list}
             FROM user
             WHERE user_ID = %s
-        """, (user_id,))
+        """), (user_id,))
         user = cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return {"user": user}
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1638,15 +4163,19 @@ def admin_update_user(user_id: int, user_update: AdminUserUpdateRequest):
             WHERE user_ID = %s
         """
         cursor.execute(query, tuple(values))
+        updated_rows = cursor.rowcount
+        refresh_listing_owner(cursor, user_id)
         connection.commit()
+        query_cache.invalidate(f"user:{user_id}")
+        publish_owner_listing_changes(connection, user_id)
 
-        if cursor.rowcount == 0:
+        if updated_rows == 0:
             raise HTTPException(status_code=404, detail="User not found or no changes made")
 
         return {"message": "User updated successfully"}
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1667,6 +4196,7 @@ def deactivate_user(user_id: int):
             WHERE user_ID = %s
         """, (user_id,))
         connection.commit()
+        query_cache.invalidate(f"user:{user_id}")
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="User not found or already inactive")
@@ -1674,7 +4204,7 @@ def deactivate_user(user_id: int):
         return {"message": "User account deactivated"}
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1694,6 +4224,7 @@ def reactivate_user(user_id: int):
             WHERE user_ID = %s
         """, (user_id,))
         connection.commit()
+        query_cache.invalidate(f"user:{user_id}")
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="User not found or already active")
@@ -1701,7 +4232,7 @@ def reactivate_user(user_id: int):
         return {"message": "User account reactivated"}
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
@@ -1725,6 +4256,7 @@ def reset_user_password(user_id: int):
             WHERE user_ID = %s
         """, (hashed_password, user_id))
         connection.commit()
+        query_cache.invalidate(f"user:{user_id}")
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="User not found")
@@ -1735,7 +4267,2106 @@ def reset_user_password(user_id: int):
         }
     except mysql.connector.Error as err:
         connection.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {err}")
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# 7. BULK OPERATIONS
+BULK_MAX_USERS = int(os.getenv('BULK_MAX_USERS', 10000))
+# Users locked and updated per transaction
+BULK_CHUNK_SIZE = 500
+BULK_HASH_WORKERS = int(os.getenv('BULK_HASH_WORKERS', min(8, os.cpu_count() or 1)))
+
+
+class BulkUserFilter(BaseModel):
+    # Same filters as /admin/users/search
+    q: Optional[str] = None
+    field: str = "any"
+    active: Optional[bool] = None
+    role: Optional[str] = None
+
+
+class BulkUserSelection(BaseModel):
+    user_ids: Optional[list[int]] = None
+    filter: Optional[BulkUserFilter] = None
+
+
+class BulkUserUpdateRequest(BulkUserSelection):
+    changes: AdminUserUpdateRequest
+
+
+def resolve_bulk_users(cursor, selection: BulkUserSelection):
+    # The selected user IDs, in ascending order (the order rows get locked in)
+    if (selection.user_ids is None) == (selection.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either user_ids or filter")
+
+    if selection.user_ids is not None:
+        user_ids = sorted(set(selection.user_ids))
+    else:
+        flt = selection.filter
+        conditions, params = user_filter_conditions(flt.q, flt.field, flt.active, flt.role)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        cursor.execute(f"SELECT u.user_ID FROM user u {where} ORDER BY u.user_ID LIMIT %s", (*params, BULK_MAX_USERS + 1))
+        user_ids = [row[0] for row in cursor.fetchall()]
+
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="No users selected")
+    if len(user_ids) > BULK_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_USERS} users per bulk operation")
+    return user_ids
+
+
+def run_bulk_user_operation(selection: BulkUserSelection, apply_chunk, refresh_listings=False, prepare=None):
+    """
+    Runs apply_chunk(cursor, chunk, found) over the selected users, BULK_CHUNK_SIZE at a time. Each
+    chunk is one transaction: its user rows are locked, apply_chunk issues set-based statements
+    and returns {user_id: outcome}; IDs that don't exist are reported as not_found. Slow per-user
+    work goes in prepare(chunk), which runs before the chunk's rows are locked.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    outcomes = {}
+    try:
+        user_ids = resolve_bulk_users(cursor, selection)
+        for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+            chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+            if prepare:
+                prepare(chunk)
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT user_ID, active FROM user WHERE user_ID IN ({placeholders}) FOR UPDATE", chunk)
+            found = {row[0]: row for row in cursor.fetchall()}
+
+            results = apply_chunk(cursor, [user_id for user_id in chunk if user_id in found], found) if found else {}
+            if refresh_listings and found:
+                refresh_listing_owners(cursor, list(found))
+            connection.commit()
+
+            query_cache.invalidate(*(f"user:{user_id}" for user_id in found))
+            if refresh_listings and found:
+                publish_owners_listing_changes(connection, list(found))
+            for user_id in chunk:
+                outcomes[user_id] = results.get(user_id, "not_found")
+    except mysql.connector.Error as err:
+        connection.rollback()
+        # Chunks committed before the error stay applied; report how far the run got
+        print(f"Bulk user operation failed after {len(outcomes)} users: {err}")
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+    summary = defaultdict(int)
+    for outcome in outcomes.values():
+        summary[outcome] += 1
+    return {"summary": dict(summary), "results": outcomes}
+
+
+def set_active_chunk(active):
+    def apply_chunk(cursor, user_ids, found):
+        changed = [user_id for user_id in user_ids if bool(found[user_id][1]) != active]
+        if changed:
+            placeholders = ", ".join(["%s"] * len(changed))
+            cursor.execute(f"UPDATE user SET active = %s WHERE user_ID IN ({placeholders})", (active, *changed))
+        done, unchanged = ("reactivated", "already_active") if active else ("deactivated", "already_inactive")
+        return {user_id: done if user_id in changed else unchanged for user_id in user_ids}
+
+    return apply_chunk
+
+
+@app.post("/admin/users/bulk/deactivate")
+def bulk_deactivate_users(selection: BulkUserSelection):
+    return run_bulk_user_operation(selection, set_active_chunk(False))
+
+
+@app.post("/admin/users/bulk/reactivate")
+def bulk_reactivate_users(selection: BulkUserSelection):
+    return run_bulk_user_operation(selection, set_active_chunk(True))
+
+
+@app.post("/admin/users/bulk/reset-password")
+def bulk_reset_user_passwords(selection: BulkUserSelection):
+    """
+    Gives every selected user a new random password. bcrypt is deliberately slow, so the hashes
+    are computed on a thread pool (bcrypt releases the GIL) before the chunk's rows are locked, and
+    written with one CASE update per chunk.
+    """
+    passwords = {}
+    # The current chunk's new passwords and their hashes, filled by prepare
+    new_passwords, hashes = {}, {}
+
+    def prepare(chunk):
+        new_passwords.clear()
+        new_passwords.update((user_id, secrets.token_urlsafe(9)) for user_id in chunk)
+        with ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS) as pool:
+            hashed = pool.map(hash_password, (new_passwords[user_id] for user_id in chunk))
+            hashes.clear()
+            hashes.update(zip(chunk, hashed))
+
+    def apply_chunk(cursor, user_ids, found):
+        cases = " ".join("WHEN %s THEN %s" for _ in user_ids)
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        params = [value for user_id in user_ids for value in (user_id, hashes[user_id])]
+        cursor.execute(
+            f"UPDATE user SET password = CASE user_ID {cases} END WHERE user_ID IN ({placeholders})",
+            (*params, *user_ids),
+        )
+        passwords.update((user_id, new_passwords[user_id]) for user_id in user_ids)
+        return {user_id: "reset" for user_id in user_ids}
+
+    result = run_bulk_user_operation(selection, apply_chunk, prepare=prepare)
+    result["new_passwords"] = passwords
+    return result
+
+
+# Columns a bulk update may set; email and phone_number are unique, so they stay per-user edits
+BULK_UPDATABLE_FIELDS = ("first_name", "last_name", "address", "rating", "active")
+
+
+@app.post("/admin/users/bulk/update")
+def bulk_update_users(request: BulkUserUpdateRequest):
+    changes = request.changes.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    rejected = [name for name in changes if name not in BULK_UPDATABLE_FIELDS]
+    if rejected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Fields that must be unique can't be bulk updated: {', '.join(rejected)}",
+        )
+
+    assignments = ", ".join(f"{name} = %s" for name in changes)
+
+    def apply_chunk(cursor, user_ids, found):
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(
+            f"UPDATE user SET {assignments} WHERE user_ID IN ({placeholders})",
+            (*changes.values(), *user_ids),
+        )
+        return {user_id: "updated" for user_id in user_ids}
+
+    # Names and rating are copied onto the owner's listings
+    refresh = any(name in changes for name in ("first_name", "last_name", "address", "rating"))
+    return run_bulk_user_operation(request, apply_chunk, refresh_listings=refresh)
+
+
+""" ************************************** Reporting Backend ************************************************ """
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv('ROLLUP_INTERVAL_SECONDS', 60))
+# Rows younger than this are left for the next run, so transactions that committed out of
+# ID order are not skipped by the cursor
+ROLLUP_SETTLE_SECONDS = 30
+# Source IDs folded into the rollups per statement, which keeps the first backfill in short transactions
+ROLLUP_BATCH_IDS = 50000
+
+ROLLUP_BUCKETS = {
+    "hour": "TIMESTAMP(DATE({col}), MAKETIME(HOUR({col}), 0, 0))",
+    "day": "TIMESTAMP(DATE({col}))",
+}
+ROLLUP_MAX_POINTS = {"hour": 24 * 31, "day": 366 * 2}
+ROLLUP_DEFAULT_POINTS = {"hour": 48, "day": 30}
+
+# source -> (table, id column, time column, {rollup column: aggregate})
+ROLLUP_SOURCES = {
+    "ads": ("ads", "ad_ID", "post_date", {"new_ads": "COUNT(*)"}),
+    "offers": ("offer", "offer_ID", "offer_date", {
+        "new_offers": "COUNT(*)",
+        "offer_value": "COALESCE(SUM(offer_price), 0)",
+    }),
+    "transactions": ("transactions", "transaction_ID", "transaction_date", {
+        "purchases": "SUM(transaction_type = 'purchase')",
+        "gmv": "SUM(IF(transaction_type = 'purchase', price, 0))",
+        "refunds": "SUM(IF(transaction_type = 'refund', price, 0))",
+    }),
+}
+ROLLUP_COLUMNS = ("new_ads", "new_offers", "offer_value", "purchases", "gmv", "refunds")
+
+
+class RollupJob:
+    """
+    Folds new ads, offers and transactions into the hourly and daily activity_rollup rows. Each
+    source keeps an ID cursor in rollup_cursor that advances in the same transaction as the
+    rollup upserts, so a run that dies is simply repeated and no row is counted twice.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.ran_at = None
+        self.last_error = None
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rollup-job", daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        folded = {}
+        for source in ROLLUP_SOURCES:
+            folded[source] = 0
+            while True:
+                count, more = self._advance(source)
+                folded[source] += count
+                if not more:
+                    break
+        self.ran_at = datetime.now()
+        return folded
+
+    def _advance(self, source):
+        table, id_column, time_column, aggregates = ROLLUP_SOURCES[source]
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            # The row lock on the cursor keeps two processes from folding the same range
+            cursor.execute("INSERT IGNORE INTO rollup_cursor (source, last_id) VALUES (%s, 0)", (source,))
+            cursor.execute("SELECT last_id FROM rollup_cursor WHERE source = %s FOR UPDATE", (source,))
+            last_id = cursor.fetchone()[0]
+
+            cursor.execute(f"""
+                SELECT MAX({id_column}) FROM {table}
+                WHERE {id_column} > %s AND {time_column} < NOW() - INTERVAL {ROLLUP_SETTLE_SECONDS} SECOND
+            """, (last_id,))
+            max_id = cursor.fetchone()[0]
+            if max_id is None:
+                connection.commit()
+                return 0, False
+            upper = min(max_id, last_id + ROLLUP_BATCH_IDS)
+
+            columns = ", ".join(aggregates)
+            selects = ", ".join(f"{expression} AS {column}" for column, expression in aggregates.items())
+            updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in aggregates)
+            for granularity, bucket in ROLLUP_BUCKETS.items():
+                bucket = bucket.format(col=time_column)
+                cursor.execute(f"""
+                    INSERT INTO activity_rollup (granularity, bucket_start, {columns})
+                    SELECT %s, {bucket} AS bucket_start, {selects}
+                    FROM {table}
+                    WHERE {id_column} > %s AND {id_column} <= %s
+                    GROUP BY bucket_start
+                    ON DUPLICATE KEY UPDATE {updates}
+                """, (granularity, last_id, upper))
+
+            cursor.execute("UPDATE rollup_cursor SET last_id = %s WHERE source = %s", (upper, source))
+            connection.commit()
+            return upper - last_id, upper < max_id
+        except mysql.connector.Error:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as err:
+                self.last_error = str(err)
+                print(f"Rollup run failed: {err}")
+            time.sleep(self.interval)
+
+
+rollup_job = RollupJob(ROLLUP_INTERVAL_SECONDS)
+
+
+def rollup_step(granularity):
+    return timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+
+
+def truncate_bucket(moment, granularity):
+    # bucket_start is naive server local time, like NOW(); aware inputs are converted to it first
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+
+@app.get("/admin/reports/activity")
+def get_activity_report(granularity: str = "day", start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    Time series of new ads, offers, purchases, GMV and refunds per hour or day, read from the
+    rollup table: one primary-key range scan over at most ROLLUP_MAX_POINTS rows, however large
+    the underlying tables are. Buckets are [start, end) in server local time (a start or end with
+    a UTC offset is converted to it); both default to the most recent ones.
+    """
+    if granularity not in ROLLUP_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(ROLLUP_BUCKETS)}")
+    rollup_job.ensure_started()
+
+    step = rollup_step(granularity)
+    end = truncate_bucket(end, granularity) if end else truncate_bucket(datetime.now(), granularity) + step
+    start = truncate_bucket(start, granularity) if start else end - step * ROLLUP_DEFAULT_POINTS[granularity]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / step > ROLLUP_MAX_POINTS[granularity]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ROLLUP_MAX_POINTS[granularity]} {granularity} buckets per request",
+        )
+
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(time_limited(f"""
+            SELECT bucket_start, {', '.join(ROLLUP_COLUMNS)}
+            FROM activity_rollup
+            WHERE granularity = %s AND bucket_start >= %s AND bucket_start < %s
+        """), (granularity, start, end))
+        rows = {row["bucket_start"]: row for row in cursor.fetchall()}
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+    # Buckets without activity have no row; they are reported as zeros
+    series = []
+    totals = {column: 0 for column in ROLLUP_COLUMNS}
+    bucket = start
+    while bucket < end:
+        row = rows.get(bucket, {})
+        point = {column: float(row.get(column) or 0) for column in ROLLUP_COLUMNS}
+        for column in ROLLUP_COLUMNS:
+            totals[column] += point[column]
+        point["offers_per_ad"] = point["new_offers"] / point["new_ads"] if point["new_ads"] else None
+        point["conversion_rate"] = point["purchases"] / point["new_offers"] if point["new_offers"] else None
+        series.append({"bucket_start": bucket, **point})
+        bucket += step
+
+    totals["offers_per_ad"] = totals["new_offers"] / totals["new_ads"] if totals["new_ads"] else None
+    totals["conversion_rate"] = totals["purchases"] / totals["new_offers"] if totals["new_offers"] else None
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "series": series,
+        "totals": totals,
+        "rolled_up_at": rollup_job.ran_at,
+    }
+
+
+@app.post("/admin/reports/rollup")
+def run_rollup():
+    # Catch up now instead of waiting for the background run
+    try:
+        folded = rollup_job.run_once()
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    rollup_job.ensure_started()
+    return {"message": "Rollups are up to date", "source_ids_folded": folded}
+
+
+""" ************************************** Valuation Backend ************************************************ """
+
+VALUATION_CONDITIONS = ("new", "used", "certified pre-owned")
+VALUATION_FEATURES = 5  # intercept, age, log1p(mileage), used, certified pre-owned
+VALUATION_MIN_SEGMENT_SALES = int(os.getenv('VALUATION_MIN_SEGMENT_SALES', 8))
+VALUATION_PRIOR_STRENGTH = float(os.getenv('VALUATION_PRIOR_STRENGTH', 5.0))
+VALUATION_BAND_Z = 1.2816  # 80% band around the estimate
+VALUATION_DEFAULT_SIGMA = 0.25  # log-price spread used until a segment has enough sales
+# The market level is shrunk towards a flat model at the mean log price: the intercept is left
+# practically free, the other terms get the usual prior so a condition that (almost) never sold
+# cannot trade off against the intercept
+VALUATION_MARKET_STRENGTH = np.array([1e-6] + [VALUATION_PRIOR_STRENGTH] * (VALUATION_FEATURES - 1))
+
+# Sale details of a listing
+VALUATION_SNAPSHOT_QUERY = f"""
+    SELECT l.manufacturer, l.model, l.year, l.mileage, l.`condition`,
+           {ad_sold_price("l.ad_ID", "l.price")} AS sold_price
+    FROM listing l
+"""
+
+# Same columns for sales archived by POST /admin/archive, which no longer have a listing row
+VALUATION_ARCHIVE_QUERY = f"""
+    SELECT v.manufacturer, v.model, v.year, v.mileage, v.`condition`,
+           {ad_sold_price("a.ad_ID", "v.price")} AS sold_price
+    FROM ads_history a
+    JOIN vehicles_history v ON v.vehicle_ID = a.associated_vehicle
+    WHERE a.status = 'Sold'
+"""
+
+
+def valuation_features(years, mileages, conditions, reference_year):
+    # Feature matrix shared by fitting and estimation
+    years = np.asarray(years, dtype=np.float64)
+    mileages = np.asarray(mileages, dtype=np.float64)
+    conditions = np.asarray(conditions, dtype=object)
+
+    features = np.empty((len(years), VALUATION_FEATURES))
+    features[:, 0] = 1.0
+    features[:, 1] = np.maximum(reference_year - years, 0.0)
+    features[:, 2] = np.log1p(np.maximum(mileages, 0.0))
+    features[:, 3] = conditions == "used"
+    features[:, 4] = conditions == "certified pre-owned"
+    return features
+
+
+class SegmentLevel:
+    """
+    Sufficient statistics (X'X, X'y, y'y, n) of one segmentation level, one row per segment.
+    Keeping the statistics instead of the rows lets a new sale be folded in without a rescan.
+    """
+
+    def __init__(self, keys, parents, xtx, xty, yty, counts):
+        self.index = {key: position for position, key in enumerate(keys)}
+        self.parents = parents
+        self.xtx = xtx
+        self.xty = xty
+        self.yty = yty
+        self.counts = counts
+        self.coef = np.zeros_like(xty)
+        self.sigma = np.full(len(keys), VALUATION_DEFAULT_SIGMA)
+
+    @classmethod
+    def from_rows(cls, keys, codes, parents, features, log_prices):
+        segments = len(keys)
+        xtx = np.empty((segments, VALUATION_FEATURES, VALUATION_FEATURES))
+        for i in range(VALUATION_FEATURES):
+            for j in range(i, VALUATION_FEATURES):
+                xtx[:, i, j] = xtx[:, j, i] = np.bincount(
+                    codes, weights=features[:, i] * features[:, j], minlength=segments
+                )
+        xty = np.stack(
+            [np.bincount(codes, weights=features[:, i] * log_prices, minlength=segments)
+             for i in range(VALUATION_FEATURES)],
+            axis=1,
+        )
+        yty = np.bincount(codes, weights=log_prices * log_prices, minlength=segments)
+        counts = np.bincount(codes, minlength=segments).astype(np.float64)
+        return cls(keys, parents, xtx, xty, yty, counts)
+
+    def add(self, key, parent, feature_row, log_price):
+        position = self.index.get(key)
+        if position is None:
+            position = len(self.index)
+            self.index[key] = position
+            self.parents = np.append(self.parents, parent)
+            self.xtx = np.concatenate([self.xtx, np.zeros((1, VALUATION_FEATURES, VALUATION_FEATURES))])
+            self.xty = np.concatenate([self.xty, np.zeros((1, VALUATION_FEATURES))])
+            self.yty = np.append(self.yty, 0.0)
+            self.counts = np.append(self.counts, 0.0)
+            self.coef = np.concatenate([self.coef, np.zeros((1, VALUATION_FEATURES))])
+            self.sigma = np.append(self.sigma, VALUATION_DEFAULT_SIGMA)
+
+        self.xtx[position] += np.outer(feature_row, feature_row)
+        self.xty[position] += feature_row * log_price
+        self.yty[position] += log_price * log_price
+        self.counts[position] += 1
+
+    def condition_sales(self, position, condition):
+        # Sales of one condition in a segment, read off the indicator diagonal of X'X
+        if condition == "used":
+            return self.xtx[position, 3, 3]
+        if condition == "certified pre-owned":
+            return self.xtx[position, 4, 4]
+        return self.counts[position] - self.xtx[position, 3, 3] - self.xtx[position, 4, 4]
+
+    def solve(self, prior_coef, prior_sigma, strength):
+        # Ridge regression of every segment at once, shrunk towards its parent segment's coefficients.
+        # strength is a scalar or one value per feature.
+        regularizer = np.diag(np.broadcast_to(strength, (VALUATION_FEATURES,)))
+        rhs = self.xty + strength * prior_coef
+        self.coef = np.linalg.solve(self.xtx + regularizer, rhs[..., None])[..., 0]
+
+        sse = (
+            self.yty
+            - 2 * np.einsum("sk,sk->s", self.coef, self.xty)
+            + np.einsum("sk,skl,sl->s", self.coef, self.xtx, self.coef)
+        )
+        sigma = np.sqrt(np.maximum(sse, 0.0) / np.maximum(self.counts - 1, 1))
+        self.sigma = np.where(self.counts >= VALUATION_MIN_SEGMENT_SALES, sigma, prior_sigma)
+
+
+class PriceEstimator:
+    """
+    Per-segment depreciation models fitted on sold listings: log(price) ~ age + log(mileage) + condition.
+    Segments form a hierarchy (market -> manufacturer -> manufacturer/model); each level is shrunk
+    towards its parent, so thin segments borrow strength from the wider market.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reference_year = date.today().year
+        self.loaded_at = None
+        self.sales = 0
+        self.market = None
+        self.manufacturers = None
+        self.models = None
+
+    def load(self, rows):
+        # rows: (manufacturer, model, year, mileage, condition, sold_price) from VALUATION_SNAPSHOT_QUERY
+        # and VALUATION_ARCHIVE_QUERY
+        rows = [row for row in rows if row[2] is not None and row[5] and float(row[5]) > 0]
+        manufacturers = np.array([row[0].strip().lower() for row in rows], dtype=object)
+        models = np.array([f"{row[0].strip().lower()}|{row[1].strip().lower()}" for row in rows], dtype=object)
+        features = valuation_features(
+            [row[2] for row in rows], [row[3] or 0 for row in rows], [row[4] for row in rows], self.reference_year
+        )
+        log_prices = np.log(np.array([float(row[5]) for row in rows], dtype=np.float64))
+
+        manufacturer_keys, manufacturer_codes = np.unique(manufacturers, return_inverse=True)
+        model_keys, model_first, model_codes = np.unique(models, return_index=True, return_inverse=True)
+
+        market = SegmentLevel.from_rows(
+            [""], np.zeros(len(rows), dtype=np.int64), np.zeros(1, dtype=np.int64), features, log_prices
+        )
+        manufacturer_level = SegmentLevel.from_rows(
+            list(manufacturer_keys), manufacturer_codes, np.zeros(len(manufacturer_keys), dtype=np.int64),
+            features, log_prices,
+        )
+        model_level = SegmentLevel.from_rows(
+            list(model_keys), model_codes, manufacturer_codes[model_first], features, log_prices
+        )
+
+        with self._lock:
+            self.market, self.manufacturers, self.models = market, manufacturer_level, model_level
+            self.sales = len(rows)
+            self._solve()
+            self.loaded_at = datetime.now()
+
+    def record_sale(self, manufacturer, model, year, mileage, condition, sold_price):
+        # Fold one sale into the sufficient statistics and re-solve; no rescan of past sales
+        if year is None or not sold_price or float(sold_price) <= 0:
+            return
+
+        manufacturer_key = manufacturer.strip().lower()
+        model_key = f"{manufacturer_key}|{model.strip().lower()}"
+        feature_row = valuation_features([year], [mileage or 0], [condition], self.reference_year)[0]
+        log_price = float(np.log(float(sold_price)))
+
+        with self._lock:
+            if self.market is None:
+                return
+            self.market.add("", 0, feature_row, log_price)
+            self.manufacturers.add(manufacturer_key, 0, feature_row, log_price)
+            self.models.add(model_key, self.manufacturers.index[manufacturer_key], feature_row, log_price)
+            self.sales += 1
+            self._solve()
+
+    def estimate(self, manufacturer, model, year, mileage, condition):
+        manufacturer_key = manufacturer.strip().lower()
+        model_key = f"{manufacturer_key}|{model.strip().lower()}"
+        feature_row = valuation_features([year], [mileage or 0], [condition], self.reference_year)[0]
+
+        with self._lock:
+            if self.market is None or self.sales == 0:
+                return None
+
+            # Most specific segment that has seen a sale in this condition; the condition term of a
+            # segment without one is only its prior, so move up to a coarser segment instead
+            for segment, level, key in (
+                ("model", self.models, model_key),
+                ("manufacturer", self.manufacturers, manufacturer_key),
+                ("market", self.market, ""),
+            ):
+                position = level.index.get(key)
+                if position is not None and level.condition_sales(position, condition) > 0:
+                    coef = level.coef[position]
+                    sigma = float(level.sigma[position])
+                    sample_size = int(level.counts[position])
+                    break
+            else:
+                return None
+
+        log_price = float(feature_row @ coef)
+        return {
+            "estimate": round(float(np.exp(log_price)), 2),
+            "low": round(float(np.exp(log_price - VALUATION_BAND_Z * sigma)), 2),
+            "high": round(float(np.exp(log_price + VALUATION_BAND_Z * sigma)), 2),
+            "segment": segment,
+            "sample_size": sample_size,
+        }
+
+    def _solve(self):
+        market_prior = np.zeros((1, VALUATION_FEATURES))
+        market_prior[0, 0] = self.market.xty[0, 0] / max(self.market.counts[0], 1)  # mean log price
+        self.market.solve(market_prior, VALUATION_DEFAULT_SIGMA, VALUATION_MARKET_STRENGTH)
+        self.manufacturers.solve(
+            self.market.coef[self.manufacturers.parents], self.market.sigma[self.manufacturers.parents],
+            VALUATION_PRIOR_STRENGTH,
+        )
+        self.models.solve(
+            self.manufacturers.coef[self.models.parents], self.manufacturers.sigma[self.models.parents],
+            VALUATION_PRIOR_STRENGTH,
+        )
+
+
+price_estimator = PriceEstimator()
+
+
+def ensure_price_estimator():
+    # The snapshot is loaded on first use, then kept current by record_sale
+    if price_estimator.loaded_at is not None:
+        return price_estimator
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(VALUATION_SNAPSHOT_QUERY + " WHERE l.status = 'Sold'")
+        rows = cursor.fetchall()
+        cursor.execute(VALUATION_ARCHIVE_QUERY)
+        rows += cursor.fetchall()
+        price_estimator.load(rows)
+        return price_estimator
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def estimate_or_404(manufacturer, model, year, mileage, condition):
+    if condition not in VALUATION_CONDITIONS:
+        raise HTTPException(status_code=400, detail=f"condition must be one of: {', '.join(VALUATION_CONDITIONS)}")
+
+    estimate = ensure_price_estimator().estimate(manufacturer, model, year, mileage, condition)
+    if estimate is None:
+        raise HTTPException(status_code=404, detail="Not enough sold listings in this condition to estimate a price")
+    return estimate
+
+
+class PriceEstimateRequest(BaseModel):
+    manufacturer: str
+    model: str
+    year: int
+    mileage: float
+    condition: str
+
+
+@app.post("/price-estimate")
+def estimate_draft_price(draft: PriceEstimateRequest):
+    # Price band for a vehicle that is not listed yet (e.g. while filling in AddVehicleModal)
+    estimate = estimate_or_404(draft.manufacturer, draft.model, draft.year, draft.mileage, draft.condition)
+    return {"message": "Price estimated successfully", **estimate}
+
+
+@app.get("/vehicle/{vehicle_id}/price-estimate")
+def estimate_listing_price(vehicle_id: int):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+
+    try:
+        cursor.execute(time_limited("""
+            SELECT manufacturer, model, year, mileage, `condition`, price
+            FROM listing
+            WHERE vehicle_ID = %s
+        """), (vehicle_id,))
+        vehicle = cursor.fetchone()
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+    if not vehicle:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+
+    estimate = estimate_or_404(
+        vehicle["manufacturer"], vehicle["model"], vehicle["year"], vehicle["mileage"], vehicle["condition"]
+    )
+
+    # Where the asking price sits relative to the band
+    asking_price = float(vehicle["price"]) if vehicle["price"] is not None else None
+    if asking_price is None:
+        position = None
+    elif asking_price < estimate["low"]:
+        position = "below"
+    elif asking_price > estimate["high"]:
+        position = "above"
+    else:
+        position = "within"
+
+    return {
+        "message": "Price estimated successfully",
+        "vehicle_id": vehicle_id,
+        "asking_price": asking_price,
+        "asking_price_position": position,
+        **estimate,
+    }
+
+
+@app.post("/valuation/refresh")
+def refresh_price_estimator():
+    # Full reload of the sold-listing snapshot (record_sale keeps it current in between)
+    price_estimator.loaded_at = None
+    estimator = ensure_price_estimator()
+    return {"message": "Valuation snapshot reloaded", "sales": estimator.sales}
+
+
+""" ************************************** Recommendation Backend ************************************************ """
+
+SIMILARITY_TYPES = ("car", "motorcycle", "truck")
+SIMILARITY_CONDITIONS = ("new", "used", "certified pre-owned")
+SIMILARITY_MANUFACTURER_BUCKETS = 16
+SIMILARITY_MODEL_BUCKETS = 16
+SIMILARITY_LOCATION_BUCKETS = 8
+SIMILARITY_MAX_K = 50
+
+# Column layout of a feature vector: (name, width, weight). Weights set how much a mismatch costs.
+SIMILARITY_LAYOUT = (
+    ("vehicle_type", len(SIMILARITY_TYPES), 2.0),
+    ("manufacturer", SIMILARITY_MANUFACTURER_BUCKETS, 1.5),
+    ("model", SIMILARITY_MODEL_BUCKETS, 1.0),
+    ("year", 1, 1.0),
+    ("price", 1, 1.5),
+    ("mileage", 1, 1.0),
+    ("condition", len(SIMILARITY_CONDITIONS), 0.5),
+    ("state", SIMILARITY_LOCATION_BUCKETS, 0.5),
+    ("city", SIMILARITY_LOCATION_BUCKETS, 0.5),
+    ("subtype", 6, 0.75),
+)
+SIMILARITY_WEIGHTS = {name: weight for name, _, weight in SIMILARITY_LAYOUT}
+
+
+def similarity_offsets():
+    offsets, position = {}, 0
+    for name, width, _ in SIMILARITY_LAYOUT:
+        offsets[name] = position
+        position += width
+    return offsets, position
+
+
+SIMILARITY_OFFSETS, SIMILARITY_DIMENSIONS = similarity_offsets()
+
+
+def hashed_bucket(value, buckets):
+    # Stable across processes, unlike hash()
+    return zlib.crc32((value or "").strip().lower().encode("utf-8")) % buckets
+
+
+def similarity_vector(row):
+    """
+    Normalized feature vector of a listing row. Categorical values are one-hot (hashed into a few
+    buckets for open vocabularies), numeric values are scaled to roughly unit range.
+    """
+    vector = np.zeros(SIMILARITY_DIMENSIONS, dtype=np.float32)
+    weights = SIMILARITY_WEIGHTS
+    offsets = SIMILARITY_OFFSETS
+
+    if row["vehicle_type"] in SIMILARITY_TYPES:
+        vector[offsets["vehicle_type"] + SIMILARITY_TYPES.index(row["vehicle_type"])] = weights["vehicle_type"]
+    vector[offsets["manufacturer"] + hashed_bucket(row["manufacturer"], SIMILARITY_MANUFACTURER_BUCKETS)] = \
+        weights["manufacturer"]
+    vector[offsets["model"] + hashed_bucket(row["model"], SIMILARITY_MODEL_BUCKETS)] = weights["model"]
+    vector[offsets["year"]] = weights["year"] * ((row["year"] or 2000) - 2000) / 10.0
+    vector[offsets["price"]] = weights["price"] * np.log1p(float(row["price"] or 0))
+    vector[offsets["mileage"]] = weights["mileage"] * float(row["mileage"] or 0) / 100000.0
+    if row["condition"] in SIMILARITY_CONDITIONS:
+        vector[offsets["condition"] + SIMILARITY_CONDITIONS.index(row["condition"])] = weights["condition"]
+    vector[offsets["state"] + hashed_bucket(row["state"], SIMILARITY_LOCATION_BUCKETS)] = weights["state"]
+    vector[offsets["city"] + hashed_bucket(row["city"], SIMILARITY_LOCATION_BUCKETS)] = weights["city"]
+
+    subtype = offsets["subtype"]
+    vector[subtype:subtype + 6] = weights["subtype"] * np.array([
+        float(row["number_of_doors"] or 0) / 5.0,
+        float(row["seating_capacity"] or 0) / 7.0,
+        float(row["engine_capacity"] or 0) / 1000.0,
+        np.log1p(float(row["cargo_capacity"] or 0)) / 10.0,
+        1.0 if row["has_towing_package"] else 0.0,
+        1.0 if row["transmission"] == "automatic" else 0.0,
+    ], dtype=np.float32)
+    return vector
+
+
+class SimilarVehicleIndex:
+    """
+    Feature matrix of the active listings for k-nearest-neighbour lookups. Rows are updated in place
+    when listings change; freed rows are reused, and the matrix doubles when it runs out of room.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        self.change_cursor = 0
+        self._init_storage(capacity)
+
+    def _init_storage(self, capacity):
+        self.matrix = np.zeros((capacity, SIMILARITY_DIMENSIONS), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.vehicle_ids = np.full(capacity, -1, dtype=np.int64)
+        self.owners = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.positions = {}
+        self.free_rows = []
+        self.size = 0
+
+    def load(self, rows, change_cursor=0):
+        with self._lock:
+            self._init_storage(max(1024, len(rows) * 2))
+            for row in rows:
+                self._upsert(row)
+            self.change_cursor = change_cursor
+            self.loaded_at = datetime.now()
+
+    def apply_listing_change(self, vehicle_id, row):
+        with self._lock:
+            if row is None or row["status"] != "Active":
+                self._remove(vehicle_id)
+            else:
+                self._upsert(row)
+
+    def vector_of(self, vehicle_id):
+        with self._lock:
+            position = self.positions.get(vehicle_id)
+            return None if position is None else self.matrix[position].copy()
+
+    def nearest(self, vector, k, exclude_vehicle=None, exclude_owner=None):
+        with self._lock:
+            if self.size == 0:
+                return []
+
+            # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2, one matrix-vector product over all rows
+            used = slice(0, self.size)
+            distances = self.norms[used] - 2.0 * (self.matrix[used] @ vector) + float(vector @ vector)
+            distances[~self.active[used]] = np.inf
+            if exclude_vehicle is not None and exclude_vehicle in self.positions:
+                distances[self.positions[exclude_vehicle]] = np.inf
+            if exclude_owner is not None:
+                distances[self.owners[used] == exclude_owner] = np.inf
+
+            candidates = min(k, int(np.isfinite(distances).sum()))
+            if candidates == 0:
+                return []
+            nearest = np.argpartition(distances, candidates - 1)[:candidates]
+            nearest = nearest[np.argsort(distances[nearest])]
+            return [
+                (int(self.vehicle_ids[position]), float(np.sqrt(max(distances[position], 0.0))))
+                for position in nearest
+            ]
+
+    def _upsert(self, row):
+        vehicle_id = row["vehicle_ID"]
+        position = self.positions.get(vehicle_id)
+        if position is None:
+            if self.free_rows:
+                position = self.free_rows.pop()
+            else:
+                if self.size == len(self.matrix):
+                    self._grow()
+                position = self.size
+                self.size += 1
+            self.positions[vehicle_id] = position
+
+        vector = similarity_vector(row)
+        self.matrix[position] = vector
+        self.norms[position] = float(vector @ vector)
+        self.vehicle_ids[position] = vehicle_id
+        self.owners[position] = row["ad_owner"] if row["ad_owner"] is not None else -1
+        self.active[position] = True
+
+    def _remove(self, vehicle_id):
+        position = self.positions.pop(vehicle_id, None)
+        if position is not None:
+            self.active[position] = False
+            self.free_rows.append(position)
+
+    def _grow(self):
+        capacity = len(self.matrix) * 2
+        for name in ("matrix", "norms", "vehicle_ids", "owners", "active"):
+            current = getattr(self, name)
+            grown = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+
+similar_vehicle_index = SimilarVehicleIndex()
+listing_listeners.append(similar_vehicle_index)
+
+
+def ensure_similar_vehicle_index():
+    # Built on first use from the active listings, then maintained through publish_listing_changes
+    # and, for writes made elsewhere, by the listing_change sync in run_catalog_maintenance
+    if similar_vehicle_index.loaded_at is not None:
+        return similar_vehicle_index
+
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # Same snapshot for both reads, as in load_listing_catalog
+        change_cursor = settled_listing_change(cursor)
+        cursor.execute("SELECT * FROM listing WHERE status = 'Active'")
+        similar_vehicle_index.load(cursor.fetchall(), change_cursor)
+        connection.commit()
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+    start_catalog_maintenance()
+    return similar_vehicle_index
+
+
+@app.get("/vehicle/{vehicle_id}/similar")
+def get_similar_vehicles(vehicle_id: int, k: int = 6, user_id: Optional[int] = None):
+    """
+    Returns the k active listings most similar to the given vehicle, closest first.
+    Pass user_id to leave out that user's own ads.
+    """
+    if k < 1 or k > SIMILARITY_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {SIMILARITY_MAX_K}")
+
+    index = ensure_similar_vehicle_index()
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+
+    try:
+        # Sold or inactive vehicles are not in the index, so fall back to their listing row
+        vector = index.vector_of(vehicle_id)
+        if vector is None:
+            cursor.execute(time_limited("SELECT * FROM listing WHERE vehicle_ID = %s"), (vehicle_id,))
+            row = cursor.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail="Vehicle not found")
+            vector = similarity_vector(row)
+
+        neighbours = index.nearest(vector, k, exclude_vehicle=vehicle_id, exclude_owner=user_id)
+        if not neighbours:
+            return {"message": "No similar vehicles found", "vehicles": []}
+
+        placeholders = ", ".join(["%s"] * len(neighbours))
+        cursor.execute(time_limited(f"""
+            SELECT {', '.join(LISTING_COLUMNS.values())}
+            FROM listing l
+            WHERE l.vehicle_ID IN ({placeholders})
+        """), tuple(neighbour_id for neighbour_id, _ in neighbours))
+        rows = {row["vehicle_ID"]: row for row in cursor.fetchall()}
+
+        vehicles = []
+        for neighbour_id, distance in neighbours:
+            if neighbour_id in rows:
+                vehicles.append({**rows[neighbour_id], "distance": round(distance, 4)})
+
+        return {"message": "Similar vehicles fetched successfully", "vehicles": vehicles}
+
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        cursor.close()
+        connection.close()
+
+
+""" ************************************** Location Backend ************************************************ """
+
+GAZETTEER_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Common shorthands, keyed like location_key
+GAZETTEER_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "washington dc": "washington",
+}
+EARTH_RADIUS_KM = 6371.0088
+
+
+def location_key(name):
+    # Case, punctuation and "Saint"/"St." insensitive key for matching place names
+    key = re.sub(r"[.,']", "", name).casefold()
+    key = re.sub(r"\s+", " ", key).strip()
+    key = re.sub(r"^saint ", "st ", key)
+    return re.sub(r"^ft ", "fort ", key)
+
+
+class Gazetteer:
+    # Offline city -> coordinates table bundled in api/data (US states and major cities)
+    def __init__(self, directory):
+        self.states = {}
+        with open(os.path.join(directory, "us_states.csv"), newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                self.states[location_key(row["code"])] = row["code"]
+                self.states[location_key(row["name"])] = row["code"]
+
+        self.cities = {}
+        self.cities_by_name = defaultdict(list)
+        with open(os.path.join(directory, "us_cities.csv"), newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                place = (row["city"], row["state"], float(row["latitude"]), float(row["longitude"]))
+                self.cities[(location_key(row["city"]), row["state"])] = place
+                self.cities_by_name[location_key(row["city"])].append(place)
+
+    def state_code(self, state):
+        return self.states.get(location_key(state)) if state else None
+
+    def lookup(self, city, state=None):
+        """
+        (city, state code, latitude, longitude) for a free-text city and state, or None.
+        Without a state the city name must be unambiguous.
+        """
+        if not city:
+            return None
+        city_key = location_key(city)
+        city_key = GAZETTEER_ALIASES.get(city_key, city_key)
+        if state:
+            return self.cities.get((city_key, self.state_code(state)))
+        places = self.cities_by_name.get(city_key, [])
+        return places[0] if len(places) == 1 else None
+
+
+gazetteer = Gazetteer(GAZETTEER_DIR)
+
+
+def normalize_location(city, state):
+    # Canonical city/state and coordinates of a vehicle location. Places missing from the gazetteer
+    # keep the trimmed input (the state as its two-letter code when recognised) and get no coordinates.
+    place = gazetteer.lookup(city, state)
+    if place:
+        return place
+    city = city.strip() if city else city
+    if state:
+        state = gazetteer.state_code(state) or state.strip()
+    return city, state, None, None
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    # Great-circle distance from one point to arrays of points
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_bounds(latitude, longitude, radius_km):
+    # Bounding box (min_lat, max_lat, min_lon, max_lon) that contains the circle
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(latitude)), 0.01)))
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+
+class LocationGrid:
+    """
+    Buckets row positions into fixed-size latitude/longitude cells, so radius and bounding-box
+    filters only visit the rows in the cells they overlap. The antimeridian is not wrapped.
+    """
+
+    CELL_DEGREES = 0.5
+
+    def __init__(self):
+        self.cells = defaultdict(set)
+
+    def cell(self, latitude, longitude):
+        return math.floor(latitude / self.CELL_DEGREES), math.floor(longitude / self.CELL_DEGREES)
+
+    def add(self, position, latitude, longitude):
+        if not (math.isnan(latitude) or math.isnan(longitude)):
+            self.cells[self.cell(latitude, longitude)].add(position)
+
+    def add_many(self, latitudes, longitudes):
+        # Bulk add of rows 0..n-1, skipping the ones without coordinates
+        located = np.flatnonzero(~np.isnan(latitudes) & ~np.isnan(longitudes))
+        for position, latitude, longitude in zip(
+                located.tolist(), latitudes[located].tolist(), longitudes[located].tolist()
+        ):
+            self.cells[self.cell(latitude, longitude)].add(position)
+
+    def discard(self, position, latitude, longitude):
+        if not (math.isnan(latitude) or math.isnan(longitude)):
+            key = self.cell(latitude, longitude)
+            self.cells[key].discard(position)
+            if not self.cells[key]:
+                del self.cells[key]
+
+    def candidates(self, min_lat, max_lat, min_lon, max_lon):
+        # Sorted positions of every row in a cell overlapping the box (a superset of the rows inside it)
+        low_lat, low_lon = self.cell(min_lat, min_lon)
+        high_lat, high_lon = self.cell(max_lat, max_lon)
+        if (high_lat - low_lat + 1) * (high_lon - low_lon + 1) > len(self.cells):
+            keys = [key for key in self.cells if low_lat <= key[0] <= high_lat and low_lon <= key[1] <= high_lon]
+        else:
+            keys = [
+                (cell_lat, cell_lon)
+                for cell_lat in range(low_lat, high_lat + 1)
+                for cell_lon in range(low_lon, high_lon + 1)
+                if (cell_lat, cell_lon) in self.cells
+            ]
+
+        positions = [np.fromiter(self.cells[key], dtype=np.intp, count=len(self.cells[key])) for key in keys]
+        return np.sort(np.concatenate(positions)) if positions else np.zeros(0, dtype=np.intp)
+
+
+@app.post("/admin/vehicles/geocode")
+def geocode_vehicles(after: int = 0, batch_size: int = 1000):
+    """
+    Normalizes city/state and fills in coordinates for vehicles that have none yet (e.g. added before
+    locations were geocoded). Processes one batch per call in vehicle_ID order; call again with
+    after=last_vehicle_ID until done is true.
+    """
+    if batch_size < 1 or batch_size > 10000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 10000")
+
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT vehicle_ID, city, state FROM vehicles
+            WHERE latitude IS NULL AND vehicle_ID > %s
+            ORDER BY vehicle_ID
+            LIMIT %s
+        """, (after, batch_size))
+        vehicles = cursor.fetchall()
+
+        geocoded = []
+        for vehicle in vehicles:
+            city, state, latitude, longitude = normalize_location(vehicle["city"], vehicle["state"])
+            if latitude is not None:
+                cursor.execute(
+                    "UPDATE vehicles SET city = %s, state = %s, latitude = %s, longitude = %s WHERE vehicle_ID = %s",
+                    (city, state, latitude, longitude, vehicle["vehicle_ID"])
+                )
+                refresh_listing(cursor, vehicle["vehicle_ID"])
+                geocoded.append(vehicle["vehicle_ID"])
+        connection.commit()
+        if geocoded:
+            publish_listing_changes(connection, geocoded)
+
+        return {
+            "checked": len(vehicles),
+            "geocoded": len(geocoded),
+            "last_vehicle_ID": vehicles[-1]["vehicle_ID"] if vehicles else after,
+            "done": len(vehicles) < batch_size,
+        }
+    except mysql.connector.Error as err:
+        connection.rollback()
+        raise database_error(err)
     finally:
         cursor.close()
         connection.close()
+
+
+""" ************************************** Catalog Backend ************************************************ """
+
+CATALOG_CONDITIONS = ("new", "used", "certified pre-owned")
+CATALOG_VEHICLE_TYPES = ("car", "motorcycle", "truck", "unknown")
+CATALOG_STATUSES = ("Active", "Inactive", "Expired", "Sold")
+# Lower edges of the browse price buckets; the last bucket is open-ended
+CATALOG_PRICE_BUCKETS = (0, 5000, 10000, 20000, 35000, 50000, 75000, 100000)
+
+# How each listing column is stored by the catalog. The owner summary columns are not stored per
+# listing: they are kept once per owner in ListingCatalog.owners.
+CATALOG_COLUMN_KINDS = {
+    "vehicle_ID": "int",
+    "manufacturer": "code",
+    "model": "code",
+    "year": "int",
+    "price": "decimal",
+    "mileage": "int",
+    "condition": "code",
+    "city": "code",
+    "state": "code",
+    "description": "text",
+    "listing_date": "date",
+    "latitude": "decimal",
+    "longitude": "decimal",
+    "number_of_doors": "int",
+    "seating_capacity": "int",
+    "transmission": "code",
+    "engine_capacity": "decimal",
+    "bike_type": "code",
+    "cargo_capacity": "decimal",
+    "has_towing_package": "int",
+    "vehicle_type": "code",
+    "ad_ID": "int",
+    "post_date": "timestamp",
+    "expiry_date": "timestamp",
+    "is_premium": "int",
+    "views": "int",
+    "status": "code",
+    "ad_owner": "int",
+    "associated_vehicle": "int",
+}
+
+# Array dtype per kind. "code" columns hold Vocabulary codes, kept as intp so they can index
+# lookup tables without a conversion pass; "text" stays as Python strings.
+CATALOG_STORAGE = {
+    "int": np.int64,
+    "decimal": np.float64,
+    "code": np.intp,
+    "date": np.int32,
+    "timestamp": np.int64,
+    "text": object,
+}
+
+CATALOG_VOCABULARY_SEEDS = {
+    "condition": CATALOG_CONDITIONS,
+    "vehicle_type": CATALOG_VEHICLE_TYPES,
+    "status": CATALOG_STATUSES,
+}
+
+# NULL markers: int and timestamp columns use the smallest int64, dates ordinal 0, decimals NaN
+CATALOG_NULL_INT = np.iinfo(np.int64).min
+CATALOG_EPOCH = datetime(1970, 1, 1)
+
+CATALOG_SET_FILTERS = ("manufacturer", "model", "condition", "vehicle_type", "transmission", "status")
+CATALOG_RANGE_FILTERS = ("price", "year", "mileage")
+CATALOG_SORT_KEYS = ("vehicle_ID", "price", "year", "mileage", "views", "listing_date", "post_date")
+
+
+def encode_catalog_value(kind, value):
+    if kind == "int":
+        return CATALOG_NULL_INT if value is None else int(value)
+    if kind == "decimal":
+        return np.nan if value is None else float(value)
+    if kind == "date":
+        return 0 if value is None else value.toordinal()
+    if kind == "timestamp":
+        return CATALOG_NULL_INT if value is None else int((value - CATALOG_EPOCH).total_seconds())
+    return value
+
+
+def catalog_row_crc(*values):
+    # Same as CRC32(CONCAT_WS('|', ...)) in MySQL, which skips NULLs
+    return zlib.crc32("|".join(str(value) for value in values if value is not None).encode())
+
+
+def decode_catalog_column(kind, values):
+    # Inverse of encode_catalog_value for a whole column slice, returned as a list
+    if kind == "int":
+        nulls = values == CATALOG_NULL_INT
+        decoded = values.tolist()
+        return [None if null else value for null, value in zip(nulls.tolist(), decoded)] if nulls.any() else decoded
+    if kind == "decimal":
+        nulls = np.isnan(values)
+        decoded = values.tolist()
+        return [None if null else value for null, value in zip(nulls.tolist(), decoded)] if nulls.any() else decoded
+    if kind == "date":
+        return [date.fromordinal(value) if value else None for value in values.tolist()]
+    if kind == "timestamp":
+        return [
+            None if value == CATALOG_NULL_INT else CATALOG_EPOCH + timedelta(seconds=value)
+            for value in values.tolist()
+        ]
+    return values.tolist()
+
+
+class Vocabulary:
+    # Maps repeated strings (e.g. manufacturers) to small integer codes stored in a column
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class ListingCatalog:
+    """
+    In-memory copy of every advertised listing (listing rows with an ad), one NumPy array per
+    column with repeated strings dictionary-encoded. Browse endpoints filter, sort and page over
+    it without touching MySQL. Rows are patched in place from publish_listing_changes and by the
+    background sync in run_catalog_maintenance.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        self.change_cursor = 0
+        self._init_storage(capacity)
+
+    def _init_storage(self, capacity):
+        dtypes = {name: CATALOG_STORAGE[kind] for name, kind in CATALOG_COLUMN_KINDS.items()}
+        dtypes.update(price_bucket=np.intp, alive=bool)
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self.vocabularies = {
+            name: Vocabulary(CATALOG_VOCABULARY_SEEDS.get(name, ()))
+            for name, kind in CATALOG_COLUMN_KINDS.items() if kind == "code"
+        }
+        self.owners = {}
+        self.grid = LocationGrid()
+        self.positions = {}
+        self.ad_positions = {}
+        self.free_rows = []
+        self.size = 0
+        self.version = 0
+
+    def load(self, rows, change_cursor=0):
+        with self._lock:
+            self._init_storage(max(1024, len(rows) * 2))
+            if rows:
+                # Fill column by column rather than cell by cell
+                encoded = [self._encode_row(row) for row in rows]
+                for column, values in zip(self.columns.values(), zip(*encoded)):
+                    column[:len(rows)] = values
+            for position, row in enumerate(rows):
+                self.positions[row["vehicle_ID"]] = position
+                self.ad_positions[row["ad_ID"]] = position
+                self._remember_owner(row)
+            self.grid.add_many(self.columns["latitude"][:len(rows)], self.columns["longitude"][:len(rows)])
+            self.size = len(rows)
+            self.change_cursor = change_cursor
+            self.loaded_at = datetime.now()
+
+    def apply_listing_change(self, vehicle_id, row):
+        with self._lock:
+            if row is None or row["ad_ID"] is None:
+                self._remove(vehicle_id)
+            else:
+                self._upsert(row)
+            self.version += 1
+
+    def filter_masks(self, filters):
+        """
+        The rows to look at plus one boolean mask per active filter over them. Rows are the used part
+        of the columns, or with a location filter only the positions in the grid cells it overlaps.
+        """
+        bounds = filters.get("bbox")
+        if filters.get("near"):
+            bounds = radius_bounds(*filters["near"])
+        rows = self.grid.candidates(*bounds) if bounds else slice(0, self.size)
+        size = len(rows) if bounds else self.size
+        columns = {name: column[rows] for name, column in self.columns.items()}
+        masks = {}
+
+        # Set membership on a code column is a lookup table indexed by the codes
+        for name in CATALOG_SET_FILTERS:
+            if filters.get(name):
+                vocabulary = self.vocabularies[name]
+                selected = np.zeros(max(len(vocabulary.values), 1), dtype=bool)
+                for value in filters[name]:
+                    if value in vocabulary.codes:
+                        selected[vocabulary.codes[value]] = True
+                masks[name] = selected[columns[name]]
+
+        for name in CATALOG_RANGE_FILTERS:
+            low, high = filters.get(f"min_{name}"), filters.get(f"max_{name}")
+            if low is None and high is None:
+                continue
+            # NULLs never match a range, as in SQL (NaN comparisons are already False)
+            mask = columns[name] != CATALOG_NULL_INT if CATALOG_COLUMN_KINDS[name] == "int" \
+                else np.ones(size, dtype=bool)
+            if low is not None:
+                mask &= columns[name] >= low
+            if high is not None:
+                mask &= columns[name] <= high
+            masks[name] = mask
+
+        if filters.get("is_premium") is not None:
+            masks["is_premium"] = columns["is_premium"] == int(filters["is_premium"])
+
+        base = columns["alive"].copy()
+        if filters.get("exclude_owner") is not None:
+            # ad_owner != x, which like SQL also drops listings without an owner
+            base &= (columns["ad_owner"] != filters["exclude_owner"]) & (columns["ad_owner"] != CATALOG_NULL_INT)
+        if filters.get("bbox"):
+            min_lat, max_lat, min_lon, max_lon = filters["bbox"]
+            base &= (columns["latitude"] >= min_lat) & (columns["latitude"] <= max_lat)
+            base &= (columns["longitude"] >= min_lon) & (columns["longitude"] <= max_lon)
+        if filters.get("near"):
+            latitude, longitude, radius_km = filters["near"]
+            base &= haversine_km(latitude, longitude, columns["latitude"], columns["longitude"]) <= radius_km
+        return rows, base, masks
+
+    def query(self, filters, sort="vehicle_ID", offset=0, limit=None, fields=None):
+        """
+        Filters, sorts and pages the listings. sort is one of CATALOG_SORT_KEYS, prefixed with '-'
+        for descending; ties are broken by vehicle_ID. Returns the match count and the page.
+        """
+        with self._lock:
+            rows, base, masks = self.filter_masks(filters)
+            for mask in masks.values():
+                base &= mask
+            matches = np.flatnonzero(base) if isinstance(rows, slice) else rows[base]
+            return len(matches), self.materialize(self._sorted_page(matches, sort, offset, limit), fields)
+
+    def rows_for_ads(self, ad_ids, fields=None):
+        # Listings for the given ad IDs in the given order, skipping unknown and ownerless ads
+        with self._lock:
+            owners = self.columns["ad_owner"]
+            positions = [
+                self.ad_positions[ad_id] for ad_id in ad_ids
+                if ad_id in self.ad_positions and owners[self.ad_positions[ad_id]] != CATALOG_NULL_INT
+            ]
+            return self.materialize(np.array(positions, dtype=np.intp), fields)
+
+    def facets(self, filters):
+        """
+        Counts per value of each facet. Every facet is counted under all the other filters but not
+        its own, so the sidebar shows what selecting another value would return.
+        """
+        with self._lock:
+            rows, base, masks = self.filter_masks(filters)
+
+            def mask_without(facet):
+                mask = base.copy()
+                for name, other in masks.items():
+                    if name != facet:
+                        mask &= other
+                return mask
+
+            result = {"total": int(np.count_nonzero(mask_without(None))), "facets": {}}
+
+            for facet in ("manufacturer", "condition", "vehicle_type"):
+                values = self.vocabularies[facet].values
+                counts = np.bincount(self.columns[facet][rows][mask_without(facet)], minlength=len(values))
+                result["facets"][facet] = {
+                    value: int(count) for value, count in zip(values, counts) if count
+                }
+
+            counts = np.bincount(
+                self.columns["price_bucket"][rows][mask_without("price")], minlength=len(CATALOG_PRICE_BUCKETS)
+            )
+            result["facets"]["price"] = [
+                {
+                    "min": low,
+                    "max": CATALOG_PRICE_BUCKETS[bucket + 1] if bucket + 1 < len(CATALOG_PRICE_BUCKETS) else None,
+                    "count": int(counts[bucket]),
+                }
+                for bucket, low in enumerate(CATALOG_PRICE_BUCKETS)
+            ]
+            return result
+
+    def checksum(self, exclude=()):
+        # Compared against the same aggregates over the listing table by listing_catalog_drifted;
+        # vehicles in `exclude` are left out on both sides
+        with self._lock:
+            used = slice(0, self.size)
+            alive = self.columns["alive"][used].copy()
+            for vehicle_id in exclude:
+                position = self.positions.get(vehicle_id)
+                if position is not None:
+                    alive[position] = False
+
+            vehicle_ids = self.columns["vehicle_ID"][used][alive].tolist()
+            views = self.columns["views"][used][alive]
+            status_lookup = np.array(self.vocabularies["status"].values + [None], dtype=object)
+            statuses = status_lookup[self.columns["status"][used][alive]].tolist()
+            owner_ids = decode_catalog_column("int", self.columns["ad_owner"][used][alive])
+            ratings = [self.owners.get(owner_id, {}).get("rating") for owner_id in owner_ids]
+            return {
+                "version": self.version,
+                "listings": len(vehicle_ids),
+                "id_sum": sum(vehicle_ids),
+                "price_sum": float(np.nansum(self.columns["price"][used][alive])),
+                "views_sum": int(views[views != CATALOG_NULL_INT].sum()),
+                "status_sum": sum(map(catalog_row_crc, vehicle_ids, statuses)),
+                "owner_sum": sum(map(catalog_row_crc, vehicle_ids, owner_ids, ratings)),
+            }
+
+    def materialize(self, positions, fields=None):
+        # Decode the given rows into listing dicts with the requested LISTING_COLUMNS keys
+        names = fields or list(LISTING_COLUMNS)
+        owner_ids = decode_catalog_column("int", self.columns["ad_owner"][positions])
+
+        values = []
+        for name in names:
+            if name == "user_ID":
+                values.append(owner_ids)
+            elif name in LISTING_OWNER_KEYS:
+                values.append([self.owners.get(owner_id, {}).get(name) for owner_id in owner_ids])
+            elif CATALOG_COLUMN_KINDS[name] == "code":
+                lookup = np.array(self.vocabularies[name].values + [None], dtype=object)
+                values.append(lookup[self.columns[name][positions]].tolist())
+            else:
+                values.append(decode_catalog_column(CATALOG_COLUMN_KINDS[name], self.columns[name][positions]))
+
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def _sorted_page(self, matches, sort, offset, limit):
+        name = sort.lstrip("-")
+        end = len(matches) if limit is None else min(offset + limit, len(matches))
+        if end <= offset:
+            return matches[:0]
+
+        # Sort on float keys with NULLs as -inf, so they come first ascending and last descending like in MySQL
+        kind = CATALOG_COLUMN_KINDS[name]
+        raw = self.columns[name][matches]
+        keys = raw.astype(np.float64)
+        if kind in ("int", "timestamp"):
+            keys[raw == CATALOG_NULL_INT] = -np.inf
+        elif kind == "date":
+            keys[raw == 0] = -np.inf
+        else:
+            keys[np.isnan(keys)] = -np.inf
+        if sort.startswith("-"):
+            keys = -keys
+        ids = self.columns["vehicle_ID"][matches]
+
+        if end < len(matches):
+            # Only the first `end` rows need ordering: keep every key up to the end-th smallest, ties included
+            threshold = np.partition(keys, end - 1)[end - 1]
+            candidates = keys <= threshold
+            matches, keys, ids = matches[candidates], keys[candidates], ids[candidates]
+
+        order = np.lexsort((ids, keys))
+        return matches[order[offset:end]]
+
+    def _upsert(self, row):
+        vehicle_id = row["vehicle_ID"]
+        position = self.positions.get(vehicle_id)
+        if position is None:
+            if self.free_rows:
+                position = self.free_rows.pop()
+            else:
+                if self.size == len(self.columns["alive"]):
+                    self._grow()
+                position = self.size
+                self.size += 1
+            self.positions[vehicle_id] = position
+        else:
+            self.ad_positions.pop(int(self.columns["ad_ID"][position]), None)
+            self.grid.discard(position, self.columns["latitude"][position], self.columns["longitude"][position])
+
+        for column, value in zip(self.columns.values(), self._encode_row(row)):
+            column[position] = value
+        self.ad_positions[row["ad_ID"]] = position
+        self._remember_owner(row)
+        self.grid.add(position, self.columns["latitude"][position], self.columns["longitude"][position])
+
+    def _encode_row(self, row):
+        # Values of a listing row in self.columns order
+        values = [
+            self.vocabularies[name].encode(row[name]) if kind == "code" else encode_catalog_value(kind, row[name])
+            for name, kind in CATALOG_COLUMN_KINDS.items()
+        ]
+        price = float(row["price"] or 0)
+        values.append(bisect.bisect_right(CATALOG_PRICE_BUCKETS, price) - 1)
+        values.append(True)
+        return values
+
+    def _remember_owner(self, row):
+        if row["ad_owner"] is not None:
+            self.owners[row["ad_owner"]] = {key: row[key] for key in LISTING_OWNER_KEYS if key in row}
+
+    def _remove(self, vehicle_id):
+        position = self.positions.pop(vehicle_id, None)
+        if position is not None:
+            self.ad_positions.pop(int(self.columns["ad_ID"][position]), None)
+            self.grid.discard(position, self.columns["latitude"][position], self.columns["longitude"][position])
+            self.columns["alive"][position] = False
+            self.free_rows.append(position)
+
+    def _grow(self):
+        capacity = len(self.columns["alive"]) * 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+
+
+listing_catalog = ListingCatalog()
+listing_listeners.append(listing_catalog)
+
+CATALOG_SYNC_INTERVAL_SECONDS = float(os.getenv("CATALOG_SYNC_INTERVAL_SECONDS", "5"))
+CATALOG_CHECK_INTERVAL_SECONDS = float(os.getenv("CATALOG_CHECK_INTERVAL_SECONDS", "300"))
+CATALOG_SYNC_BATCH_SIZE = 5000
+
+
+def load_listing_catalog(connection):
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # Both reads share one snapshot. The cursor stops at the settled changes, so the ones logged
+        # after it are applied again by the next sync even if the snapshot already saw them.
+        change_cursor = settled_listing_change(cursor)
+        cursor.execute("SELECT * FROM listing WHERE ad_ID IS NOT NULL")
+        listing_catalog.load(cursor.fetchall(), change_cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+# In-memory listing copies kept current from listing_change by run_catalog_maintenance
+change_log_listeners = (listing_catalog, similar_vehicle_index)
+
+
+def sync_listing_listener(connection, listener):
+    # Apply the listing changes logged since the listener's cursor. This picks up writes made by other
+    # API processes and by the review triggers, which never reach this process's publish_listing_changes.
+    # Like /listings/changes it stops at the settled changes, so a late commit is never skipped.
+    cursor = connection.cursor(dictionary=True)
+    try:
+        while True:
+            settled = settled_listing_change(cursor)
+            cursor.execute("""
+                SELECT change_ID, vehicle_ID FROM listing_change
+                WHERE change_ID > %s AND change_ID <= %s
+                ORDER BY change_ID
+                LIMIT %s
+            """, (listener.change_cursor, settled, CATALOG_SYNC_BATCH_SIZE))
+            changes = cursor.fetchall()
+
+            if changes:
+                vehicle_ids = list(dict.fromkeys(change["vehicle_ID"] for change in changes))
+                placeholders = ", ".join(["%s"] * len(vehicle_ids))
+                cursor.execute(f"SELECT * FROM listing WHERE vehicle_ID IN ({placeholders})", tuple(vehicle_ids))
+                rows = {row["vehicle_ID"]: row for row in cursor.fetchall()}
+                for vehicle_id in vehicle_ids:
+                    listener.apply_listing_change(vehicle_id, rows.get(vehicle_id))
+                listener.change_cursor = changes[-1]["change_ID"]
+
+            # End the read view so the next batch (or the drift check) sees changes committed meanwhile
+            connection.commit()
+            if len(changes) < CATALOG_SYNC_BATCH_SIZE:
+                break
+    finally:
+        cursor.close()
+
+
+def listing_catalog_drifted(connection):
+    """
+    Compares the catalog with the listing table: row count, sums of vehicle IDs, prices and views,
+    and per-row checksums of status and of owner and owner rating. Vehicles with changes past the
+    catalog's cursor are left out on both sides, since the catalog may not have them yet.
+    Only conclusive when the catalog did not change while checking; otherwise the next check tries again.
+    """
+    change_cursor = listing_catalog.change_cursor
+    version = listing_catalog.version
+    cursor = connection.cursor(dictionary=True)
+    try:
+        connection.start_transaction(consistent_snapshot=True, readonly=True)
+        cursor.execute(
+            "SELECT DISTINCT vehicle_ID FROM listing_change WHERE change_ID > %s", (change_cursor,)
+        )
+        pending = [row["vehicle_ID"] for row in cursor.fetchall()]
+        excluded = ""
+        if pending:
+            excluded = f" AND vehicle_ID NOT IN ({', '.join(['%s'] * len(pending))})"
+        cursor.execute(f"""
+            SELECT COUNT(*) AS listings,
+                   COALESCE(SUM(vehicle_ID), 0) AS id_sum,
+                   COALESCE(SUM(price), 0) AS price_sum,
+                   COALESCE(SUM(views), 0) AS views_sum,
+                   COALESCE(SUM(CRC32(CONCAT_WS('|', vehicle_ID, status))), 0) AS status_sum,
+                   COALESCE(SUM(CRC32(CONCAT_WS('|', vehicle_ID, ad_owner, rating))), 0) AS owner_sum
+            FROM listing
+            WHERE ad_ID IS NOT NULL{excluded}
+        """, tuple(pending))
+        expected = cursor.fetchone()
+        connection.commit()
+    finally:
+        cursor.close()
+
+    actual = listing_catalog.checksum(exclude=pending)
+    if listing_catalog.change_cursor != change_cursor or actual["version"] != version:
+        return False
+
+    return (
+        actual["listings"] != expected["listings"]
+        or actual["id_sum"] != int(expected["id_sum"])
+        or abs(actual["price_sum"] - float(expected["price_sum"])) > 0.5
+        or actual["views_sum"] != int(expected["views_sum"])
+        or actual["status_sum"] != int(expected["status_sum"])
+        or actual["owner_sum"] != int(expected["owner_sum"])
+    )
+
+
+def run_catalog_maintenance():
+    last_check = time.monotonic()
+    while True:
+        time.sleep(CATALOG_SYNC_INTERVAL_SECONDS)
+        try:
+            connection = get_db_connection()
+            try:
+                for listener in change_log_listeners:
+                    if listener.loaded_at is not None:
+                        sync_listing_listener(connection, listener)
+                if listing_catalog.loaded_at is not None and \
+                        time.monotonic() - last_check >= CATALOG_CHECK_INTERVAL_SECONDS:
+                    last_check = time.monotonic()
+                    if listing_catalog_drifted(connection):
+                        print("Listing catalog drifted from the listing table, reloading")
+                        load_listing_catalog(connection)
+            finally:
+                connection.close()
+        except Exception as err:
+            print(f"Listing catalog maintenance failed: {err}")
+
+
+catalog_maintenance_lock = threading.Lock()
+catalog_maintenance_thread = None
+
+
+def start_catalog_maintenance():
+    global catalog_maintenance_thread
+    with catalog_maintenance_lock:
+        if catalog_maintenance_thread is None:
+            catalog_maintenance_thread = threading.Thread(
+                target=run_catalog_maintenance, name="listing-catalog-maintenance", daemon=True
+            )
+            catalog_maintenance_thread.start()
+
+
+def ensure_listing_catalog():
+    # Loaded on first use, then kept current by publish_listing_changes and the maintenance thread
+    if listing_catalog.loaded_at is not None:
+        return listing_catalog
+
+    connection = get_db_connection()
+    try:
+        load_listing_catalog(connection)
+    except mysql.connector.Error as err:
+        raise database_error(err)
+    finally:
+        connection.close()
+
+    start_catalog_maintenance()
+    return listing_catalog
+
+
+def split_filter_values(value, allowed=None, name=""):
+    # Comma separated multi-value filter, e.g. ?condition=used,new
+    if not value:
+        return None
+    values = [item.strip() for item in value.split(",") if item.strip()]
+    if allowed is not None:
+        unknown = [item for item in values if item not in allowed]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown {name}: {', '.join(unknown)}")
+    return values
+
+
+def browse_filters(manufacturer, condition, vehicle_type, min_price, max_price, min_year, max_year, user_id):
+    # Filters shared by /listings and /listings/facets
+    return {
+        "manufacturer": split_filter_values(manufacturer),
+        "condition": split_filter_values(condition, CATALOG_CONDITIONS, "condition"),
+        "vehicle_type": split_filter_values(vehicle_type, CATALOG_VEHICLE_TYPES, "vehicle_type"),
+        "min_price": min_price,
+        "max_price": max_price,
+        "min_year": min_year,
+        "max_year": max_year,
+        "exclude_owner": user_id,
+    }
+
+
+def location_filters(near_city, near_state, latitude, longitude, radius_km, bbox):
+    """
+    Radius filter around near_city/near_state or latitude/longitude, and/or a bounding box given as
+    bbox=min_lat,min_lon,max_lat,max_lon. Both are answered through the catalog's location grid.
+    """
+    filters = {}
+    if radius_km is not None:
+        if radius_km <= 0:
+            raise HTTPException(status_code=400, detail="radius_km must be positive")
+        if near_city:
+            place = gazetteer.lookup(near_city, near_state)
+            if not place:
+                raise HTTPException(status_code=400, detail=f"Unknown location: {near_city}")
+            latitude, longitude = place[2], place[3]
+        if latitude is None or longitude is None:
+            raise HTTPException(status_code=400, detail="radius_km needs near_city or latitude and longitude")
+        filters["near"] = (latitude, longitude, radius_km)
+
+    if bbox:
+        try:
+            min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be min_lat,min_lon,max_lat,max_lon")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="bbox minimums must not exceed its maximums")
+        filters["bbox"] = (min_lat, max_lat, min_lon, max_lon)
+    return filters
+
+
+@app.get("/listings/facets")
+def get_listing_facets(
+        manufacturer: Optional[str] = None,
+        condition: Optional[str] = None,
+        vehicle_type: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        user_id: Optional[int] = None,
+        near_city: Optional[str] = None,
+        near_state: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        bbox: Optional[str] = None,
+):
+    """
+    Result counts per manufacturer, condition, vehicle type and price bucket for the current
+    browse filters over the active ads, computed in memory. user_id leaves out that user's ads.
+    """
+    filters = browse_filters(manufacturer, condition, vehicle_type, min_price, max_price, min_year, max_year, user_id)
+    filters.update(location_filters(near_city, near_state, latitude, longitude, radius_km, bbox))
+    filters["status"] = ["Active"]
+    return ensure_listing_catalog().facets(filters)
+
+
+LISTINGS_PAGE_SIZE = 50
+LISTINGS_MAX_PAGE_SIZE = 500
+
+
+@app.get("/listings")
+def browse_listings(
+        manufacturer: Optional[str] = None,
+        model: Optional[str] = None,
+        condition: Optional[str] = None,
+        vehicle_type: Optional[str] = None,
+        transmission: Optional[str] = None,
+        status: str = "Active",
+        is_premium: Optional[bool] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        min_mileage: Optional[int] = None,
+        max_mileage: Optional[int] = None,
+        user_id: Optional[int] = None,
+        near_city: Optional[str] = None,
+        near_state: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        bbox: Optional[str] = None,
+        sort: str = "-post_date",
+        offset: int = 0,
+        limit: int = LISTINGS_PAGE_SIZE,
+        fields: Optional[str] = None,
+):
+    """
+    Filtered, sorted and paginated listings served from the in-memory catalog.
+    Multi-value filters are comma separated; sort takes a '-' prefix for descending.
+    Location: radius_km around near_city[/near_state] or latitude/longitude, and/or bbox.
+    """
+    if sort.lstrip("-") not in CATALOG_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(CATALOG_SORT_KEYS)}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+    if limit < 1 or limit > LISTINGS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LISTINGS_MAX_PAGE_SIZE}")
+
+    filters = browse_filters(manufacturer, condition, vehicle_type, min_price, max_price, min_year, max_year, user_id)
+    filters.update(
+        model=split_filter_values(model),
+        transmission=split_filter_values(transmission),
+        status=split_filter_values(status, CATALOG_STATUSES, "status"),
+        is_premium=is_premium,
+        min_mileage=min_mileage,
+        max_mileage=max_mileage,
+        **location_filters(near_city, near_state, latitude, longitude, radius_km, bbox),
+    )
+    names = requested_fields(fields, LISTING_COLUMNS)
+
+    total, listings = ensure_listing_catalog().query(filters, sort, offset, limit, names)
+    return measured_json_response({"total": total, "offset": offset, "limit": limit, "listings": listings})
+
+
+""" ************************************** Export Backend ************************************************ """
+
+# Rows fetched from the server-side cursor per batch; also the Parquet row group size
+EXPORT_ROW_GROUP_SIZE = int(os.getenv('EXPORT_ROW_GROUP_SIZE', 10000))
+# MAX_EXECUTION_TIME of an export query. Rows are sent while the statement runs, so this bounds
+# the whole download, slow clients included.
+EXPORT_QUERY_TIMEOUT_MS = int(os.getenv('EXPORT_QUERY_TIMEOUT_MS', 10 * 60 * 1000))
+
+# dataset -> FROM clause, ORDER BY key, date column, status column, allowed statuses and
+# the exported columns as (name, SQL expression, Parquet type)
+EXPORT_DATASETS = {
+    "transactions": {
+        "from": "transactions t",
+        "key": "t.transaction_ID",
+        "date": "t.transaction_date",
+        "status": "t.payment_status",
+        "statuses": ("completed", "pending", "failed"),
+        "columns": (
+            ("transaction_ID", "t.transaction_ID", "int64"),
+            ("transaction_date", "t.transaction_date", "timestamp[s]"),
+            ("price", "t.price", "decimal(10,2)"),
+            ("payment_method", "t.payment_method", "string"),
+            ("payment_status", "t.payment_status", "string"),
+            ("transaction_type", "t.transaction_type", "string"),
+            ("review", "t.review", "int64"),
+            ("belonged_ad", "t.belonged_ad", "int64"),
+            ("paid_by", "t.paid_by", "int64"),
+            ("approved_by", "t.approved_by", "int64"),
+        ),
+    },
+    "ads": {
+        "from": "ads a",
+        "key": "a.ad_ID",
+        "date": "a.post_date",
+        "status": "a.status",
+        "statuses": CATALOG_STATUSES,
+        "columns": (
+            ("ad_ID", "a.ad_ID", "int64"),
+            ("post_date", "a.post_date", "timestamp[s]"),
+            ("expiry_date", "a.expiry_date", "timestamp[s]"),
+            ("is_premium", "a.is_premium", "bool"),
+            ("views", "a.views", "int64"),
+            ("status", "a.status", "string"),
+            ("owner", "a.owner", "int64"),
+            ("associated_vehicle", "a.associated_vehicle", "int64"),
+        ),
+    },
+    "vehicles": {
+        "from": "vehicles v LEFT JOIN ads a ON a.associated_vehicle = v.vehicle_ID",
+        "key": "v.vehicle_ID",
+        "date": "v.listing_date",
+        "status": "a.status",
+        "statuses": CATALOG_STATUSES,
+        "columns": (
+            ("vehicle_ID", "v.vehicle_ID", "int64"),
+            ("manufacturer", "v.manufacturer", "string"),
+            ("model", "v.model", "string"),
+            ("year", "v.year", "int64"),
+            ("price", "v.price", "decimal(10,2)"),
+            ("mileage", "v.mileage", "int64"),
+            ("condition", "v.`condition`", "string"),
+            ("city", "v.city", "string"),
+            ("state", "v.state", "string"),
+            ("listing_date", "v.listing_date", "date32"),
+            ("latitude", "v.latitude", "decimal(9,6)"),
+            ("longitude", "v.longitude", "decimal(9,6)"),
+            ("ad_ID", "a.ad_ID", "int64"),
+            ("ad_status", "a.status", "string"),
+        ),
+    },
+}
+
+
+def arrow_type(name):
+    match = re.fullmatch(r"decimal\((\d+),(\d+)\)", name)
+    if match:
+        return pa.decimal128(int(match.group(1)), int(match.group(2)))
+    return pa.type_for_alias(name)
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file that the Parquet writer fills and the response generator drains
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_batches(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_ROW_GROUP_SIZE)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_stream(cursor, names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in export_batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def parquet_stream(cursor, columns):
+    schema = pa.schema([(name, arrow_type(type_name)) for name, _, type_name in columns])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    for rows in export_batches(cursor):
+        # One row group per batch, so at most EXPORT_ROW_GROUP_SIZE rows are held at a time
+        arrays = []
+        for i, field in enumerate(schema):
+            values = [row[i] for row in rows]
+            if field.type == pa.bool_():
+                # MySQL returns BOOLEAN columns as 0/1
+                values = [None if value is None else bool(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def closing_stream(stream, connection, cursor):
+    # Keeps the connection open while the response streams and releases it however the stream ends
+    try:
+        yield from stream
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass  # the client went away before the last row was read
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass  # same: the connection may already be unusable
+
+
+@app.get("/admin/export/{dataset}")
+def export_dataset(
+        dataset: str,
+        format: str = "csv",
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        status: Optional[str] = None,
+):
+    """
+    Streams transactions, ads or vehicles as CSV or Parquet. Rows come off an unbuffered
+    (server-side streaming) cursor in batches of EXPORT_ROW_GROUP_SIZE and are encoded as they
+    arrive, so memory stays bounded however many rows match; the query is cut off after
+    EXPORT_QUERY_TIMEOUT_MS. `start`/`end` filter the dataset's
+    date column as [start, end); `status` takes a comma-separated list.
+    """
+    spec = EXPORT_DATASETS.get(dataset)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset. Available: {', '.join(EXPORT_DATASETS)}")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'parquet'")
+    if format == "parquet" and pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs the pyarrow package")
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{spec['date']} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{spec['date']} < %s")
+        params.append(end)
+    statuses = split_filter_values(status, spec["statuses"], "status")
+    if statuses:
+        conditions.append(f"{spec['status']} IN ({', '.join(['%s'] * len(statuses))})")
+        params += statuses
+
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    columns = spec["columns"]
+    query = time_limited(f"""
+        SELECT {', '.join(expression for _, expression, _ in columns)}
+        FROM {spec['from']}
+        {where}
+        ORDER BY {spec['key']}
+    """, EXPORT_QUERY_TIMEOUT_MS)
+
+    connection = get_db_connection()
+    # Unbuffered: rows stay on the server until fetched instead of being loaded up front
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, tuple(params))
+    except mysql.connector.Error as err:
+        cursor.close()
+        connection.close()
+        raise database_error(err)
+
+    names = [name for name, _, _ in columns]
+    stream = csv_stream(cursor, names) if format == "csv" else parquet_stream(cursor, columns)
+    filename = f"{dataset}-{datetime.now():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        closing_stream(stream, connection, cursor),
+        media_type="text/csv" if format == "csv" else "application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,72 @@
+"""
+Compares the old OR-across-LEFT-JOIN transaction lookup with the UNION/keyset query
+used by get_user_transactions (USER_TRANSACTIONS_QUERY, imported so it cannot go stale).
+Prints the EXPLAIN ANALYZE plan of each, which carries MySQL's measured row counts and
+per-step timings, and the average latency over `runs` executions.
+
+Usage (from backend/, with the same .env the API uses):
+    python -m benchmarks.user_transactions <user_id> [runs]
+
+Needs MySQL 8.0.18 or later for EXPLAIN ANALYZE.
+"""
+import sys
+import time
+
+from api.main import TRANSACTION_PAGE_SIZE, USER_TRANSACTIONS_QUERY, get_db_connection, user_transactions_params
+
+# The query get_user_transactions ran before keyset pagination, kept as the baseline
+OLD_QUERY = """
+    SELECT
+        t.transaction_ID, t.transaction_date, t.price, t.payment_method,
+        t.payment_status, t.transaction_type, t.review, t.belonged_ad,
+        t.paid_by, pb.first_name AS payer_first_name, pb.last_name AS payer_last_name,
+        pb.phone_number AS payer_phone, pb.email AS payer_email,
+        t.approved_by, ab.first_name AS approver_first_name, ab.last_name AS approver_last_name,
+        ab.phone_number AS approver_phone, ab.email AS approver_email,
+        a.owner, os.first_name AS owner_first_name, os.last_name AS owner_last_name,
+        os.phone_number AS owner_phone, os.email AS owner_email,
+        a.associated_vehicle, a.status AS ad_status,
+        v.manufacturer, v.model, v.year
+    FROM transactions t
+    LEFT JOIN ads a ON t.belonged_ad = a.ad_ID
+    LEFT JOIN user pb ON t.paid_by = pb.user_ID
+    LEFT JOIN user ab ON t.approved_by = ab.user_ID
+    LEFT JOIN user os ON a.owner = os.user_ID
+    LEFT JOIN vehicles v ON a.associated_vehicle = v.vehicle_ID
+    WHERE t.paid_by = %s OR a.owner = %s
+"""
+
+
+def run(cursor, label, query, params, runs):
+    print(f"--- {label} ---")
+    cursor.execute("EXPLAIN ANALYZE " + query, params)
+    for row in cursor.fetchall():
+        print(row[0])
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        cursor.execute(query, params)
+        rows = len(cursor.fetchall())
+    elapsed = (time.perf_counter() - started) / runs
+    print(f"  {rows} rows, avg {elapsed * 1000:.2f} ms over {runs} runs\n")
+
+
+def main():
+    user_id = int(sys.argv[1])
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        run(cursor, "OR across LEFT JOIN (before)", OLD_QUERY, (user_id, user_id), runs)
+        run(
+            cursor, "UNION of index seeks + keyset page (after)", USER_TRANSACTIONS_QUERY,
+            user_transactions_params(user_id, 2147483647, TRANSACTION_PAGE_SIZE), runs,
+        )
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
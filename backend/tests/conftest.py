@@ -0,0 +1,225 @@
+import os
+import re
+from datetime import date, datetime, timedelta
+
+import pytest
+
+# api.main refuses to import without database settings; the tests never open a connection
+os.environ.setdefault("MYSQL_USER", "test")
+os.environ.setdefault("MYSQL_PASSWORD", "test")
+os.environ.setdefault("MYSQL_HOST", "127.0.0.1")
+os.environ.setdefault("MYSQL_DATABASE", "test")
+
+from api import main  # noqa: E402
+
+
+class FakeDatabase:
+    """
+    Stands in for MySQL behind get_db_connection. Statements are answered by the first rule whose
+    fragment they contain (whitespace-normalized); a rule's rows and rowcount may be callables taking
+    the params, and may raise to fail the statement. Unmatched statements return no rows and affect
+    none. Every statement is kept in `executed`.
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def on(self, fragment, rows=(), rowcount=None, lastrowid=None):
+        self.rules.append((" ".join(fragment.split()), rows, rowcount, lastrowid))
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def statements(self, fragment):
+        # (query, params) of the executed statements containing the fragment
+        fragment = " ".join(fragment.split())
+        return [(query, params) for query, params in self.executed if fragment in query]
+
+    def answer(self, query, params):
+        for fragment, rows, rowcount, lastrowid in self.rules:
+            if fragment in query:
+                rows = list(rows(params) if callable(rows) else rows)
+                if callable(rowcount):
+                    rowcount = rowcount(params)
+                return rows, len(rows) if rowcount is None else rowcount, lastrowid
+        return [], 0, None
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self.database, dictionary)
+
+    def commit(self):
+        self.database.commits += 1
+
+    def rollback(self):
+        self.database.rollbacks += 1
+
+    def start_transaction(self, **kwargs):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, database, dictionary):
+        self.database = database
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        query = " ".join(query.split())
+        # Statements run through time_limited() still match their unhinted fragments
+        query = re.sub(r"SELECT /\*\+ MAX_EXECUTION_TIME\(\d+\) \*/", "SELECT", query)
+        self.database.executed.append((query, params))
+        self.rows, self.rowcount, self.lastrowid = self.database.answer(query, params)
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._shape(self.rows.pop(0)) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return [self._shape(row) for row in rows]
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return [self._shape(row) for row in rows]
+
+    def close(self):
+        pass
+
+    def _shape(self, row):
+        if self.dictionary or not isinstance(row, dict):
+            return row
+        return tuple(row.values())
+
+
+class ListingLog:
+    """
+    The listing and listing_change tables behind a FakeDatabase, with a clock and per-change commit
+    visibility under test control. changed_at is in seconds on that clock.
+    """
+
+    def __init__(self, database):
+        self.now = 1000
+        self.changes = []  # [change_ID, vehicle_ID, change_type, changed_at, committed]
+        self.listings = {}
+        database.on("ORDER BY change_ID DESC", self._settled)
+        database.on("FROM listing_change", self._changes_between)
+        database.on("FROM listing", self._listing_rows)
+
+    def log(self, change_id, vehicle_id, age, change_type="upsert", committed=True):
+        self.changes.append([change_id, vehicle_id, change_type, self.now - age, committed])
+
+    def commit(self, change_id):
+        for change in self.changes:
+            if change[0] == change_id:
+                change[4] = True
+
+    def _visible(self):
+        return sorted((change for change in self.changes if change[4]), key=lambda change: change[0])
+
+    def _settled(self, params):
+        horizon = self.now - main.LISTING_CHANGE_SETTLE_SECONDS
+        settled = [change[0] for change in self._visible() if change[3] < horizon]
+        return [{"change_ID": settled[-1]}] if settled else []
+
+    def _changes_between(self, params):
+        since, until, limit = params
+        return [
+            {"change_ID": change[0], "vehicle_ID": change[1], "change_type": change[2]}
+            for change in self._visible() if since < change[0] <= until
+        ][:limit]
+
+    def _listing_rows(self, params):
+        return [self.listings[vehicle_id] for vehicle_id in params if vehicle_id in self.listings]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # Every get_db_connection() in the module under test connects to the returned FakeDatabase
+    database = FakeDatabase()
+    monkeypatch.setattr(main, "get_db_connection", database.connect)
+    return database
+
+
+@pytest.fixture
+def make_listing():
+    # A row of the listing table, as SELECT * FROM listing returns it
+    def make(vehicle_id, **values):
+        row = {
+            "vehicle_ID": vehicle_id,
+            "manufacturer": "Toyota",
+            "model": "Corolla",
+            "year": 2018,
+            "price": 15000.0,
+            "mileage": 60000,
+            "condition": "used",
+            "city": "Austin",
+            "state": "TX",
+            "description": f"Vehicle {vehicle_id}",
+            "listing_date": date(2024, 1, 1),
+            "latitude": None,
+            "longitude": None,
+            "number_of_doors": 4,
+            "seating_capacity": 5,
+            "transmission": "automatic",
+            "engine_capacity": None,
+            "bike_type": None,
+            "cargo_capacity": None,
+            "has_towing_package": None,
+            "vehicle_type": "car",
+            "ad_ID": vehicle_id + 1000,
+            "post_date": datetime(2024, 1, 1) + timedelta(hours=vehicle_id),
+            "expiry_date": datetime(2025, 1, 1),
+            "is_premium": 0,
+            "views": 10,
+            "status": "Active",
+            "ad_owner": 1,
+            "associated_vehicle": vehicle_id,
+            "first_name": "Ann",
+            "last_name": "Lee",
+            "email": "ann@example.com",
+            "phone_number": "555-0100",
+            "address": "1 Main St",
+            "rating": 4.5,
+            "join_date": date(2020, 1, 1),
+        }
+        row.update(values)
+        return row
+
+    return make
+
+
+@pytest.fixture
+def listing_log(database):
+    return ListingLog(database)
+
+
+@pytest.fixture
+def catalog(make_listing):
+    rows = [
+        make_listing(1, manufacturer="Toyota", price=4000.0, year=2010, views=5),
+        make_listing(2, manufacturer="Toyota", price=12000.0, year=2016, condition="new", views=7),
+        make_listing(3, manufacturer="BMW", price=30000.0, year=2020, ad_owner=2, views=1),
+        make_listing(4, manufacturer="BMW", price=None, year=2021, ad_owner=2, status="Sold"),
+        make_listing(5, manufacturer="Fiat", price=8000.0, year=2012, mileage=None,
+                     vehicle_type="motorcycle", ad_owner=None),
+    ]
+    catalog = main.ListingCatalog()
+    catalog.load(rows, change_cursor=9)
+    return catalog
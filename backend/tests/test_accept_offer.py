@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import QueryCache, accept_offer
+
+
+@pytest.fixture
+def offers(database, monkeypatch):
+    # Offer 1 on ad 7, pending, with offers 2 and 3 competing for the same ad
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+    database.on("SELECT sent_to FROM offer WHERE offer_ID", [{"sent_to": 7}])
+    database.on("SELECT offer_status FROM offer WHERE offer_ID", [{"offer_status": "pending"}])
+    database.on("offer_status = 'pending' AND offer_ID <> %s FOR UPDATE", [{"offer_ID": 2}, {"offer_ID": 3}])
+    return database
+
+
+def test_accept_rejects_the_competing_offers_in_one_statement(offers):
+    main.query_cache.set(("ad_offers", 7), ["stale"], ["ad:7"])
+
+    result = accept_offer(1)
+
+    assert result["accepted_offer_id"] == 1
+    assert result["rejected_offer_ids"] == [2, 3]
+    assert offers.statements("SET offer_status = 'accepted' WHERE offer_ID = %s") == [
+        ("UPDATE offer SET offer_status = 'accepted' WHERE offer_ID = %s", (1,)),
+    ]
+    [(_, params)] = offers.statements("SET offer_status = 'rejected'")
+    assert params == (7, 1)
+    assert offers.commits == 1
+    assert main.query_cache.get(("ad_offers", 7)) == (False, None)
+
+
+def test_the_ad_is_locked_before_the_offers(offers):
+    accept_offer(1)
+    queries = [query for query, _ in offers.executed]
+    ad_lock = queries.index("SELECT ad_ID FROM ads WHERE ad_ID = %s FOR UPDATE")
+    assert all(ad_lock < index for index, query in enumerate(queries) if "FROM offer" in query and "FOR UPDATE" in query)
+
+
+def test_no_competing_offers_skips_the_reject_update(database):
+    database.on("SELECT sent_to FROM offer WHERE offer_ID", [{"sent_to": 7}])
+    database.on("SELECT offer_status FROM offer WHERE offer_ID", [{"offer_status": "pending"}])
+
+    assert accept_offer(1)["rejected_offer_ids"] == []
+    assert database.statements("SET offer_status = 'rejected'") == []
+
+
+def test_unknown_offer_is_a_404(database):
+    with pytest.raises(HTTPException) as excinfo:
+        accept_offer(1)
+    assert excinfo.value.status_code == 404
+
+
+def test_rejected_offer_cannot_be_accepted(database):
+    database.on("SELECT sent_to FROM offer WHERE offer_ID", [{"sent_to": 7}])
+    database.on("SELECT offer_status FROM offer WHERE offer_ID", [{"offer_status": "rejected"}])
+
+    with pytest.raises(HTTPException) as excinfo:
+        accept_offer(1)
+    assert excinfo.value.status_code == 409
+    assert database.commits == 0
+
+
+def test_second_accepted_offer_on_an_ad_is_a_conflict(database):
+    database.on("SELECT sent_to FROM offer WHERE offer_ID", [{"sent_to": 7}])
+    database.on("SELECT offer_status FROM offer WHERE offer_ID", [{"offer_status": "pending"}])
+    database.on("offer_status = 'accepted' AND offer_ID <> %s", [{"offer_ID": 4}])
+
+    with pytest.raises(HTTPException) as excinfo:
+        accept_offer(1)
+    assert excinfo.value.status_code == 409
+    assert database.statements("UPDATE offer") == []
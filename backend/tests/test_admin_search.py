@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import decode_page_cursor, encode_page_cursor, search_users
+
+
+def test_cursor_round_trip():
+    token = encode_page_cursor([12500.0, 42])
+    assert decode_page_cursor(token) == [12500.0, 42]
+
+
+def test_datetimes_are_encoded_as_strings():
+    token = encode_page_cursor([datetime(2024, 5, 1, 12, 30), 7])
+    assert decode_page_cursor(token) == ["2024-05-01 12:30:00", 7]
+
+
+def test_cursor_is_url_safe():
+    token = encode_page_cursor(["???>>>", 1])
+    assert "+" not in token and "/" not in token
+
+
+@pytest.mark.parametrize("token", ["not a cursor", "e30", "bm90IGpzb24="])
+def test_invalid_cursor_is_a_400(token):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_page_cursor(token)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.fixture
+def users(database):
+    database.on("FROM user u", [
+        {"user_ID": 3, "email": "a@x.com"}, {"user_ID": 9, "email": "b@x.com"}, {"user_ID": 4, "email": "c@x.com"},
+    ])
+    return database
+
+
+def test_search_pages_with_an_expanded_keyset(users):
+    first = search_users(sort="email", limit=2, fields="user_ID,email")
+    assert [user["user_ID"] for user in first["users"]] == [3, 9]
+    assert decode_page_cursor(first["next_cursor"]) == ["b@x.com", 9]
+
+    search_users(sort="email", order="desc", limit=2, cursor=first["next_cursor"])
+
+    query, params = users.statements("FROM user u")[-1]
+    assert "(u.email < %s OR (u.email = %s AND u.user_ID < %s))" in query
+    assert "ORDER BY u.email desc, u.user_ID desc" in query
+    assert params == ("b@x.com", "b@x.com", 9, 3)
+
+
+def test_search_by_user_id_seeks_on_the_id_alone(users):
+    search_users(cursor=encode_page_cursor([9]))
+
+    query, params = users.statements("FROM user u")[-1]
+    assert "WHERE u.user_ID > %s" in query
+    assert params == (9, main.ADMIN_SEARCH_PAGE_SIZE + 1)
+
+
+def test_last_page_has_no_cursor(users):
+    assert search_users(limit=3)["next_cursor"] is None
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("email", [9]),
+    ("email", ["b@x.com", "9"]),
+    ("email", [["b@x.com"], 9]),
+    ("email", ["b@x.com", True]),
+    ("email", [1.5, 9]),
+    ("user_ID", ["9"]),
+    ("user_ID", [{"id": 9}]),
+])
+def test_cursor_of_the_wrong_shape_is_a_400(users, sort, values):
+    with pytest.raises(HTTPException) as excinfo:
+        search_users(sort=sort, cursor=encode_page_cursor(values))
+    assert excinfo.value.status_code == 400
+    assert users.statements("FROM user u") == []
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from api import main
+from api.main import AdmissionClass, route_class
+
+
+def run_jobs(admission, durations):
+    # Runs one job per duration concurrently; each returns "ok" or "shed"
+    async def job(duration):
+        if not await admission.acquire():
+            return "shed"
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            admission.release()
+        return "ok"
+
+    async def run_all():
+        return await asyncio.gather(*(job(duration) for duration in durations))
+
+    return asyncio.run(run_all())
+
+
+def test_queued_requests_get_the_released_slots():
+    admission = AdmissionClass("test", concurrency=2, queue_size=2, max_wait=1.0)
+    assert run_jobs(admission, [0.05] * 4) == ["ok"] * 4
+
+    stats = admission.stats()
+    assert stats["admitted"] == 4
+    assert stats["queued"] == 2
+    assert stats["active"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_requests_beyond_the_queue_are_shed():
+    admission = AdmissionClass("test", concurrency=1, queue_size=1, max_wait=1.0)
+    assert run_jobs(admission, [0.05] * 3) == ["ok", "ok", "shed"]
+    assert admission.stats()["shed_queue_full"] == 1
+
+
+def test_waiters_past_max_wait_are_shed():
+    admission = AdmissionClass("test", concurrency=1, queue_size=5, max_wait=0.05)
+    assert run_jobs(admission, [0.3, 0.01]) == ["ok", "shed"]
+    assert admission.stats()["shed_timeout"] == 1
+    assert admission.active == 0
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    admission = AdmissionClass("test", concurrency=1, queue_size=5, max_wait=1.0)
+
+    async def scenario():
+        assert await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        admission.release()
+
+    asyncio.run(scenario())
+    assert admission.active == 0
+    assert not admission.waiters
+
+
+def test_route_class():
+    assert route_class("GET", "/admin/export/listings") == "export"
+    assert route_class("POST", "/vehicle/12/photos") == "upload"
+    assert route_class("GET", "/vehicle/12/photos") == "cheap"
+    assert route_class("GET", "/listings") == "expensive"
+    assert route_class("GET", "/user/3/other-ads") == "expensive"
+    assert route_class("GET", "/vehicle/12/similar") == "expensive"
+    assert route_class("POST", "/admin/users/bulk-update") == "expensive"
+    assert route_class("POST", "/ads") == "write"
+    assert route_class("DELETE", "/wishlist/4") == "write"
+    assert route_class("GET", "/user/3/balance") == "cheap"
+
+
+def test_batch_fan_out_fits_in_the_expensive_class(monkeypatch):
+    # Sub-requests queue for admission one by one; a single batch must not take more than the slots
+    in_flight = peak = 0
+
+    async def dispatch(scope, path):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return 200, {}
+
+    monkeypatch.setattr(main, "dispatch_subrequest", dispatch)
+    batch = main.BatchRequest(requests=[{"path": "/listings"}] * 20)
+    result = asyncio.run(main.run_batch(batch, SimpleNamespace(scope={})))
+
+    assert len(result["responses"]) == 20
+    assert peak == main.BATCH_CONCURRENCY
+    assert peak <= main.admission_classes["expensive"].concurrency
@@ -0,0 +1,65 @@
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import QueryCache, archive_ads, archive_batch
+
+
+@pytest.fixture
+def archive(database, monkeypatch):
+    # Ads 7 and 8 are candidates; only 7 (vehicle 70) is still eligible once locked
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+    removed = []
+    monkeypatch.setattr(main, "remove_photo_files", removed.extend)
+    database.removed_photos = removed
+    database.on("FOR UPDATE", [(7, 70)])
+    database.on("SELECT a.ad_ID FROM ads a", [(7,), (8,)])
+    database.on("SELECT photo_url FROM vehicle_photos", [("/photos/abc/1.jpg",)])
+    return database
+
+
+def test_batch_copies_history_before_deleting(archive):
+    archived, candidates = archive_batch(archive.connect(), 180, 500)
+
+    assert (archived, candidates) == ([7], 2)
+    [(_, lock_params)] = archive.statements("FOR UPDATE")
+    assert lock_params == (7, 8, 180)
+    queries = [query for query, _ in archive.executed]
+    ad_delete = queries.index("DELETE FROM ads WHERE ad_ID IN (%s)")
+    history = [index for index, query in enumerate(queries) if "_history" in query]
+    assert len(history) == len(main.ARCHIVE_TABLES)
+    # The unlink trigger on ads leaves transactions of ads already in ads_history alone
+    assert max(history) < ad_delete
+    assert archive.statements("INSERT INTO ads_history")[0][1] == [7]
+    assert archive.statements("INSERT INTO vehicles_history")[0][1] == [70]
+    assert archive.statements("INSERT INTO listing_change") == [
+        ("INSERT INTO listing_change (vehicle_ID, change_type) VALUES (%s, %s)", (70, "delete")),
+    ]
+    assert archive.commits == 1
+    assert archive.removed_photos == ["/photos/abc/1.jpg"]
+
+
+def test_batch_with_nothing_left_after_locking_changes_nothing(database):
+    database.on("SELECT a.ad_ID FROM ads a", [(7,)])
+
+    assert archive_batch(database.connect(), 180, 500) == ([], 1)
+    assert database.statements("_history") == []
+    assert database.statements("DELETE") == []
+    assert database.commits == 1
+
+
+def test_run_stops_once_a_batch_is_short(archive):
+    result = archive_ads(retention_days=180, batch_size=2, max_batches=5)
+
+    assert result == {"message": "Archive run finished", "archived_ads": 5, "done": False}
+    assert len(archive.statements("SELECT a.ad_ID FROM ads a")) == 5
+
+    result = archive_ads(retention_days=180, batch_size=3, max_batches=5)
+
+    assert result == {"message": "Archive run finished", "archived_ads": 1, "done": True}
+
+
+def test_negative_retention_is_a_400(database):
+    with pytest.raises(HTTPException) as excinfo:
+        archive_ads(retention_days=-1)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,60 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+from api.main import QueryCache, StickyUsers
+
+
+@pytest.fixture
+def client(monkeypatch, database):
+    # A configured, healthy replica; reads record which server they were routed to
+    monkeypatch.setitem(main.replica_monitor.config, "host", "replica.test")
+    monkeypatch.setattr(main.replica_monitor, "usable", lambda: True)
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=100, ttl_seconds=30))
+    monkeypatch.setattr(main, "sticky_users", StickyUsers(main.READ_YOUR_WRITES_SECONDS))
+    monkeypatch.setattr(main, "route_counts", main.defaultdict(int))
+    database.routes = []
+    database.on(
+        "SELECT owner FROM ads WHERE ad_ID",
+        lambda params: database.routes.append(main.db_route.get()) or [{"owner": 5}],
+    )
+    return TestClient(main.app)
+
+
+def test_batch_runs_sub_requests(client, database):
+    response = client.post("/batch", json={"requests": [
+        {"id": "a", "path": "/ad/7/owner"},
+        {"id": "b", "path": "/ad/8/owner"},
+    ]})
+
+    assert response.status_code == 200
+    assert [(item["id"], item["status"], item["body"]["owner_id"]) for item in response.json()["responses"]] == [
+        ("a", 200, 5), ("b", 200, 5),
+    ]
+
+
+def test_paths_outside_the_allowlist_are_rejected(client):
+    response = client.post("/batch", json={"requests": [{"path": "/admin/export/transactions"}]})
+    assert response.status_code == 400
+
+
+def test_batch_is_a_read_for_replica_routing(client, database):
+    response = client.post("/batch", headers={"X-User-ID": "5"}, json={"requests": [{"path": "/ad/7/owner"}]})
+
+    assert response.status_code == 200
+    assert "set-cookie" not in response.headers
+    assert not main.sticky_users.any_sticky({"5"})
+    assert "writes" not in main.route_counts
+    assert database.routes == ["replica"]
+
+    # A later batch from the same browser still reads from the replica
+    client.post("/batch", json={"requests": [{"path": "/ad/8/owner"}]})
+    assert database.routes == ["replica", "replica"]
+
+
+def test_batch_after_a_write_reads_from_the_primary(client, database):
+    client.cookies.set(main.READ_YOUR_WRITES_COOKIE, "1")
+    response = client.post("/batch", json={"requests": [{"path": "/ad/7/owner"}]})
+
+    assert response.json()["responses"][0]["status"] == 200
+    assert database.routes == ["primary"]
@@ -0,0 +1,89 @@
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import (
+    BulkUserFilter, BulkUserSelection, BulkUserUpdateRequest, QueryCache,
+    bulk_deactivate_users, bulk_reset_user_passwords, bulk_update_users,
+)
+
+
+@pytest.fixture
+def users(database, monkeypatch):
+    # Users 1 (active) and 2 (inactive) exist; 3 does not
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+    rows = {1: (1, 1), 2: (2, 0)}
+    database.on("FOR UPDATE", lambda params: [rows[user_id] for user_id in params if user_id in rows])
+    return database
+
+
+def test_deactivate_touches_only_active_users(users):
+    result = bulk_deactivate_users(BulkUserSelection(user_ids=[3, 2, 1, 1]))
+
+    assert result["results"] == {1: "deactivated", 2: "already_inactive", 3: "not_found"}
+    assert result["summary"] == {"deactivated": 1, "already_inactive": 1, "not_found": 1}
+    [(_, lock_params)] = users.statements("FOR UPDATE")
+    assert lock_params == [1, 2, 3]
+    assert users.statements("UPDATE user SET active") == [
+        ("UPDATE user SET active = %s WHERE user_ID IN (%s)", (False, 1)),
+    ]
+    assert users.commits == 1
+
+
+def test_chunks_are_separate_transactions(users, monkeypatch):
+    monkeypatch.setattr(main, "BULK_CHUNK_SIZE", 2)
+
+    bulk_deactivate_users(BulkUserSelection(user_ids=[1, 2, 3]))
+
+    assert [params for _, params in users.statements("FOR UPDATE")] == [[1, 2], [3]]
+    assert users.commits == 2
+
+
+def test_passwords_are_hashed_before_the_rows_are_locked(users, monkeypatch):
+    hashed_while_locked = []
+    monkeypatch.setattr(main, "hash_password", lambda password: hashed_while_locked.append(
+        bool(users.statements("FOR UPDATE"))) or f"hash:{password}")
+
+    result = bulk_reset_user_passwords(BulkUserSelection(user_ids=[1, 2, 3]))
+
+    assert hashed_while_locked == [False, False, False]
+    assert result["results"] == {1: "reset", 2: "reset", 3: "not_found"}
+    assert set(result["new_passwords"]) == {1, 2}
+    [(query, params)] = users.statements("UPDATE user SET password")
+    assert "CASE user_ID WHEN %s THEN %s WHEN %s THEN %s END" in query
+    assert params == (1, f"hash:{result['new_passwords'][1]}", 2, f"hash:{result['new_passwords'][2]}", 1, 2)
+
+
+def test_update_refreshes_the_owners_listings(users):
+    request = BulkUserUpdateRequest(user_ids=[1, 2], changes={"last_name": "Lee"})
+
+    assert bulk_update_users(request)["summary"] == {"updated": 2}
+    assert users.statements("UPDATE user SET last_name")[0][1] == ("Lee", 1, 2)
+    assert len(users.statements("UPDATE listing l")) == 1
+
+
+def test_unique_fields_cannot_be_bulk_updated(users):
+    with pytest.raises(HTTPException) as excinfo:
+        bulk_update_users(BulkUserUpdateRequest(user_ids=[1], changes={"email": "a@x.com"}))
+    assert excinfo.value.status_code == 400
+
+
+def test_filter_selects_the_users(users):
+    users.on("SELECT u.user_ID FROM user u", [(2,), (1,)])
+
+    result = bulk_deactivate_users(BulkUserSelection(filter=BulkUserFilter(active=True)))
+
+    [(_, params)] = users.statements("SELECT u.user_ID FROM user u")
+    assert params == (True, main.BULK_MAX_USERS + 1)
+    assert set(result["results"]) == {1, 2}
+
+
+@pytest.mark.parametrize("selection", [
+    BulkUserSelection(),
+    BulkUserSelection(user_ids=[1], filter=BulkUserFilter()),
+    BulkUserSelection(user_ids=[]),
+])
+def test_selection_must_name_some_users(users, selection):
+    with pytest.raises(HTTPException) as excinfo:
+        bulk_deactivate_users(selection)
+    assert excinfo.value.status_code == 400
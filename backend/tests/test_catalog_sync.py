@@ -0,0 +1,55 @@
+from api import main
+from api.main import ListingCatalog, sync_listing_listener
+
+
+def synced_catalog(database, rows=()):
+    catalog = ListingCatalog()
+    catalog.load(list(rows))
+    sync_listing_listener(database.connect(), catalog)
+    return catalog
+
+
+def vehicle_ids(catalog):
+    return [row["vehicle_ID"] for row in catalog.query({})[1]]
+
+
+def test_sync_stops_at_the_settled_changes(database, listing_log, make_listing):
+    listing_log.listings = {vehicle_id: make_listing(vehicle_id) for vehicle_id in (10, 11)}
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=1)
+
+    catalog = synced_catalog(database)
+    assert catalog.change_cursor == 1
+    assert vehicle_ids(catalog) == [10]
+
+
+def test_late_commit_is_applied_by_the_next_sync(database, listing_log, make_listing):
+    listing_log.listings = {vehicle_id: make_listing(vehicle_id) for vehicle_id in (10, 11, 12)}
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=2, committed=False)
+    listing_log.log(3, 12, age=1)
+
+    catalog = synced_catalog(database)
+    assert catalog.change_cursor == 1
+
+    listing_log.commit(2)
+    listing_log.now += main.LISTING_CHANGE_SETTLE_SECONDS
+    sync_listing_listener(database.connect(), catalog)
+
+    assert catalog.change_cursor == 3
+    assert vehicle_ids(catalog) == [10, 11, 12]
+
+
+def test_sync_applies_deletes_and_pages_through_the_log(database, listing_log, make_listing, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_SYNC_BATCH_SIZE", 2)
+    listing_log.listings = {vehicle_id: make_listing(vehicle_id) for vehicle_id in (10, 11, 12)}
+    for change_id, vehicle_id in enumerate((10, 11, 12, 13), start=1):
+        listing_log.log(change_id, vehicle_id, age=100)
+
+    catalog = synced_catalog(database, [make_listing(13)])
+
+    assert catalog.change_cursor == 4
+    # Vehicle 13 has no listing row any more, so it was deleted
+    assert vehicle_ids(catalog) == [10, 11, 12]
+    # One read view per batch
+    assert database.commits == 3
@@ -0,0 +1,78 @@
+import mysql.connector
+
+from api import main
+from api.main import CircuitBreaker
+
+
+def make_breaker():
+    return CircuitBreaker(failure_threshold=3, window=10, reset_timeout=15, trial_calls=1)
+
+
+def test_opens_after_threshold_failures():
+    breaker = make_breaker()
+    for _ in range(2):
+        assert breaker.allow() == "closed"
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is None
+    assert breaker.stats()["rejected"] == 1
+    assert 1 <= breaker.retry_after <= 15
+
+
+def test_failures_outside_the_window_are_forgotten():
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.failures = type(breaker.failures)(when - 11 for when in breaker.failures)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.stats()["recent_failures"] == 1
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+
+    breaker.opened_at -= 15  # reset timeout elapsed
+    assert breaker.allow() == "trial"
+    assert breaker.allow() is None  # only trial_calls probes at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+    breaker.opened_at -= 15
+    assert breaker.allow() == "trial"
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() == "closed"
+
+
+def test_query_timeouts_do_not_trip_the_breaker(monkeypatch):
+    breaker = make_breaker()
+    monkeypatch.setattr(main, "db_breaker", breaker)
+
+    for _ in range(5):
+        exc = main.database_error(mysql.connector.Error(errno=main.QUERY_TIMEOUT_ERRNO))
+        assert exc.status_code == 503
+        assert exc.headers == {"Retry-After": "1"}
+
+    assert breaker.state == "closed"
+    assert breaker.stats()["query_timeouts"] == 5
+    assert breaker.stats()["recent_failures"] == 0
+
+
+def test_transient_errors_trip_the_breaker(monkeypatch):
+    breaker = make_breaker()
+    monkeypatch.setattr(main, "db_breaker", breaker)
+
+    for _ in range(3):
+        assert main.database_error(mysql.connector.Error(errno=2013)).status_code == 503
+    assert breaker.state == "open"
+
+    # A bad query is the caller's problem, not the server's
+    assert main.database_error(mysql.connector.Error(errno=1064)).status_code == 500
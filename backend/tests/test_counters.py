@@ -0,0 +1,87 @@
+import mysql.connector
+import pytest
+
+from api import main
+from api.main import CounterBuffer
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    # The background thread only wakes up after an hour, so flushes happen when the test calls them
+    buffer = CounterBuffer(flush_interval=3600, reconcile_interval=3600)
+    monkeypatch.setattr(main, "counter_buffer", buffer)
+    return buffer
+
+
+def test_deltas_are_coalesced_into_one_update_per_table(buffer, database):
+    buffer.add("owner_seller", 5, number_of_ads=1)
+    buffer.add("owner_seller", 5, number_of_ads=1, number_of_done_deals=1)
+    buffer.add("owner_seller", 6, number_of_ads=-1)
+
+    assert buffer.flush() == 3
+
+    [(query, params)] = database.statements("UPDATE owner_seller")
+    assert query == (
+        "UPDATE owner_seller SET "
+        "number_of_ads = GREATEST(number_of_ads + CASE user_id WHEN %s THEN %s WHEN %s THEN %s ELSE 0 END, 0), "
+        "number_of_done_deals = GREATEST(number_of_done_deals + CASE user_id WHEN %s THEN %s ELSE 0 END, 0) "
+        "WHERE user_id IN (%s, %s)"
+    )
+    assert params == [5, 2, 6, -1, 5, 1, 5, 6]
+    assert database.commits == 1
+    assert buffer.pending == {}
+
+
+def test_cancelled_out_deltas_are_not_written(buffer, database):
+    buffer.add("owner_seller", 5, number_of_ads=1)
+    buffer.add("owner_seller", 5, number_of_ads=-1)
+
+    assert buffer.flush() == 0
+    assert database.statements("UPDATE owner_seller") == []
+
+
+def test_inspector_deltas_logged_by_the_triggers_are_folded_in(buffer, database):
+    database.on("FROM counter_delta", [
+        {"delta_ID": 1, "user_id": 9, "inspections": 1, "certificates": 1},
+        {"delta_ID": 2, "user_id": 9, "inspections": 1, "certificates": 0},
+        {"delta_ID": 3, "user_id": 4, "inspections": -1, "certificates": 0},
+    ])
+
+    assert buffer.flush() == 3
+
+    [(query, params)] = database.statements("UPDATE inspector")
+    assert "number_of_inspections = GREATEST(number_of_inspections + CASE user_id" in query
+    assert params == [9, 2, 4, -1, 9, 1, 4, 9]
+    assert database.statements("DELETE FROM counter_delta") == [
+        ("DELETE FROM counter_delta WHERE delta_ID IN (%s, %s, %s)", (1, 2, 3)),
+    ]
+    # The logged rows are read, applied and deleted in one transaction
+    assert database.commits == 1
+
+
+def test_failed_flush_keeps_the_deltas(buffer, database):
+    def lose_connection(params):
+        raise mysql.connector.Error(msg="Lost connection", errno=2013)
+
+    database.on("UPDATE owner_seller", lose_connection)
+    buffer.add("owner_seller", 5, number_of_ads=1)
+
+    with pytest.raises(mysql.connector.Error):
+        buffer.flush()
+    assert buffer.pending == {("owner_seller", "number_of_ads", 5): 1}
+    assert database.commits == 0
+
+
+def test_deleting_a_sold_ad_keeps_its_done_deal(buffer, database):
+    database.on("SELECT associated_vehicle, owner FROM ads WHERE ad_ID", [{"associated_vehicle": 30, "owner": 5}])
+
+    main.delete_ad(7)
+
+    assert buffer.pending == {("owner_seller", "number_of_ads", 5): -1}
+
+
+def test_reconcile_never_lowers_done_deals():
+    # Sales of deleted ads are gone from ads and ads_history, but the deals were still done
+    assert "GREATEST(o.number_of_done_deals, COALESCE(a.done_deals, 0))" in " ".join(
+        main.COUNTER_RECONCILE_QUERIES[0].split()
+    )
@@ -0,0 +1,105 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+
+ROWS = [
+    (1, datetime(2024, 1, 2, 10), Decimal("100.00"), "paypal", "completed", "purchase", None, 7, 3, None),
+    (2, datetime(2024, 1, 3, 11), Decimal("25.50"), "crypto", "pending", "refund", None, None, 4, 1),
+    (3, datetime(2024, 1, 4, 12), Decimal("9.99"), "paypal", "completed", "deposit", None, None, 5, None),
+]
+
+
+@pytest.fixture
+def exports(database, monkeypatch):
+    # Three transactions, read back two per fetchmany; opened connections are kept
+    monkeypatch.setattr(main, "EXPORT_ROW_GROUP_SIZE", 2)
+    database.on("FROM transactions t", ROWS)
+    database.on("FROM ads a", [(1, datetime(2024, 1, 2), datetime(2024, 2, 2), 1, 5, "Active", 3, 9)])
+    database.connections = []
+
+    def connect():
+        connection = database.connect()
+        database.connections.append(connection)
+        return connection
+
+    monkeypatch.setattr(main, "get_db_connection", connect)
+    return database
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_csv_export_streams_every_row(exports, client):
+    response = client.get("/admin/export/transactions")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="transactions-' in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == [name for name, _, _ in main.EXPORT_DATASETS["transactions"]["columns"]]
+    assert [row[0] for row in rows[1:]] == ["1", "2", "3"]
+    assert rows[2][2] == "25.50"
+    [connection] = exports.connections
+    assert connection.closed
+
+
+def test_filters_and_time_limit_reach_the_query(exports, client):
+    response = client.get(
+        "/admin/export/transactions", params={"start": "2024-01-01", "end": "2024-02-01", "status": "completed,pending"}
+    )
+
+    assert response.status_code == 200
+    [(query, params)] = exports.statements("FROM transactions t")
+    assert "t.transaction_date >= %s AND t.transaction_date < %s AND t.payment_status IN (%s, %s)" in query
+    assert query.endswith("ORDER BY t.transaction_ID")
+    assert params == (date(2024, 1, 1), date(2024, 2, 1), "completed", "pending")
+
+
+def test_export_query_carries_its_own_time_limit(exports, client, monkeypatch):
+    hinted = []
+    monkeypatch.setattr(main, "time_limited", lambda query, ms=None: hinted.append(ms) or query)
+
+    client.get("/admin/export/ads")
+
+    assert hinted == [main.EXPORT_QUERY_TIMEOUT_MS]
+
+
+def test_parquet_export_round_trips(exports, client):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    response = client.get("/admin/export/ads", params={"format": "parquet"})
+
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column_names == [name for name, _, _ in main.EXPORT_DATASETS["ads"]["columns"]]
+    # BOOLEAN comes back from MySQL as 0/1
+    assert table.column("is_premium").to_pylist() == [True]
+    assert table.column("status").to_pylist() == ["Active"]
+
+
+def test_transactions_parquet_keeps_decimals_and_row_groups(exports, client):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    response = client.get("/admin/export/transactions", params={"format": "parquet"})
+
+    parquet = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet.metadata.num_row_groups == 2
+    assert parquet.read().column("price").to_pylist() == [row[2] for row in ROWS]
+
+
+@pytest.mark.parametrize("path, params, status", [
+    ("/admin/export/users", {}, 404),
+    ("/admin/export/ads", {"format": "xlsx"}, 400),
+    ("/admin/export/ads", {"status": "Gone"}, 400),
+])
+def test_bad_requests_open_no_connection(exports, client, path, params, status):
+    assert client.get(path, params=params).status_code == status
+    assert exports.connections == []
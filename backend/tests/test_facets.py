@@ -0,0 +1,30 @@
+def test_facets_ignore_their_own_filter(catalog):
+    facets = catalog.facets({"manufacturer": ["Toyota"], "condition": ["used"]})
+
+    assert facets["total"] == 1
+    # Every manufacturer with a used listing, though only Toyota is selected
+    assert facets["facets"]["manufacturer"] == {"Toyota": 1, "BMW": 2, "Fiat": 1}
+    # Every condition among the Toyotas
+    assert facets["facets"]["condition"] == {"used": 1, "new": 1}
+    assert facets["facets"]["vehicle_type"] == {"car": 1}
+
+    buckets = {bucket["min"]: bucket["count"] for bucket in facets["facets"]["price"]}
+    assert buckets[0] == 1
+    assert sum(buckets.values()) == 1
+    assert facets["facets"]["price"][-1]["max"] is None
+
+
+def test_price_facet_buckets(catalog):
+    buckets = {bucket["min"]: bucket["count"] for bucket in catalog.facets({})["facets"]["price"]}
+    # The NULL price counts in the lowest bucket
+    assert buckets == {0: 2, 5000: 1, 10000: 1, 20000: 1, 35000: 0, 50000: 0, 75000: 0, 100000: 0}
+
+
+def test_facets_follow_listing_changes(catalog, make_listing):
+    catalog.apply_listing_change(3, None)
+    catalog.apply_listing_change(6, make_listing(6, manufacturer="Audi", price=60000.0))
+
+    facets = catalog.facets({"exclude_owner": 2})
+    assert facets["total"] == 3
+    assert facets["facets"]["manufacturer"] == {"Toyota": 2, "Audi": 1}
+    assert {bucket["min"]: bucket["count"] for bucket in facets["facets"]["price"]}[50000] == 1
@@ -0,0 +1,130 @@
+import mysql.connector
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+from api.main import IdempotencyStore
+
+
+class IdempotencyTable:
+    # The idempotency_key table: scoped key -> [request_hash, status_code, response_body, content_type]
+    def __init__(self, database):
+        self.rows = {}
+        database.on("SELECT request_hash, status_code, response_body, content_type", self.finished)
+        database.on("INSERT INTO idempotency_key", self.insert)
+        database.on("UPDATE idempotency_key SET request_hash", rowcount=lambda params: 0)
+        database.on("UPDATE idempotency_key SET status_code", self.complete)
+        database.on("DELETE FROM idempotency_key WHERE idempotency_key", self.release)
+
+    def finished(self, params):
+        row = self.rows.get(params[0])
+        return [tuple(row)] if row and row[1] is not None else []
+
+    def insert(self, params):
+        key, request_hash = params
+        if key in self.rows:
+            raise mysql.connector.IntegrityError(msg="Duplicate entry", errno=1062)
+        self.rows[key] = [request_hash, None, None, None]
+        return []
+
+    def complete(self, params):
+        status_code, body, content_type, key = params
+        self.rows[key][1:] = [status_code, body, content_type]
+        return []
+
+    def release(self, params):
+        if self.rows.get(params[0], [None, None])[1] is None:
+            self.rows.pop(params[0], None)
+        return []
+
+
+@pytest.fixture
+def table(database, monkeypatch):
+    monkeypatch.setattr(main, "idempotency_store", IdempotencyStore(max_entries=100))
+    database.on("SELECT balance FROM user WHERE user_ID", [{"balance": 100.0}])
+    return IdempotencyTable(database)
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def top_up(client, amount=25, key="key-1", user_id=5, **headers):
+    return client.put(f"/user/{user_id}/balance", json={"amount": amount},
+                      headers={"Idempotency-Key": key, **headers})
+
+
+def balance_writes(database):
+    return len(database.statements("UPDATE user SET balance"))
+
+
+def test_retry_replays_the_stored_response(client, table, database):
+    first = top_up(client)
+    retry = top_up(client)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() == {"message": "Balance updated successfully", "new_balance": 125.0}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert balance_writes(database) == 1
+    assert main.idempotency_store.stats()["replayed"] == 1
+
+
+def test_replay_survives_a_cold_cache(client, table, database, monkeypatch):
+    top_up(client)
+    # Another process, or this one after a restart: only the table knows the key
+    monkeypatch.setattr(main, "idempotency_store", IdempotencyStore(max_entries=100))
+
+    assert top_up(client).headers["Idempotent-Replayed"] == "true"
+    assert balance_writes(database) == 1
+
+
+def test_key_reused_for_another_body_is_rejected(client, table, database):
+    top_up(client, amount=25)
+    assert top_up(client, amount=50).status_code == 422
+    assert balance_writes(database) == 1
+
+
+def test_keys_are_scoped_per_caller_and_path(client, table, database):
+    top_up(client, user_id=5)
+    top_up(client, user_id=6)
+    top_up(client, user_id=5, Authorization="Bearer other")
+
+    assert balance_writes(database) == 3
+    assert len(table.rows) == 3
+
+
+def test_overlapping_retry_gets_a_conflict(client, table, database):
+    # The first request claimed the key and is still running
+    key = main.scoped_idempotency_key(
+        {"method": "PUT", "path": "/user/5/balance", "headers": [], "client": ("testclient", 50000)}, "key-1"
+    )
+    table.rows[key] = ["in-flight", None, None, None]
+
+    assert top_up(client).status_code == 409
+    assert balance_writes(database) == 0
+
+
+def test_client_errors_are_stored_and_server_errors_released(client, table, database):
+    assert top_up(client, amount=-500).status_code == 400
+    assert top_up(client, amount=-500).headers["Idempotent-Replayed"] == "true"
+
+    def lose_connection(params):
+        raise mysql.connector.Error(msg="Lost connection", errno=2013)
+
+    database.rules.insert(0, ("UPDATE user SET balance", lose_connection, None, None))
+    failing = TestClient(main.app, raise_server_exceptions=False)
+    assert top_up(failing, key="key-2").status_code >= 500
+    assert len(table.rows) == 1  # the 5xx claim was dropped so the retry runs again
+
+
+def test_requests_without_a_key_are_untouched(client, table, database):
+    client.put("/user/5/balance", json={"amount": 1})
+    client.put("/user/5/balance", json={"amount": 1})
+    assert balance_writes(database) == 2
+    assert table.rows == {}
+
+
+def test_overlong_key_is_rejected(client, table):
+    assert top_up(client, key="k" * 256).status_code == 400
@@ -0,0 +1,91 @@
+import zlib
+
+from api.main import ListingCatalog
+
+
+def ids(page):
+    return [row["vehicle_ID"] for row in page]
+
+
+def test_load_keeps_the_change_cursor(catalog):
+    assert catalog.change_cursor == 9
+    assert catalog.query({})[0] == 5
+
+
+def test_set_and_range_filters(catalog):
+    total, page = catalog.query({"manufacturer": ["Toyota", "BMW"], "min_price": 5000})
+    assert total == 2
+    assert ids(page) == [2, 3]
+
+    # A NULL price never matches a price range, as in SQL
+    assert ids(catalog.query({"max_price": 100000})[1]) == [1, 2, 3, 5]
+    assert ids(catalog.query({"min_year": 2016, "max_year": 2020})[1]) == [2, 3]
+    assert ids(catalog.query({"status": ["Sold"]})[1]) == [4]
+    assert catalog.query({"manufacturer": ["Audi"]})[0] == 0
+
+
+def test_exclude_owner_also_drops_ownerless_listings(catalog):
+    assert ids(catalog.query({"exclude_owner": 1})[1]) == [3, 4]
+
+
+def test_sorting_puts_nulls_first_ascending_and_last_descending(catalog):
+    assert ids(catalog.query({}, sort="price")[1]) == [4, 1, 5, 2, 3]
+    assert ids(catalog.query({}, sort="-price")[1]) == [3, 2, 5, 1, 4]
+    assert ids(catalog.query({}, sort="-mileage")[1])[-1] == 5
+
+
+def test_paging_and_fields(catalog):
+    total, page = catalog.query({}, sort="-price", offset=1, limit=2, fields=["vehicle_ID", "price", "user_ID"])
+    assert total == 5
+    assert page == [
+        {"vehicle_ID": 2, "price": 12000.0, "user_ID": 1},
+        {"vehicle_ID": 5, "price": 8000.0, "user_ID": None},
+    ]
+
+
+def test_materialized_rows_match_the_source(catalog, make_listing):
+    row = catalog.query({"manufacturer": ["BMW"]}, limit=1)[1][0]
+    assert row == dict(make_listing(3, manufacturer="BMW", price=30000.0, year=2020, ad_owner=2, views=1), user_ID=2)
+
+
+def test_listing_changes_are_applied_in_place(catalog, make_listing):
+    catalog.apply_listing_change(1, make_listing(1, manufacturer="Toyota", price=4500.0))
+    catalog.apply_listing_change(3, None)
+    catalog.apply_listing_change(6, make_listing(6, manufacturer="Audi"))
+    catalog.apply_listing_change(2, make_listing(2, ad_ID=None))  # ad deleted
+
+    assert ids(catalog.query({})[1]) == [1, 4, 5, 6]
+    assert catalog.query({"manufacturer": ["Audi"]})[0] == 1
+    assert catalog.rows_for_ads([1001], ["vehicle_ID", "price"]) == [{"vehicle_ID": 1, "price": 4500.0}]
+    assert catalog.rows_for_ads([1003, 1002]) == []
+    assert catalog.version == 4
+
+
+def test_catalog_grows_past_its_capacity(make_listing):
+    catalog = ListingCatalog()
+    catalog.load([])
+    for vehicle_id in range(1, 3001):
+        catalog.apply_listing_change(vehicle_id, make_listing(vehicle_id))
+    assert catalog.query({})[0] == 3000
+    assert ids(catalog.query({}, sort="-vehicle_ID", limit=1)[1]) == [3000]
+
+
+def test_checksum(catalog):
+    checksum = catalog.checksum()
+    assert checksum["listings"] == 5
+    assert checksum["id_sum"] == 15
+    assert checksum["price_sum"] == 54000.0
+    assert checksum["views_sum"] == 33
+    # Same as SUM(CRC32(CONCAT_WS('|', vehicle_ID, status))) over the listing table
+    assert checksum["status_sum"] == sum(
+        zlib.crc32(f"{vehicle_id}|{status}".encode())
+        for vehicle_id, status in [(1, "Active"), (2, "Active"), (3, "Active"), (4, "Sold"), (5, "Active")]
+    )
+    # CONCAT_WS skips the NULL owner and rating of vehicle 5
+    assert checksum["owner_sum"] == sum(
+        zlib.crc32(text.encode()) for text in ["1|1|4.5", "2|1|4.5", "3|2|4.5", "4|2|4.5", "5"]
+    )
+
+    excluded = catalog.checksum(exclude=[3, 42])
+    assert excluded["listings"] == 4
+    assert excluded["id_sum"] == 12
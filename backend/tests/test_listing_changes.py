@@ -0,0 +1,59 @@
+from api import main
+from api.main import get_listing_changes, settled_listing_change
+
+
+def test_settled_change_is_the_newest_one_past_the_window(database, listing_log):
+    cursor = database.connect().cursor(dictionary=True)
+    assert settled_listing_change(cursor) == 0
+
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=1)
+    assert settled_listing_change(cursor) == 1
+
+    listing_log.now += main.LISTING_CHANGE_SETTLE_SECONDS
+    assert settled_listing_change(cursor) == 2
+
+
+def test_changes_stop_at_the_settled_horizon(listing_log, make_listing):
+    listing_log.listings = {vehicle_id: make_listing(vehicle_id) for vehicle_id in (10, 11)}
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=1)
+
+    page = get_listing_changes(since=0, limit=100, fields=None)
+    assert page["cursor"] == 1
+    assert [row["vehicle_ID"] for row in page["upserted"]] == [10]
+    assert page["upserted"][0]["version"] == 1
+
+
+def test_late_commit_below_the_cursor_is_not_skipped(listing_log, make_listing):
+    # Change 2 takes its ID first but commits after change 3. Had the cursor moved to 3 when only 3
+    # was visible, change 2 would never be handed out.
+    listing_log.listings = {vehicle_id: make_listing(vehicle_id) for vehicle_id in (10, 11, 12)}
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=2, committed=False)
+    listing_log.log(3, 12, age=1)
+
+    first = get_listing_changes(since=0, limit=100, fields=None)
+    assert first["cursor"] == 1
+
+    listing_log.commit(2)
+    listing_log.now += main.LISTING_CHANGE_SETTLE_SECONDS
+    second = get_listing_changes(since=first["cursor"], limit=100, fields=None)
+
+    assert second["cursor"] == 3
+    assert [row["vehicle_ID"] for row in second["upserted"]] == [11, 12]
+
+
+def test_deletes_and_collapsed_changes(listing_log, make_listing):
+    listing_log.listings = {10: make_listing(10)}
+    listing_log.log(1, 10, age=100)
+    listing_log.log(2, 11, age=100)
+    listing_log.log(3, 11, age=100, change_type="delete")
+    listing_log.log(4, 12, age=100)  # logged, then its row went away
+
+    page = get_listing_changes(since=0, limit=100, fields=None)
+    assert [row["vehicle_ID"] for row in page["upserted"]] == [10]
+    assert sorted(page["deleted"]) == [11, 12]
+    assert page["has_more"] is False
+
+    assert get_listing_changes(since=0, limit=2, fields=None)["has_more"] is True
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+
+from api.main import ListingCatalog, LocationGrid, haversine_km, normalize_location, radius_bounds
+
+AUSTIN = (30.2672, -97.7431)
+DALLAS = (32.7767, -96.7970)
+BOSTON = (42.3601, -71.0589)
+
+
+def test_grid_candidates_cover_the_box():
+    grid = LocationGrid()
+    grid.add(0, *AUSTIN)
+    grid.add(1, *DALLAS)
+    grid.add(2, *BOSTON)
+    grid.add(3, math.nan, math.nan)
+
+    assert grid.candidates(30, 31, -98, -97).tolist() == [0]
+    assert grid.candidates(29, 33, -99, -96).tolist() == [0, 1]
+    assert grid.candidates(0, 1, 0, 1).tolist() == []
+
+    grid.discard(0, *AUSTIN)
+    assert grid.candidates(29, 33, -99, -96).tolist() == [1]
+    assert len(grid.cells) == 2
+
+
+def test_grid_add_many_skips_rows_without_coordinates():
+    grid = LocationGrid()
+    grid.add_many(np.array([AUSTIN[0], np.nan, BOSTON[0]]), np.array([AUSTIN[1], np.nan, BOSTON[1]]))
+    assert grid.candidates(-90, 90, -180, 180).tolist() == [0, 2]
+
+
+def test_haversine_and_radius_bounds():
+    distance = haversine_km(*AUSTIN, np.array([DALLAS[0]]), np.array([DALLAS[1]]))[0]
+    assert 290 < distance < 295
+
+    min_lat, max_lat, min_lon, max_lon = radius_bounds(*AUSTIN, 300)
+    assert min_lat < DALLAS[0] < max_lat and min_lon < DALLAS[1] < max_lon
+
+
+def test_normalize_location():
+    assert normalize_location("  austin ", "texas") == ("Austin", "TX", *AUSTIN)
+    assert normalize_location("Smallville", "kansas") == ("Smallville", "KS", None, None)
+    assert normalize_location(None, None) == (None, None, None, None)
+
+
+def test_catalog_radius_and_bbox_filters(make_listing):
+    catalog = ListingCatalog()
+    catalog.load([
+        make_listing(1, latitude=AUSTIN[0], longitude=AUSTIN[1]),
+        make_listing(2, latitude=DALLAS[0], longitude=DALLAS[1], manufacturer="BMW"),
+        make_listing(3, latitude=BOSTON[0], longitude=BOSTON[1]),
+        make_listing(4),
+    ])
+
+    ids = lambda filters: [row["vehicle_ID"] for row in catalog.query(filters)[1]]
+    assert ids({"near": (*AUSTIN, 100.0)}) == [1]
+    assert ids({"near": (*AUSTIN, 300.0)}) == [1, 2]
+    assert ids({"near": (*AUSTIN, 300.0), "manufacturer": ["BMW"]}) == [2]
+    assert ids({"bbox": (40, 45, -75, -70)}) == [3]
+    assert catalog.facets({"near": (*AUSTIN, 300.0)})["total"] == 2
+
+    # Moving a listing moves it between grid cells
+    catalog.apply_listing_change(3, make_listing(3, latitude=DALLAS[0], longitude=DALLAS[1]))
+    assert ids({"bbox": (40, 45, -75, -70)}) == []
+    assert ids({"near": (*AUSTIN, 300.0)}) == [1, 2, 3]
@@ -0,0 +1,130 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PHOTO_STORAGE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    # Originals handed to the variant pool
+    submitted = []
+    monkeypatch.setattr(main, "submit_photo_variants", submitted.extend)
+    return submitted
+
+
+@pytest.fixture
+def vehicle(database):
+    database.on("SELECT 1 FROM vehicles WHERE vehicle_ID", [(1,)])
+    database.on(
+        "SELECT photo_ID, photo_url FROM vehicle_photos",
+        lambda params: [{"photo_ID": index, "photo_url": url} for index, url in enumerate(params[1:], 1)],
+    )
+    return database
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, raise_server_exceptions=False)
+
+
+def stored_keys(storage):
+    return sorted(name for name in os.listdir(storage) if name != ".incoming")
+
+
+def test_photos_are_stored_and_recorded(storage, submitted, vehicle, client):
+    response = client.post("/vehicle/1/photos", files=[
+        ("photo", ("a.png", PNG, "image/png")),
+        ("photo", ("b.jpg", b"\xff\xd8\xff" + b"\x00" * 64, "image/jpeg")),
+    ], data={"caption": "ignored"})
+
+    assert response.status_code == 200
+    keys = stored_keys(storage)
+    assert len(keys) == 2
+    photos = response.json()["photos"]
+    assert sorted(photo["photo_url"].split("/")[2] for photo in photos) == keys
+    assert photos[0]["variants"]["original"].endswith("/original")
+    assert sorted(os.listdir(storage / ".incoming")) == []
+    inserts = vehicle.statements("INSERT INTO vehicle_photos")
+    assert [params for _, params in inserts] == [(1, photo["photo_url"]) for photo in photos]
+    assert sorted(os.path.relpath(path, storage).split(os.sep)[0] for path in submitted) == keys
+    assert sorted(os.path.basename(path) for path in submitted) == ["original.jpg", "original.png"]
+    assert vehicle.commits == 1
+
+
+def test_incoming_files_are_opened_off_the_event_loop(storage, submitted, vehicle, client, monkeypatch):
+    on_loop = []
+    open_incoming = main.PhotoUploadParser._open_incoming
+
+    def recording(self, key):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return open_incoming(self, key)
+
+    monkeypatch.setattr(main.PhotoUploadParser, "_open_incoming", recording)
+
+    response = client.post("/vehicle/1/photos", files=[("photo", ("a.png", PNG, "image/png"))])
+
+    assert response.status_code == 200
+    assert on_loop == [False]
+
+
+def test_non_image_is_rejected_and_cleaned_up(storage, vehicle, client):
+    response = client.post("/vehicle/1/photos", files=[
+        ("photo", ("a.png", PNG, "image/png")),
+        ("photo", ("b.txt", b"just some text", "text/plain")),
+    ])
+
+    assert response.status_code == 415
+    assert stored_keys(storage) == []
+    assert os.listdir(storage / ".incoming") == []
+    assert vehicle.statements("INSERT INTO vehicle_photos") == []
+
+
+def test_oversized_photo_is_a_413(storage, vehicle, client, monkeypatch):
+    monkeypatch.setattr(main, "PHOTO_MAX_BYTES", 32)
+
+    response = client.post("/vehicle/1/photos", files=[("photo", ("a.png", PNG, "image/png"))])
+
+    assert response.status_code == 413
+    assert os.listdir(storage / ".incoming") == []
+
+
+def test_unknown_vehicle_is_a_404(storage, database, client):
+    response = client.post("/vehicle/1/photos", files=[("photo", ("a.png", PNG, "image/png"))])
+
+    assert response.status_code == 404
+    assert not os.path.exists(storage / ".incoming")
+
+
+def test_upload_without_files_is_a_400(storage, vehicle, client):
+    response = client.post("/vehicle/1/photos", files=[("photo", ("", b"", "application/octet-stream"))],
+                           data={"caption": "only a field"})
+
+    assert response.status_code == 400
+
+
+def test_failed_insert_removes_the_stored_files(storage, submitted, vehicle, client):
+    def fail(params):
+        raise main.mysql.connector.Error("connection lost")
+
+    vehicle.rules.insert(0, ("INSERT INTO vehicle_photos", fail, None, None))
+
+    response = client.post("/vehicle/1/photos", files=[("photo", ("a.png", PNG, "image/png"))])
+
+    assert response.status_code >= 500
+    assert stored_keys(storage) == []
+    assert submitted == []
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from api.main import PriceEstimator
+
+BASE_PRICES = {("Toyota", "Corolla"): 20000, ("Toyota", "Camry"): 26000, ("BMW", "X5"): 45000}
+
+
+def sales(conditions=("used", "certified pre-owned"), count=60, seed=0):
+    # (manufacturer, model, year, mileage, condition, sold_price) rows losing ~8% a year
+    rng = np.random.default_rng(seed)
+    rows = []
+    for (manufacturer, model), base in BASE_PRICES.items():
+        for i in range(count):
+            year = 2010 + i % 14
+            mileage = 5000 + (i * 7919) % 200000
+            condition = conditions[i % len(conditions)]
+            price = base * np.exp(-0.08 * (2024 - year)) * float(np.exp(rng.normal(0, 0.05)))
+            rows.append((manufacturer, model, year, mileage, condition, round(price, 2)))
+    return rows
+
+
+@pytest.fixture
+def estimator():
+    estimator = PriceEstimator()
+    estimator.reference_year = 2024
+    estimator.load(sales())
+    return estimator
+
+
+def test_estimate_uses_the_model_segment(estimator):
+    estimate = estimator.estimate("toyota", " Corolla ", 2020, 40000, "used")
+
+    assert estimate["segment"] == "model"
+    assert estimate["sample_size"] == 60
+    assert estimate["low"] < estimate["estimate"] < estimate["high"]
+    assert 20000 * np.exp(-0.08 * 4) * 0.8 < estimate["estimate"] < 20000 * np.exp(-0.08 * 4) * 1.2
+
+
+def test_newer_and_pricier_models_estimate_higher(estimator):
+    corolla = estimator.estimate("Toyota", "Corolla", 2020, 40000, "used")["estimate"]
+    assert estimator.estimate("Toyota", "Corolla", 2012, 40000, "used")["estimate"] < corolla
+    assert estimator.estimate("BMW", "X5", 2020, 40000, "used")["estimate"] > corolla
+
+
+def test_unknown_model_falls_back_to_a_wider_segment(estimator):
+    assert estimator.estimate("Toyota", "Yaris", 2020, 40000, "used")["segment"] == "manufacturer"
+    assert estimator.estimate("Audi", "A4", 2020, 40000, "used")["segment"] == "market"
+
+
+def test_condition_never_sold_has_no_estimate(estimator):
+    # Every sale was used or certified, so nothing says what "new" is worth
+    assert estimator.estimate("Toyota", "Corolla", 2024, 10, "new") is None
+
+
+def test_condition_sold_elsewhere_uses_that_segment(estimator):
+    estimator.record_sale("BMW", "X5", 2024, 100, "new", 52000)
+
+    assert estimator.estimate("BMW", "X5", 2024, 100, "new")["segment"] == "model"
+    corolla = estimator.estimate("Toyota", "Corolla", 2024, 100, "new")
+    assert corolla["segment"] == "market"
+    assert corolla["sample_size"] == 181
+
+
+def test_record_sale_matches_a_full_reload():
+    rows = sales(conditions=("used", "new"))
+    incremental = PriceEstimator()
+    incremental.reference_year = 2024
+    incremental.load(rows[:-10])
+    for row in rows[-10:]:
+        incremental.record_sale(*row)
+
+    reloaded = PriceEstimator()
+    reloaded.reference_year = 2024
+    reloaded.load(rows)
+
+    for condition in ("used", "new"):
+        assert incremental.estimate("BMW", "X5", 2018, 70000, condition) == \
+            reloaded.estimate("BMW", "X5", 2018, 70000, condition)
+
+
+def test_unsold_and_unpriced_rows_are_ignored():
+    estimator = PriceEstimator()
+    estimator.load([("Toyota", "Corolla", None, 1000, "used", 9000), ("Toyota", "Corolla", 2020, 1000, "used", 0)])
+    assert estimator.sales == 0
+    assert estimator.estimate("Toyota", "Corolla", 2020, 1000, "used") is None
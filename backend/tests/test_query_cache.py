@@ -0,0 +1,111 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from api import main
+from api.main import QueryCache
+
+
+def test_get_returns_what_was_set():
+    cache = QueryCache(max_entries=10, ttl_seconds=30)
+    assert cache.get("a") == (False, None)
+
+    cache.set("a", 1, ["user:1"])
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2, ttl_seconds=30)
+    cache.set("a", 1, [])
+    cache.set("b", 2, [])
+    cache.get("a")
+    cache.set("c", 3, [])
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_a_miss():
+    cache = QueryCache(max_entries=10, ttl_seconds=30)
+    cache.set("a", 1, [], ttl_seconds=-1)
+
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_drops_only_tagged_entries():
+    cache = QueryCache(max_entries=10, ttl_seconds=30)
+    cache.set("profile", 1, ["user:1"])
+    cache.set("ads", 2, ["user:1", "ad:7"])
+    cache.set("other", 3, ["user:2"])
+
+    cache.invalidate("user:1")
+
+    assert cache.get("profile") == (False, None)
+    assert cache.get("ads") == (False, None)
+    assert cache.get("other") == (True, 3)
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_result_read_before_an_invalidation_is_not_stored():
+    cache = QueryCache(max_entries=10, ttl_seconds=30)
+    versions = cache.tag_versions(["user:1"])
+    cache.invalidate("user:1")  # a write commits while the query runs
+
+    cache.set("profile", "stale", ["user:1"], versions)
+    assert cache.get("profile") == (False, None)
+
+    cache.set("profile", "fresh", ["user:1"], cache.tag_versions(["user:1"]))
+    assert cache.get("profile") == (True, "fresh")
+
+
+def test_cached_endpoint_caches_results_and_not_found(monkeypatch):
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+    calls = []
+
+    @main.cached("user_profile", lambda user_id: [f"user:{user_id}"])
+    def get_profile(user_id):
+        calls.append(user_id)
+        if user_id == 2:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"user_ID": user_id}
+
+    async def fetch(user_id):
+        try:
+            return await get_profile(user_id=user_id)
+        except HTTPException as exc:
+            return exc.status_code
+
+    assert asyncio.run(fetch(1)) == {"user_ID": 1}
+    assert asyncio.run(fetch(1)) == {"user_ID": 1}
+    assert asyncio.run(fetch(2)) == 404
+    assert asyncio.run(fetch(2)) == 404
+    assert calls == [1, 2]
+
+    main.query_cache.invalidate("user:1")
+    asyncio.run(fetch(1))
+    assert calls == [1, 2, 1]
+
+
+def test_each_cached_not_found_raises_a_fresh_exception(monkeypatch):
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+
+    @main.cached("ad_owner", lambda ad_id: [f"ad:{ad_id}"])
+    def get_owner(ad_id):
+        raise HTTPException(status_code=404, detail="Ad not found")
+
+    async def fetch():
+        try:
+            await get_owner(ad_id=1)
+        except HTTPException as exc:
+            return exc
+
+    raised = [asyncio.run(fetch()) for _ in range(3)]
+    assert len({id(exc) for exc in raised}) == 3
+    assert all(exc.status_code == 404 and exc.detail == "Ad not found" for exc in raised)
+    assert main.query_cache.stats()["hits"] == 2
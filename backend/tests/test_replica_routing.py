@@ -0,0 +1,68 @@
+import threading
+
+import mysql.connector
+import pytest
+
+from api import main
+from api.main import CircuitBreaker
+from tests.conftest import FakeDatabase
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    # Connections opened per server; the replica refuses them while `replica_up` is False
+    opened = {"primary": 0, "replica": 0}
+    state = {"replica_up": False}
+
+    def open_connection(config):
+        server = "replica" if config is main.REPLICA_CONFIG else "primary"
+        opened[server] += 1
+        if server == "replica" and not state["replica_up"]:
+            raise mysql.connector.Error(msg="Can't connect to MySQL server", errno=2003)
+        return FakeDatabase().connect()
+
+    monkeypatch.setattr(main, "open_connection", open_connection)
+    monkeypatch.setattr(main.replica_monitor, "usable", lambda: True)
+    monkeypatch.setattr(main, "db_breaker", CircuitBreaker(3, 10, 15, 1))
+    monkeypatch.setattr(main, "replica_breaker", CircuitBreaker(3, 10, 15, 1))
+    token = main.db_route.set("replica")
+    yield opened, state
+    main.db_route.reset(token)
+
+
+def test_dead_replica_trips_its_breaker_and_reads_fall_back(servers):
+    opened, state = servers
+    for _ in range(5):
+        assert main.get_db_connection() is not None
+
+    # Three failed replica connects opened the breaker; the rest went straight to the primary
+    assert opened == {"primary": 5, "replica": 3}
+    assert main.replica_breaker.state == "open"
+    assert main.db_breaker.state == "closed"
+
+
+def test_replica_breaker_closes_after_a_good_probe(servers):
+    opened, state = servers
+    for _ in range(3):
+        main.get_db_connection()
+    state["replica_up"] = True
+    main.replica_breaker.opened_at -= 15
+
+    main.get_db_connection()
+    assert main.replica_breaker.state == "closed"
+    assert opened == {"primary": 3, "replica": 4}
+
+
+def test_route_counts_are_not_lost_across_threads(monkeypatch):
+    monkeypatch.setattr(main, "route_counts", main.defaultdict(int))
+
+    def count():
+        for _ in range(20000):
+            main.count_route("reads_replica")
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert main.route_counts["reads_replica"] == 160000
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import RollupJob, get_activity_report, truncate_bucket
+
+
+@pytest.fixture
+def report(database, monkeypatch):
+    monkeypatch.setattr(main.rollup_job, "ensure_started", lambda: None)
+    database.on("FROM activity_rollup", [
+        {"bucket_start": datetime(2024, 3, 2), "new_ads": 4, "new_offers": 2, "offer_value": 900,
+         "purchases": 1, "gmv": 500, "refunds": 0},
+    ])
+    return database
+
+
+def test_missing_buckets_are_zeros(report):
+    result = get_activity_report("day", start=datetime(2024, 3, 1, 15), end=datetime(2024, 3, 4))
+
+    assert result["start"] == datetime(2024, 3, 1)
+    assert [point["bucket_start"] for point in result["series"]] == [
+        datetime(2024, 3, 1), datetime(2024, 3, 2), datetime(2024, 3, 3),
+    ]
+    assert result["series"][0]["new_ads"] == 0 and result["series"][0]["offers_per_ad"] is None
+    assert result["series"][1]["offers_per_ad"] == 0.5
+    assert result["totals"]["gmv"] == 500
+    assert result["totals"]["conversion_rate"] == 0.5
+
+
+def test_aware_bounds_are_converted_to_server_local_time(report):
+    start = datetime(2024, 3, 1, 10, 30, tzinfo=timezone(timedelta(hours=5)))
+    end = datetime(2024, 3, 1, 14, tzinfo=timezone.utc)
+
+    result = get_activity_report("hour", start=start, end=end)
+
+    local_start = start.astimezone().replace(tzinfo=None, minute=0)
+    assert result["start"] == local_start and result["start"].tzinfo is None
+    [(_, params)] = report.statements("FROM activity_rollup")
+    assert params == ("hour", local_start, end.astimezone().replace(tzinfo=None, minute=0))
+    assert result["series"][0]["bucket_start"] == local_start
+
+
+def test_mixed_naive_and_aware_bounds_compare(report):
+    end = datetime(2024, 3, 4, tzinfo=timezone.utc)
+    start = end.astimezone().replace(tzinfo=None) - timedelta(days=2)
+
+    result = get_activity_report("day", start=start, end=end)
+
+    assert len(result["series"]) == 2
+
+
+def test_empty_range_is_a_400(report):
+    with pytest.raises(HTTPException) as excinfo:
+        get_activity_report("day", start=datetime(2024, 3, 2), end=datetime(2024, 3, 2, 12))
+    assert excinfo.value.status_code == 400
+
+
+def test_too_many_buckets_is_a_400(report):
+    with pytest.raises(HTTPException) as excinfo:
+        get_activity_report("hour", start=datetime(2024, 1, 1), end=datetime(2024, 3, 1))
+    assert excinfo.value.status_code == 400
+
+
+def test_truncate_bucket():
+    moment = datetime(2024, 3, 1, 15, 42, 7, 12)
+    assert truncate_bucket(moment, "hour") == datetime(2024, 3, 1, 15)
+    assert truncate_bucket(moment, "day") == datetime(2024, 3, 1)
+
+
+def test_advance_folds_a_batch_and_moves_the_cursor(database, monkeypatch):
+    monkeypatch.setattr(main, "ROLLUP_BATCH_IDS", 100)
+    database.on("SELECT last_id FROM rollup_cursor", [(40,)])
+    database.on("SELECT MAX(ad_ID) FROM ads", [(250,)])
+
+    assert RollupJob(60)._advance("ads") == (100, True)
+
+    upserts = database.statements("INSERT INTO activity_rollup")
+    assert [params for _, params in upserts] == [("hour", 40, 140), ("day", 40, 140)]
+    assert "new_ads = new_ads + VALUES(new_ads)" in upserts[0][0]
+    assert database.statements("UPDATE rollup_cursor") == [
+        ("UPDATE rollup_cursor SET last_id = %s WHERE source = %s", (140, "ads")),
+    ]
+    assert database.commits == 1
+
+
+def test_advance_without_new_rows_commits_nothing_else(database):
+    database.on("SELECT last_id FROM rollup_cursor", [(40,)])
+    database.on("SELECT MAX(ad_ID) FROM ads", [(None,)])
+
+    assert RollupJob(60)._advance("ads") == (0, False)
+    assert database.statements("INSERT INTO activity_rollup") == []
+    assert database.statements("UPDATE rollup_cursor") == []
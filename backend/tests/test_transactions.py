@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException
+
+from api import main
+from api.main import QueryCache, create_transaction, get_user_transactions
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(main, "query_cache", QueryCache(max_entries=10, ttl_seconds=30))
+
+
+def test_transaction_on_an_archived_ad_is_accepted(database):
+    database.on("FROM ads_history WHERE ad_ID", lambda params: [(1,)] if params == (7, 7) else [])
+
+    create_transaction(100.0, "paypal", "purchase", paid_by=1, belonged_ad=7)
+
+    [(query, _)] = database.statements("UNION ALL")
+    assert "FROM ads WHERE" in query and "FROM ads_history WHERE" in query
+    [(_, params)] = database.statements("INSERT INTO transactions")
+    assert params[4] == 7
+    assert database.commits == 1
+
+
+def test_transaction_on_a_missing_ad_is_a_404(database):
+    with pytest.raises(HTTPException) as excinfo:
+        create_transaction(100.0, "paypal", "purchase", paid_by=1, belonged_ad=7)
+
+    assert excinfo.value.status_code == 404
+    assert database.statements("INSERT INTO transactions") == []
+
+
+def test_transaction_without_an_ad_skips_the_check(database):
+    create_transaction(100.0, "paypal", "deposit", paid_by=1)
+
+    assert database.statements("UNION ALL") == []
+    assert len(database.statements("INSERT INTO transactions")) == 1
+
+
+def test_user_transactions_params_fill_every_placeholder():
+    params = main.user_transactions_params(3, 99, 20)
+
+    assert len(params) == main.USER_TRANSACTIONS_QUERY.count("%s")
+    assert params[-1] == 20
+
+
+def test_user_transactions_resolve_archived_ads(database):
+    row = {
+        "transaction_ID": 5, "transaction_date": None, "price": 100.0, "payment_method": "paypal",
+        "payment_status": "completed", "transaction_type": "purchase", "review": None, "belonged_ad": 7,
+        "payer_user_ID": 1, "payer_first_name": "Ann", "payer_last_name": "Lee",
+        "payer_phone_number": "555-0100", "payer_email": "ann@example.com",
+        "approver_user_ID": None, "approver_first_name": None, "approver_last_name": None,
+        "approver_phone_number": None, "approver_email": None,
+        "owner_user_ID": 2, "owner_first_name": "Bo", "owner_last_name": "Kim",
+        "owner_phone_number": "555-0101", "owner_email": "bo@example.com",
+        "associated_vehicle": 9, "ad_status": "Sold", "ad_archived": 1,
+        "manufacturer": "BMW", "model": "M3", "year": 2020,
+    }
+    database.on("FROM transactions WHERE paid_by", [row])
+
+    result = get_user_transactions(1)
+
+    [(query, params)] = database.statements("FROM transactions WHERE paid_by")
+    assert "LEFT JOIN ads_history ah" in query and "FROM ads_history oa" in query
+    assert params == main.user_transactions_params(1, 2147483647, main.TRANSACTION_PAGE_SIZE)
+    [transaction] = result["transactions"]
+    assert transaction["ad_details"]["archived"] is True
+    assert transaction["approver_details"] is None
+    assert transaction["owner_details"]["user_ID"] == 2
@@ -37,7 +37,7 @@ export default function AdminPage() {
 
   // 1. Fetch All Users
   useEffect(() => {
-    fetch(`${process.env.NEXT_PUBLIC_API_URL}/admin/users`)
+    fetch(`${process.env.NEXT_PUBLIC_API_URL}/admin/users`, {credentials: 'include'})
       .then((res) => {
         if (!res.ok) throw new Error('Failed to fetch users');
         return res.json();
@@ -117,6 +117,7 @@ export default function AdminPage() {
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/admin/users/${selectedUser.user_ID}`,
         {
+          credentials: 'include',
           method: 'PUT',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify(payload),
@@ -142,7 +143,7 @@ export default function AdminPage() {
     try {
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/admin/users/${selectedUser.user_ID}/deactivate`,
-        { method: 'PUT' }
+        { credentials: 'include', method: 'PUT' }
       );
       if (!response.ok) throw new Error('Failed to deactivate user');
 
@@ -163,7 +164,7 @@ export default function AdminPage() {
     try {
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/admin/users/${selectedUser.user_ID}/reactivate`,
-        { method: 'PUT' }
+        { credentials: 'include', method: 'PUT' }
       );
       if (!response.ok) throw new Error('Failed to reactivate user');
 
@@ -184,7 +185,7 @@ export default function AdminPage() {
     try {
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/admin/users/${selectedUser.user_ID}/reset-password`,
-        { method: 'PUT' }
+        { credentials: 'include', method: 'PUT' }
       );
       if (!response.ok) throw new Error('Failed to reset password');
       const data = await response.json();
@@ -29,7 +29,7 @@ export default function BrowseVehicles() {
         const userId = sessionStorage.getItem('userId');
         if (!userId) return;
         try {
-            const response = await fetch(`http://localhost:8000/user/${userId}/other-ads`);
+            const response = await fetch(`http://localhost:8000/user/${userId}/other-ads`, {credentials: 'include'});
             if (response.ok) {
                 const data = await response.json();
                 setVehicles(data.ads || []);
@@ -88,7 +88,7 @@ export default function BrowseVehicles() {
 
         try {
             // Check if the ad is already in the wishlist
-            const response = await fetch(url);
+            const response = await fetch(url, {credentials: 'include'});
             const data = await response.json();
 
             if (response.ok) {
@@ -122,13 +122,14 @@ export default function BrowseVehicles() {
 
         try {
             // First, check if the ad is already in the wishlist
-            const checkResponse = await fetch(url);
+            const checkResponse = await fetch(url, {credentials: 'include'});
             const data = await checkResponse.json();
 
             if (checkResponse.ok) {
                 if (data.isBookmarked) {
                     // If it's already bookmarked, perform the delete operation
                     const deleteResponse = await fetch(url, {
+                        credentials: 'include',
                         method: 'DELETE',
                         headers: {
                             'Content-Type': 'application/json',
@@ -143,6 +144,7 @@ export default function BrowseVehicles() {
                 } else {
                     // If it's not bookmarked, perform the add operation
                     const postResponse = await fetch(url, {
+                        credentials: 'include',
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
@@ -177,7 +179,7 @@ export default function BrowseVehicles() {
 
         try {
             // Check if the user has already made an offer
-            const checkResponse = await fetch(`http://localhost:8000/check_offer/${userId}/${adId}`);
+            const checkResponse = await fetch(`http://localhost:8000/check_offer/${userId}/${adId}`, {credentials: 'include'});
 
             if (checkResponse.ok) {
                 const offerData = await checkResponse.json();
@@ -188,7 +190,7 @@ export default function BrowseVehicles() {
             // If no offer exists, proceed to create a new offer
             const createResponse = await fetch(
                 `http://localhost:8000/create_offer/${userId}/${adId}/${offerPrice}`,
-                {method: "POST"}
+                {credentials: 'include', method: "POST"}
             );
 
             if (createResponse.ok) {
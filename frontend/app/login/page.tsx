@@ -32,6 +32,7 @@ export default function Login() {
 
     try {
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/login`, {
+        credentials: 'include',
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
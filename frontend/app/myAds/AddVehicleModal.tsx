@@ -90,6 +90,7 @@ const AddVehicleModal: React.FC<AddVehicleModalProps> = ({isOpen, onClose, onSub
 
         try {
             const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/add_vehicle/`, {
+                credentials: 'include',
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
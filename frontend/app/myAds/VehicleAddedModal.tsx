@@ -17,7 +17,7 @@ const VehicleAddedModal: React.FC<VehicleAddedModalProps> = ({ isOpen, onClose,
     // Fetch the user's balance from the backend
     const fetchBalance = async () => {
         try {
-            const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/${userId}/balance`);
+            const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/${userId}/balance`, {credentials: 'include'});
             if (!response.ok) {
                 throw new Error('Failed to fetch balance');
             }
@@ -34,6 +34,7 @@ const VehicleAddedModal: React.FC<VehicleAddedModalProps> = ({ isOpen, onClose,
     const deductBalanceForPremium = async () => {
         try {
             const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/${userId}/deduct_balance_for_premium`, {
+                credentials: 'include',
                 method: 'PUT',
             });
             if (!response.ok) {
@@ -55,6 +56,7 @@ const VehicleAddedModal: React.FC<VehicleAddedModalProps> = ({ isOpen, onClose,
     const createAd = async () => {
         try {
             const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/add_ad/`, {
+                credentials: 'include',
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
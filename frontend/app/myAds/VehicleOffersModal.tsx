@@ -67,6 +67,7 @@ const VehicleOffersModal: React.FC<VehicleOffersModalProps> = ({
 
         try {
             const response = await fetch(`http://localhost:8000/counter_offer/${offerId}/${price}`, {
+                credentials: 'include',
                 method: 'PUT',
             });
 
@@ -90,6 +91,7 @@ const VehicleOffersModal: React.FC<VehicleOffersModalProps> = ({
     const handleAcceptOffer = async (offerId: number) => {
         try {
             const response = await fetch(`http://localhost:8000/accept_offer/${offerId}`, {
+                credentials: 'include',
                 method: 'PUT',
             });
             const data = await response.json();
@@ -108,6 +110,7 @@ const VehicleOffersModal: React.FC<VehicleOffersModalProps> = ({
     const handleRejectOffer = async (offerId: number) => {
         try {
             const response = await fetch(`http://localhost:8000/reject_offer/${offerId}`, {
+                credentials: 'include',
                 method: 'PUT',
             });
             const data = await response.json();
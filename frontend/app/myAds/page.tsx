@@ -28,7 +28,7 @@ export default function SellerDashboard() {
         if (userId) {
             const fetchVehicles = async () => {
                 try {
-                    const response = await fetch(`http://localhost:8000/user/${userId}/vehicles`);
+                    const response = await fetch(`http://localhost:8000/user/${userId}/vehicles`, {credentials: 'include'});
                     const data = await response.json();
                     if (response.ok && data.vehicles) {
                         setVehicles(data.vehicles);
@@ -71,7 +71,7 @@ export default function SellerDashboard() {
 
     const fetchVehicleOffers = async (adId: number) => {
         try {
-            const response = await fetch(`http://localhost:8000/ad/${adId}/offers`);
+            const response = await fetch(`http://localhost:8000/ad/${adId}/offers`, {credentials: 'include'});
             const data = await response.json();
             if (response.ok && data.offers) {
                 setVehicleOffers(data.offers);
@@ -97,6 +97,7 @@ export default function SellerDashboard() {
 
         try {
             const response = await fetch(`http://localhost:8000/delete_ad/${adId}`, {
+                credentials: 'include',
                 method: 'DELETE',
             });
 
@@ -26,7 +26,7 @@ export default function MyOffersPage() {
         if (userId) {
             const fetchOffers = async () => {
                 try {
-                    const response = await fetch(`http://localhost:8000/user/${userId}/offers`);
+                    const response = await fetch(`http://localhost:8000/user/${userId}/offers`, {credentials: 'include'});
                     const data = await response.json();
 
                     if (data.message === 'Offers fetched successfully') {
@@ -50,7 +50,7 @@ export default function MyOffersPage() {
                     const status: { [key: number]: boolean } = {};
 
                     for (const offer of offers) {
-                        const response = await fetch(`http://localhost:8000/check_existing_transaction/${offer.ad_ID}`);
+                        const response = await fetch(`http://localhost:8000/check_existing_transaction/${offer.ad_ID}`, {credentials: 'include'});
                         const data = await response.json();
                         status[offer.offer_ID] = data.transaction_exists;
                     }
@@ -71,7 +71,7 @@ export default function MyOffersPage() {
         if (userId && isPaymentModalOpen && selectedOffer) {
             const fetchBalance = async () => {
                 try {
-                    const response = await fetch(`http://localhost:8000/user/${userId}/balance`);
+                    const response = await fetch(`http://localhost:8000/user/${userId}/balance`, {credentials: 'include'});
                     const data = await response.json();
                     setUserBalance(data.balance);
                 } catch (error) {
@@ -86,6 +86,7 @@ export default function MyOffersPage() {
     const handleCancelOffer = async (offerId: number) => {
         try {
             const response = await fetch(`http://localhost:8000/delete_offer/${offerId}`, {
+                credentials: 'include',
                 method: 'DELETE',
             });
             const data = await response.json();
@@ -138,6 +139,7 @@ export default function MyOffersPage() {
 
         try {
             const transactionResponse = await fetch(transactionUrl.toString(), {
+                credentials: 'include',
                 method: 'POST',
                 headers: {
                     'accept': 'application/json',
@@ -149,6 +151,7 @@ export default function MyOffersPage() {
                 const balanceUpdate = {amount: -paymentPrice};
 
                 const balanceResponse = await fetch(`http://localhost:8000/user/${userId}/balance`, {
+                    credentials: 'include',
                     method: 'PUT',
                     headers: {
                         'Content-Type': 'application/json',
@@ -160,6 +163,7 @@ export default function MyOffersPage() {
                 const balanceData = await balanceResponse.json();
                 if (balanceData.message === 'Balance updated successfully') {
                     const ownerResponse = await fetch(`http://localhost:8000/ad/${selectedOffer.ad_ID}/owner`, {
+                        credentials: 'include',
                         method: 'GET',
                         headers: {
                             'accept': 'application/json',
@@ -171,6 +175,7 @@ export default function MyOffersPage() {
                         const ownerBalanceUpdate = {amount: paymentPrice};
 
                         const ownerBalanceResponse = await fetch(`http://localhost:8000/user/${ownerData.owner_id}/balance`, {
+                            credentials: 'include',
                             method: 'PUT',
                             headers: {
                                 'Content-Type': 'application/json',
@@ -183,6 +188,7 @@ export default function MyOffersPage() {
                         if (ownerBalanceData.message === 'Balance updated successfully') {
                             // Mark the ad as sold
                             const markSoldResponse = await fetch(`http://localhost:8000/ad/${selectedOffer.ad_ID}/mark-sold`, {
+                                credentials: 'include',
                                 method: 'PUT',
                                 headers: {
                                     'accept': 'application/json',
@@ -218,6 +224,7 @@ export default function MyOffersPage() {
     const handleAcceptCounterOffer = async (offerId: number) => {
         try {
             const response = await fetch(`http://localhost:8000/accept_offer/${offerId}`, {
+                credentials: 'include',
                 method: 'PUT',
             });
             const data = await response.json();
@@ -235,6 +242,7 @@ export default function MyOffersPage() {
     const handleRejectCounterOffer = async (offerId: number) => {
         try {
             const response = await fetch(`http://localhost:8000/reject_offer/${offerId}`, {
+                credentials: 'include',
                 method: 'PUT',
             });
             const data = await response.json();
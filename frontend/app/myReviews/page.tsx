@@ -23,7 +23,7 @@ export default function MyReviewsPage() {
 
         const fetchReviews = async () => {
             try {
-                const response = await fetch(`http://localhost:8000/user_reviews/${userId}`);
+                const response = await fetch(`http://localhost:8000/user_reviews/${userId}`, {credentials: "include"});
                 const data = await response.json();
 
                 if (data.sent_reviews && data.received_reviews) {
@@ -28,14 +28,26 @@ export default function MyTransactionsPage() {
 
         const fetchTransactions = async () => {
             try {
-                const response = await fetch(`http://localhost:8000/user_transactions/${userId}`);
-                const data = await response.json();
-
-                if (data.transactions) {
-                    setTransactions(data.transactions);
-                } else {
-                    console.error('No transactions found or invalid response structure');
-                }
+                // The endpoint is paged: follow next_cursor until every transaction is loaded
+                const allTransactions: typeof transactions = [];
+                let cursor: number | null = null;
+                do {
+                    const url = new URL(`http://localhost:8000/user_transactions/${userId}`);
+                    if (cursor !== null) {
+                        url.searchParams.append('before', String(cursor));
+                    }
+                    const response = await fetch(url.toString(), {credentials: 'include'});
+                    const data = await response.json();
+
+                    if (!data.transactions) {
+                        console.error('No transactions found or invalid response structure');
+                        break;
+                    }
+                    allTransactions.push(...data.transactions);
+                    cursor = data.next_cursor ?? null;
+                } while (cursor !== null);
+
+                setTransactions(allTransactions);
             } catch (error) {
                 console.error('Error fetching transactions:', error);
             }
@@ -63,6 +75,7 @@ export default function MyTransactionsPage() {
 
         try {
             const response = await fetch('http://localhost:8000/create_review/', {
+                credentials: 'include',
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
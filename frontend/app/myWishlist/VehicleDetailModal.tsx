@@ -67,7 +67,8 @@ const VehicleDetailModal: React.FC<Props> = ({
 
                 try {
                     const response = await fetch(
-                        `http://localhost:8000/check_offer/${userId}/${selectedVehicle.ad_ID}`
+                        `http://localhost:8000/check_offer/${userId}/${selectedVehicle.ad_ID}`,
+                        {credentials: "include"}
                     );
                     if (response.ok) {
                         const data = await response.json();
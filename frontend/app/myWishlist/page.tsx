@@ -20,7 +20,7 @@ export default function Wishlist() {
         if (userId) {
             const fetchWishlist = async () => {
                 try {
-                    const response = await fetch(`http://localhost:8000/user/${userId}/wishlist`);
+                    const response = await fetch(`http://localhost:8000/user/${userId}/wishlist`, {credentials: 'include'});
                     const data = await response.json();
                     if (response.ok && data.wishlist) {
                         setWishlist(data.wishlist);
@@ -51,7 +51,7 @@ export default function Wishlist() {
         const url = `http://localhost:8000/user/${userId}/wishlist/${bookmarkedAd}`;
 
         try {
-            const response = await fetch(url);
+            const response = await fetch(url, {credentials: 'include'});
             const data = await response.json();
 
             if (response.ok) {
@@ -86,7 +86,7 @@ export default function Wishlist() {
 
         try {
             // Check if the user has already made an offer
-            const checkResponse = await fetch(`http://localhost:8000/check_offer/${userId}/${adId}`);
+            const checkResponse = await fetch(`http://localhost:8000/check_offer/${userId}/${adId}`, {credentials: 'include'});
 
             if (checkResponse.ok) {
                 const offerData = await checkResponse.json();
@@ -97,7 +97,7 @@ export default function Wishlist() {
             // If no offer exists, proceed to create a new offer
             const createResponse = await fetch(
                 `http://localhost:8000/create_offer/${userId}/${adId}/${offerPrice}`,
-                {method: "POST"}
+                {credentials: 'include', method: "POST"}
             );
 
             const createData = await createResponse.json(); // Parse the response
@@ -125,13 +125,14 @@ export default function Wishlist() {
 
         try {
             // First, check if the ad is already in the wishlist
-            const checkResponse = await fetch(url);
+            const checkResponse = await fetch(url, {credentials: 'include'});
             const data = await checkResponse.json();
 
             if (checkResponse.ok) {
                 if (data.isBookmarked) {
                     // If it's already bookmarked, perform the delete operation
                     const deleteResponse = await fetch(url, {
+                        credentials: 'include',
                         method: 'DELETE',
                         headers: {
                             'Content-Type': 'application/json',
@@ -148,6 +149,7 @@ export default function Wishlist() {
                 } else {
                     // If it's not bookmarked, perform the add operation
                     const postResponse = await fetch(url, {
+                        credentials: 'include',
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
@@ -182,6 +184,7 @@ export default function Wishlist() {
 
         try {
             const response = await fetch(`http://localhost:8000/user/${userId}/wishlist/${bookmarkedAd}`, {
+                credentials: 'include',
                 method: 'DELETE',
             });
 
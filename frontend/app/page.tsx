@@ -11,7 +11,7 @@ export default function Home() {
   useEffect(() => {
     const fetchPremiumVehicles = async () => {
       try {
-        const response = await fetch('http://localhost:8000/premium-vehicles');
+        const response = await fetch('http://localhost:8000/premium-vehicles', {credentials: "include"});
         const data = await response.json();
 
         if (data.vehicles) {
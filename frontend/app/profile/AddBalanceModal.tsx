@@ -33,6 +33,7 @@ const AddBalanceModal: React.FC<AddBalanceModalProps> = ({isOpen, closeModal, us
 
         try {
             const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/${userId}/balance`, {
+                credentials: 'include',
                 method: 'PUT',
                 headers: {
                     'Content-Type': 'application/json',
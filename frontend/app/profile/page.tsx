@@ -48,7 +48,7 @@ export default function ProfilePage() {
 
         const fetchProfileData = async () => {
             try {
-                const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/profile/${userId}`);
+                const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/profile/${userId}`, {credentials: 'include'});
                 if (!response.ok) return;
 
                 const data = await response.json();
@@ -115,6 +115,7 @@ export default function ProfilePage() {
             }
 
             const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/user/profile/${userId}`, {
+                credentials: 'include',
                 method: 'PUT',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify(profileDataToUpdate),
@@ -29,6 +29,7 @@ export default function Register() {
 
     try {
       const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/register`, {
+        credentials: 'include',
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',